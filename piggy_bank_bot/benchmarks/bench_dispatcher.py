@@ -0,0 +1,333 @@
+# benchmarks/bench_dispatcher.py
+"""
+Нагрузочный бенчмарк диспетчера.
+
+Собирает настоящий Dispatcher (core.bot.create_dispatcher со всеми модулями),
+подменяет сессию бота заглушкой, а TON API — фейковым бэкендом; данные
+хранятся в памяти (STORAGE_BACKEND=memory, без дискового шума), и прогоняет
+через feed_update потоки сгенерированных обновлений: /learn, просмотр уроков,
+прохождение тестов и /balance.
+
+Отчёт: пропускная способность, p50/p99 задержки по обработчикам,
+пиковая память (tracemalloc, отдельным проходом). Результат сравнивается с baseline.json.
+    
+    python benchmarks/bench_dispatcher.py                  # сравнить с baseline
+    python benchmarks/bench_dispatcher.py --save-baseline  # записать новый baseline
+
+Код выхода 1 — регрессия больше допуска (--tolerance).
+Лимиты исходящих запросов (core.outbound) не подключаются: они ограничивают
+Telegram, а не обработку обновлений.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import count
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Конфигурация читается при импорте shared.config — задаём до импорта бота
+for name, value in {
+    "BOT_TOKEN": "123456:benchmark",
+    "SUPABASE_URL": "https://benchmark.supabase.co",
+    "SUPABASE_KEY": "benchmark-key",
+    "TON_API_KEY": "benchmark",
+    "PRELOAD_MODULES": "all",
+    "STORAGE_BACKEND": "memory",
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, str(BOT_DIR))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message, Update
+
+# Сценарии в порядке прогона (шаги — см. user_stream)
+SCENARIOS = ("learn", "lesson", "quiz", "balance")
+
+
+class FakeSession(BaseSession):
+    """Сессия без сети: запросы считаются, сообщения «отправляются» мгновенно"""
+    
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+        self._message_ids = count(1000)
+    
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=getattr(method, "message_id", None) or next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+    
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+    
+    async def close(self):
+        pass
+
+
+def install_fake_backend(ton_latency: float):
+    """Фейковый TON API"""
+    from modules.ton_wallet.ton_service import TONService
+    
+    async def fake_aenter(self):
+        return self
+    
+    async def fake_aexit(self, exc_type, exc_val, exc_tb):
+        return None
+    
+    async def fake_ton_balance(self, address: str) -> Decimal:
+        await asyncio.sleep(ton_latency)
+        return Decimal(1_500_000_000)
+    
+    async def fake_spw_balance(self, address: str) -> Decimal:
+        await asyncio.sleep(ton_latency)
+        return Decimal(250_000_000_000)
+    
+    TONService.__aenter__ = fake_aenter
+    TONService.__aexit__ = fake_aexit
+    TONService.get_ton_balance = fake_ton_balance
+    TONService.get_spw_balance = fake_spw_balance
+
+
+async def seed_wallets(user_ids, wallets_per_user: int):
+    """Кошельки пользователей в хранилище (в памяти)"""
+    from shared.db_manager import db_manager
+    
+    wallets = db_manager.get_storage().wallets
+    for telegram_id in user_ids:
+        for i in range(wallets_per_user):
+            await wallets.add_wallet(telegram_id, f"UQ{telegram_id:038d}{i:08d}", f"W{i}")
+
+
+class UpdateFactory:
+    """Генератор обновлений от пользователя"""
+    
+    def __init__(self):
+        self._ids = count(1)
+    
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    
+    def message(self, user_id: int, text: str) -> Update:
+        update_id = next(self._ids)
+        return Update.model_validate({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": 0, "text": text,
+                "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+            },
+        })
+    
+    def callback(self, user_id: int, data: str, message_id: int) -> Update:
+        update_id = next(self._ids)
+        return Update.model_validate({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "chat_instance": str(user_id), "data": data,
+                "from": self._user(user_id),
+                "message": {
+                    "message_id": message_id, "date": 0, "text": "...",
+                    "chat": {"id": user_id, "type": "private"},
+                },
+            },
+        })
+
+
+def user_stream(factory: UpdateFactory, scenario: str, user_id: int, rounds: int) -> List[Tuple[str, Update]]:
+    """Последовательность (обработчик, обновление) одного пользователя"""
+    from modules.lessons.lessons_module import LESSONS, QUIZZES
+    
+    stream = []
+    for round_index in range(rounds):
+        lesson_id = LESSONS[(user_id + round_index) % len(LESSONS)]["id"]
+        # Разные сообщения у шагов — повторные нажатия не должны отсекаться
+        message_id = 10_000 + round_index
+        if scenario == "learn":
+            stream.append(("cmd_learn", factory.message(user_id, "/learn")))
+        elif scenario == "lesson":
+            stream.append(("show_lesson", factory.callback(user_id, f"show_lesson_{lesson_id}", message_id)))
+        elif scenario == "quiz":
+            stream.append(("start_quiz", factory.callback(user_id, f"start_quiz_{lesson_id}", message_id)))
+            questions = QUIZZES[lesson_id]
+            for index, question in enumerate(questions):
+                stream.append((
+                    "handle_quiz_answer",
+                    factory.callback(user_id, f"quiz_answer_{lesson_id}_{index}_{question['correct']}", message_id)
+                ))
+                if index + 1 < len(questions):
+                    stream.append((
+                        "next_question",
+                        factory.callback(user_id, f"next_question_{lesson_id}_{index + 1}", message_id)
+                    ))
+        elif scenario == "balance":
+            stream.append(("cmd_balance", factory.message(user_id, "/balance")))
+    return stream
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_benchmark(users: int, rounds: int, ton_latency: float, wallets_per_user: int) -> Dict[str, Any]:
+    from core.bot import create_dispatcher
+    
+    install_fake_backend(ton_latency)
+    # Пользователи проходов замера времени и памяти не пересекаются
+    timed_users, traced_users = 1_000_000, 2_000_000
+    for first_user_id in (timed_users, traced_users):
+        await seed_wallets(range(first_user_id, first_user_id + users), wallets_per_user)
+    session = FakeSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = create_dispatcher(storage=MemoryStorage(), preload=True)
+    from modules.ton_wallet.balance_service import balance_service
+    # Логи каждого обновления исказили бы замер
+    logging.getLogger().setLevel(logging.WARNING)
+    factory = UpdateFactory()
+    
+    latencies: Dict[str, List[float]] = {}
+    scenario_results: Dict[str, Any] = {}
+    
+    async def play(stream: List[Tuple[str, Update]], record: bool):
+        # Пользователь ждёт ответа перед следующим нажатием
+        for handler_name, update in stream:
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            if record:
+                latencies.setdefault(handler_name, []).append(time.perf_counter() - started)
+    
+    async def run_scenarios(first_user_id: int, record: bool) -> Tuple[int, float]:
+        total_updates = 0
+        total_started = time.perf_counter()
+        for scenario in SCENARIOS:
+            streams = [user_stream(factory, scenario, first_user_id + user_id, rounds) for user_id in range(users)]
+            updates = sum(len(stream) for stream in streams)
+            started = time.perf_counter()
+            await asyncio.gather(*(play(stream, record) for stream in streams))
+            # Фоновые обновления /balance (запрос к TON API и правка ответа) — часть сценария
+            await balance_service.wait_idle()
+            if record:
+                scenario_results[scenario] = {
+                    "updates": updates,
+                    "updates_per_sec": round(updates / (time.perf_counter() - started), 1),
+                }
+            total_updates += updates
+        return total_updates, time.perf_counter() - total_started
+    
+    # Замер времени и замер памяти — отдельными проходами: tracemalloc сильно замедляет код
+    total_updates, total_elapsed = await run_scenarios(timed_users, record=True)
+    requests = session.requests
+    tracemalloc.start()
+    await run_scenarios(traced_users, record=False)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    await dp.storage.close()
+    await bot.session.close()
+    
+    return {
+        "params": {"users": users, "rounds": rounds, "ton_latency": ton_latency, "wallets_per_user": wallets_per_user},
+        "updates": total_updates,
+        "updates_per_sec": round(total_updates / total_elapsed, 1),
+        "telegram_requests": requests,
+        "peak_memory_kb": round(peak_memory / 1024),
+        "scenarios": scenario_results,
+        "handlers": {
+            name: {
+                "count": len(samples),
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+            }
+            for name, samples in latencies.items()
+        },
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack_ms: float) -> List[str]:
+    """Регрессии относительно baseline (пустой список — всё в порядке)"""
+    problems = []
+    if result["params"] != baseline.get("params"):
+        print(f"⚠️ Параметры отличаются от baseline ({baseline.get('params')}), сравнение условное")
+    
+    if result["updates_per_sec"] < baseline["updates_per_sec"] * (1 - tolerance):
+        problems.append(f"throughput {result['updates_per_sec']} < {baseline['updates_per_sec']} upd/s")
+    for name, stats in result["handlers"].items():
+        base = baseline.get("handlers", {}).get(name)
+        # У быстрых обработчиков p99 — единицы миллисекунд, шум сравним с ним самим
+        if base and stats["p99_ms"] > max(base["p99_ms"] * (1 + tolerance), base["p99_ms"] + slack_ms):
+            problems.append(f"{name}: p99 {stats['p99_ms']} > {base['p99_ms']} ms")
+    if result["peak_memory_kb"] > baseline["peak_memory_kb"] * (1 + tolerance):
+        problems.append(f"peak memory {result['peak_memory_kb']} > {baseline['peak_memory_kb']} KB")
+    return problems
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n📊 Обновлений: {result['updates']}, {result['updates_per_sec']} upd/s, "
+          f"запросов к Telegram: {result['telegram_requests']}, пик памяти: {result['peak_memory_kb']} KB")
+    for scenario, stats in result["scenarios"].items():
+        print(f"   {scenario:<8} {stats['updates']:>6} upd  {stats['updates_per_sec']:>9} upd/s")
+    print(f"\n   {'handler':<20} {'count':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, stats in result["handlers"].items():
+        print(f"   {name:<20} {stats['count']:>6} {stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк диспетчера")
+    parser.add_argument("--users", type=int, default=200, help="Одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="Повторов сценария на пользователя")
+    parser.add_argument("--ton-latency", type=float, default=0.005, help="Задержка фейкового TON API, сек")
+    parser.add_argument("--wallets", type=int, default=2, help="Кошельков у пользователя")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимое ухудшение (доля)")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Допустимый рост p99 в мс сверх доли")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результат как baseline")
+    args = parser.parse_args()
+    
+    # Базы данных модулей создаются в рабочей директории — берём временную
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        result = asyncio.run(run_benchmark(args.users, args.rounds, args.ton_latency, args.wallets))
+    print_report(result)
+    
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\n💾 Baseline сохранён: {args.baseline}")
+        return 0
+    
+    if not args.baseline.exists():
+        print("\nℹ️ Baseline нет — запустите с --save-baseline")
+        return 0
+    
+    problems = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance, args.slack_ms)
+    if problems:
+        print("\n❌ Регрессия:")
+        for problem in problems:
+            print(f"   {problem}")
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
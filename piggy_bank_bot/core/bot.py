@@ -1,43 +1,167 @@
 import asyncio
 import logging
+from typing import Optional
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from shared.config import config
-from core.module_manager import load_all_modules, get_all_routers
+from core.module_manager import load_all_modules, get_all_routers, get_used_update_types
+from core.fsm_storage import SQLiteStorage
+from core.scheduler import UpdateScheduler
+from core.metrics import metrics, setup_metrics_routes, start_metrics_server
+from core.dispatch_index import setup_dispatch_index
+from core.outbound import OutboundLimiter
+from core.callback_dedup import CallbackDedupMiddleware, setup_callback_dedup
+from core.logging_setup import setup_logging
+from shared.db_manager import db_manager
+from shared.storage.rollups import HistoryMaintenance
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def run_bot():
-    """Запуск бота с загрузкой модулей"""
-    # Проверка конфигурации
-    config.validate()
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Получение обновлений через long polling"""
+    # Если раньше был установлен webhook, Telegram не отдаст getUpdates
+    await bot.delete_webhook(drop_pending_updates=False)
     
-    # Инициализация бота
-    bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    metrics_runner = None
+    if config.METRICS_PORT:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT, config.METRICS_PATH)
+    
+    logger.info("🚀 Бот запущен (polling)! Нажмите Ctrl+C для остановки.")
+    try:
+        await dp.start_polling(bot, handle_as_tasks=True, allowed_updates=get_used_update_types(dp))
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Получение обновлений через webhook (aiohttp сервер)"""
+    app = web.Application()
+    
+    # Отвечаем Telegram 200 сразу, обработчики работают в фоне
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET or None,
+        handle_in_background=True
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    setup_metrics_routes(app, config.METRICS_PATH)
+    
+    # Webhook ставится идемпотентно — каждая реплика может вызывать это при старте
+    webhook_url = f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}"
+    await bot.set_webhook(
+        webhook_url,
+        secret_token=config.WEBHOOK_SECRET or None,
+        allowed_updates=get_used_update_types(dp)
+    )
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+    logger.info("🚀 Бот запущен (webhook %s), слушаю %s:%s", webhook_url, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    
+    try:
+        # Сервер работает до отмены задачи (Ctrl+C / SIGTERM)
+        await asyncio.Event().wait()
+    finally:
+        # Webhook не удаляем: остальные реплики продолжают принимать обновления
+        await runner.cleanup()
+
+def create_bot(session: Optional[BaseSession] = None) -> Bot:
+    """Бот с лимитами исходящих запросов (session — для тестов и бенчмарков)"""
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    # Все исходящие запросы проходят через лимиты Telegram
+    outbound = OutboundLimiter(
+        global_rate=config.OUTBOUND_GLOBAL_RATE,
+        chat_rate=config.OUTBOUND_CHAT_RATE,
+        group_rate=config.OUTBOUND_GROUP_RATE,
+        content_ttl=config.OUTBOUND_CONTENT_TTL
+    )
+    bot.session.middleware(outbound)
+    metrics.register_gauge("bot_outbound_waiting", "Outgoing requests waiting for the global rate limit", lambda: outbound.waiting)
+    metrics.register_counter("bot_outbound_coalesced_total", "Message edits merged into a later edit", lambda: outbound.coalesced)
+    metrics.register_counter("bot_outbound_skipped_total", "Message edits skipped because nothing changed", lambda: outbound.skipped)
+    return bot
+
+def create_dispatcher(storage: Optional[BaseStorage] = None, preload=None) -> Dispatcher:
+    """Диспетчер со всеми middleware и роутерами модулей"""
+    if storage is None:
+        storage = SQLiteStorage(
+            db_path=config.FSM_DB_PATH,
+            cache_size=config.FSM_CACHE_SIZE,
+            flush_interval=config.FSM_FLUSH_INTERVAL,
+            ttl=config.FSM_STATE_TTL
+        )
+    # Обновления выполняются задачами: параллельно между чатами, по порядку внутри чата
+    scheduler = UpdateScheduler(max_concurrency=config.MAX_CONCURRENT_UPDATES)
+    dp = Dispatcher(storage=storage, events_isolation=scheduler)
+    # Повторные нажатия той же кнопки отсекаются до поиска маршрута
+    callback_dedup = CallbackDedupMiddleware(window=config.CALLBACK_DEDUP_WINDOW)
+    setup_callback_dedup(dp, callback_dedup)
+    # Маршрут (модуль и обработчик) ищется по индексу один раз на обновление
+    setup_dispatch_index(dp)
+    metrics.register_gauge("bot_updates_active", "Updates being handled right now", lambda: scheduler.active)
+    metrics.register_gauge("bot_updates_waiting", "Updates queued behind their chat or the concurrency cap", lambda: scheduler.waiting)
+    metrics.register_counter("bot_callback_duplicates_total", "Repeated button taps dropped before handlers", lambda: callback_dedup.dropped)
     
     # Загрузка всех модулей
-    print("🔄 Загрузка модулей...")
-    load_all_modules()
+    logger.info("🔄 Загрузка модулей...")
+    load_all_modules(preload=config.preload_modules() if preload is None else preload)
     
     # Регистрация роутеров из модулей
     routers = get_all_routers()
     for router in routers:
         dp.include_router(router)
     
-    print(f"✅ Загружено модулей: {len(routers)}")
-    print("🚀 Бот запущен! Нажмите Ctrl+C для остановки.")
+    logger.info("✅ Загружено модулей: %d", len(routers))
+    
+    # Агрегаты истории балансов и удаление старых сырых записей — в фоне
+    if config.HISTORY_ROLLUP_INTERVAL > 0:
+        maintenance = HistoryMaintenance(
+            db_manager.get_storage,
+            interval=config.HISTORY_ROLLUP_INTERVAL,
+            retention_days=config.HISTORY_RAW_RETENTION_DAYS
+        )
+        dp.startup.register(maintenance.start)
+        dp.shutdown.register(maintenance.stop)
+    # Пул потоков запросов к Supabase — после остановки фоновых задач
+    dp.shutdown.register(db_manager.close)
+    return dp
+
+async def run_bot():
+    """Запуск бота с загрузкой модулей"""
+    # Проверка конфигурации
+    config.validate()
+    
+    # Инициализация бота
+    bot = create_bot()
+    dp = create_dispatcher()
     
     try:
-        await dp.start_polling(bot)
+        if config.use_webhook():
+            await run_webhook(bot, dp)
+        else:
+            if config.BOT_MODE == "webhook":
+                logger.warning("⚠️ BOT_MODE=webhook, но WEBHOOK_BASE_URL не задан — используется polling")
+            await run_polling(bot, dp)
     except KeyboardInterrupt:
-        print("👋 Бот остановлен")
+        logger.info("👋 Бот остановлен")
     finally:
         await bot.session.close()
 
 def start_bot():
     """Синхронный запуск бота"""
-    asyncio.run(run_bot())
\ No newline at end of file
+    # Логи пишет фоновый поток, event loop только кладёт записи в очередь
+    setup_logging(
+        level=config.LOG_LEVEL,
+        fmt=config.LOG_FORMAT,
+        module_levels=config.log_levels(),
+        rate_limit=config.LOG_RATE_LIMIT,
+        rate_limited_loggers=config.log_rate_limited()
+    )
+    asyncio.run(run_bot())
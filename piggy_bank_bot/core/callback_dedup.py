@@ -0,0 +1,97 @@
+# core/callback_dedup.py
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, Update
+
+logger = logging.getLogger(__name__)
+
+# Ключ нажатия: (пользователь, сообщение с кнопкой, callback_data)
+_TapKey = Tuple[int, Any, Optional[str]]
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """
+    Подавление двойных нажатий inline кнопок.
+    
+    Повторное нажатие той же кнопки тем же пользователем, пока первое ещё
+    обрабатывается или в течение window секунд после него, не доходит до
+    обработчиков: на callback сразу отвечаем пустым answer(), чтобы у
+    пользователя пропали «часики». Кеш нажатий ограничен max_size записями.
+    
+    Работает на уровне Update до FSMContextMiddleware (см. setup_callback_dedup):
+    иначе повтор ждал бы в очереди чата, пока первое нажатие обработается.
+    """
+    
+    def __init__(self, window: float = 1.0, max_size: int = 10000):
+        self.window = window
+        self.max_size = max_size
+        # Ключ → до какого момента (time.monotonic) нажатие считается повтором;
+        # порядок — по времени последнего изменения, поэтому просроченные в начале
+        self._taps: "OrderedDict[_TapKey, float]" = OrderedDict()
+        self.dropped = 0
+    
+    @staticmethod
+    def _make_key(event: CallbackQuery) -> _TapKey:
+        if event.message is not None:
+            message_key = (event.message.chat.id, event.message.message_id)
+        else:
+            message_key = event.inline_message_id
+        return (event.from_user.id, message_key, event.data)
+    
+    def _purge(self, now: float):
+        while self._taps:
+            key, expires = next(iter(self._taps.items()))
+            if expires > now and len(self._taps) <= self.max_size:
+                break
+            del self._taps[key]
+    
+    def _mark(self, key: _TapKey, expires: float):
+        self._taps[key] = expires
+        self._taps.move_to_end(key)
+    
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        query = event.callback_query
+        if query is None:
+            return await handler(event, data)
+        
+        key = self._make_key(query)
+        now = time.monotonic()
+        self._purge(now)
+        
+        if self._taps.get(key, 0) > now:
+            self.dropped += 1
+            try:
+                await data["bot"].answer_callback_query(query.id)
+            except TelegramAPIError as e:
+                logger.debug("Не удалось ответить на повторный callback: %s", e)
+            return None
+        
+        # Пока обработчик работает, повтор отбрасывается без ограничения по времени
+        self._mark(key, float("inf"))
+        try:
+            return await handler(event, data)
+        finally:
+            self._mark(key, time.monotonic() + self.window)
+
+
+def setup_callback_dedup(dp: Dispatcher, middleware: CallbackDedupMiddleware):
+    """
+    Подключить подавление повторов раньше FSMContextMiddleware:
+    он берёт блокировку чата (events_isolation), а повтор ждать её не должен
+    """
+    fsm_registered = dp.fsm in dp.update.outer_middleware
+    if fsm_registered:
+        dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(middleware)
+    if fsm_registered:
+        dp.update.outer_middleware(dp.fsm)
@@ -0,0 +1,243 @@
+# core/dispatch_index.py
+import itertools
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Router
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Типы параметров в шаблонах: "quiz_answer_{lesson_id:int}_{option:int}"
+_PARAM_TYPES = {
+    "int": (r"-?\d+", int),
+    "str": (r".+?", str),
+}
+_PARAM_RE = re.compile(r"\{(\w+)(?::(\w+))?\}")
+
+# Результат поиска: ключ маршрута → разобранные параметры
+Route = Dict[int, Dict[str, Any]]
+
+
+class _PrefixTrie:
+    """Префиксное дерево: по строке находит значения всех её префиксов"""
+    
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+    
+    def add(self, prefix: str, value: Any):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+    
+    def iter_matches(self, text: str) -> Iterator[Any]:
+        """Значения префиксов text, от самого длинного к самому короткому"""
+        found = []
+        node = self._root
+        if None in node:
+            found.append(node[None])
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        for values in reversed(found):
+            yield from values
+
+
+class _Pattern:
+    """Шаблон с параметрами, скомпилированный в регулярное выражение"""
+    __slots__ = ("key", "regex", "converters")
+    
+    def __init__(self, key: int, pattern: str):
+        self.key = key
+        self.converters: Dict[str, Callable[[str], Any]] = {}
+        regex = "^"
+        position = 0
+        for match in _PARAM_RE.finditer(pattern):
+            name, type_name = match.group(1), match.group(2) or "str"
+            if type_name not in _PARAM_TYPES:
+                raise ValueError(f"Неизвестный тип параметра {type_name!r} в шаблоне {pattern!r}")
+            part_regex, converter = _PARAM_TYPES[type_name]
+            regex += re.escape(pattern[position:match.start()]) + f"(?P<{name}>{part_regex})"
+            self.converters[name] = converter
+            position = match.end()
+        regex += re.escape(pattern[position:]) + "$"
+        self.regex = re.compile(regex, re.DOTALL)
+    
+    def parse(self, value: str) -> Optional[Dict[str, Any]]:
+        match = self.regex.match(value)
+        if match is None:
+            return None
+        return {name: self.converters[name](raw) for name, raw in match.groupdict().items()}
+
+
+class _RouteTable:
+    """Точные значения — словарь, шаблоны — префиксное дерево по статической части"""
+    
+    def __init__(self):
+        self.exact: Dict[str, List[int]] = {}
+        self.patterns = _PrefixTrie()
+    
+    def add(self, key: int, pattern: str):
+        static_prefix = _PARAM_RE.split(pattern, maxsplit=1)[0]
+        if static_prefix == pattern:
+            self.exact.setdefault(pattern, []).append(key)
+        else:
+            self.patterns.add(static_prefix, _Pattern(key, pattern))
+    
+    def resolve(self, value: str) -> Route:
+        route: Route = {key: {} for key in self.exact.get(value, ())}
+        for pattern in self.patterns.iter_matches(value):
+            if pattern.key not in route:
+                params = pattern.parse(value)
+                if params is not None:
+                    route[pattern.key] = params
+        return route
+
+
+class RouteFilter(Filter):
+    """
+    Фильтр обработчика по индексу: сравнивает свой ключ с уже найденным маршрутом.
+    
+    Поиск делается один раз на обновление (DispatchIndexMiddleware), так что
+    проверка фильтра — одно обращение к словарю. Параметры шаблона
+    передаются в обработчик именованными аргументами.
+    """
+    
+    def __init__(self, index: "DispatchIndex", key: int, patterns: Tuple[str, ...]):
+        self.index = index
+        self.key = key
+        self.patterns = patterns
+    
+    async def __call__(self, event: TelegramObject, dispatch_route: Optional[Route] = None):
+        if dispatch_route is None:
+            # Роутер используется без middleware — ищем сами
+            dispatch_route = self.index.resolve(event)
+        params = dispatch_route.get(self.key)
+        if params is None:
+            return False
+        return params or True
+    
+    def __str__(self) -> str:
+        return self._signature_to_string(*self.patterns)
+
+
+class DispatchIndex:
+    """
+    Индекс маршрутизации, который строится при регистрации обработчиков.
+    
+    - тексты сообщений: точное совпадение через словарь, шаблоны вида "🗑️ {name}"
+      через префиксное дерево;
+    - callback_data: то же самое, с типизированным разбором параметров
+      ("quiz_answer_{lesson_id:int}_{question_index:int}_{selected_option:int}");
+    - манифесты модулей: по команде, тексту, префиксу или группе FSM состояний
+      сразу находится модуль, остальные модули обновление не проверяют.
+    """
+    
+    def __init__(self):
+        self._keys = itertools.count(1)
+        self._texts = _RouteTable()
+        self._callbacks = _RouteTable()
+        
+        self._module_commands: Dict[str, FrozenSet[str]] = {}
+        self._module_texts: Dict[str, FrozenSet[str]] = {}
+        self._module_states: Dict[str, FrozenSet[str]] = {}
+        self._module_text_prefixes = _PrefixTrie()
+        self._module_callback_prefixes = _PrefixTrie()
+    
+    # ---------- Обработчики ----------
+    
+    def text(self, *patterns: str) -> RouteFilter:
+        """Фильтр по тексту сообщения (точному или шаблону)"""
+        key = next(self._keys)
+        for pattern in patterns:
+            self._texts.add(key, pattern)
+        return RouteFilter(self, key, patterns)
+    
+    def callback(self, *patterns: str) -> RouteFilter:
+        """Фильтр по callback_data (точной или шаблону)"""
+        key = next(self._keys)
+        for pattern in patterns:
+            self._callbacks.add(key, pattern)
+        return RouteFilter(self, key, patterns)
+    
+    def resolve(self, event: TelegramObject) -> Route:
+        """Найти все маршруты обработчиков, подходящие событию"""
+        if isinstance(event, Message):
+            return self._texts.resolve(event.text) if event.text else {}
+        if isinstance(event, CallbackQuery):
+            return self._callbacks.resolve(event.data) if event.data else {}
+        return {}
+    
+    # ---------- Модули ----------
+    
+    def add_module(self, package: str, routes: Dict[str, List[str]]):
+        """Зарегистрировать маршруты модуля из manifest.json"""
+        for command in routes.get("commands", []):
+            self._module_commands[command] = self._module_commands.get(command, frozenset()) | {package}
+        for text in routes.get("texts", []):
+            self._module_texts[text] = self._module_texts.get(text, frozenset()) | {package}
+        for state_group in routes.get("states", []):
+            self._module_states[state_group] = self._module_states.get(state_group, frozenset()) | {package}
+        for prefix in routes.get("text_prefixes", []):
+            self._module_text_prefixes.add(prefix, package)
+        for prefix in routes.get("callback_prefixes", []):
+            self._module_callback_prefixes.add(prefix, package)
+    
+    def modules_for(self, event: TelegramObject, raw_state: Optional[str] = None) -> Optional[FrozenSet[str]]:
+        """
+        Пакеты модулей, которым может быть адресовано событие.
+        None — тип события индексом не покрывается (проверяют все модули).
+        """
+        if isinstance(event, Message):
+            found = set()
+            if raw_state:
+                found |= self._module_states.get(raw_state.split(":", 1)[0], frozenset())
+            text = event.text or event.caption
+            if text:
+                if text.startswith("/") and len(text) > 1:
+                    command = text[1:].split(maxsplit=1)[0].split("@", 1)[0]
+                    found |= self._module_commands.get(command, frozenset())
+                found |= self._module_texts.get(text, frozenset())
+                found.update(self._module_text_prefixes.iter_matches(text))
+            return frozenset(found)
+        if isinstance(event, CallbackQuery):
+            if not event.data:
+                return frozenset()
+            return frozenset(self._module_callback_prefixes.iter_matches(event.data))
+        return None
+
+
+class DispatchIndexMiddleware(BaseMiddleware):
+    """Один поиск по индексу на обновление; результат кладётся в data"""
+    
+    def __init__(self, index: DispatchIndex):
+        self.index = index
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data["dispatch_route"] = self.index.resolve(event)
+        data["dispatch_modules"] = self.index.modules_for(event, data.get("raw_state"))
+        return await handler(event, data)
+
+
+def setup_dispatch_index(router: Router, index: Optional[DispatchIndex] = None):
+    """Подключить поиск по индексу к диспетчеру"""
+    middleware = DispatchIndexMiddleware(index or dispatch_index)
+    router.message.outer_middleware(middleware)
+    router.callback_query.outer_middleware(middleware)
+
+
+# Глобальный экземпляр
+dispatch_index = DispatchIndex()
+text_route = dispatch_index.text
+callback_route = dispatch_index.callback
@@ -0,0 +1,239 @@
+# core/fsm_storage.py
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+# Запись FSM: (состояние, данные, время последнего обращения)
+_Record = Tuple[Optional[str], Dict[str, Any], float]
+
+# Записи нет в памяти — её нужно читать из базы
+_MISS = object()
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM хранилище на SQLite с горячим LRU кешем в памяти.
+    
+    Чтение идёт из кеша, запись — в кеш и в очередь «грязных» ключей,
+    которая раз в flush_interval секунд сбрасывается в базу одной транзакцией.
+    Ключи, к которым не обращались дольше ttl секунд, считаются пустыми
+    и удаляются из базы при очередном сбросе. Чтение тоже продлевает запись:
+    если последнее обращение было больше ttl / 2 назад, новое время уходит
+    в базу со следующим сбросом.
+    """
+    
+    def __init__(self, db_path: str = "fsm_storage.db", cache_size: int = 10000,
+                 flush_interval: float = 0.5, ttl: float = 86400):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        # Ключи, ожидающие записи в базу (значение None — удалить запись)
+        self._dirty: Dict[str, Optional[_Record]] = {}
+        # Ключи пачки, которая сейчас пишется в базу: база для них ещё устаревшая
+        self._flushing: Dict[str, Optional[_Record]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge = time.time()
+        
+        # Соединение используется из потоков чтения (промахи кеша) и сброса
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)')
+        self._conn.commit()
+        logger.info(f"✅ FSM хранилище SQLite инициализировано: {db_path}")
+    
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        """Строковый ключ записи из StorageKey"""
+        return ":".join(str(part) for part in (
+            key.bot_id,
+            getattr(key, "business_connection_id", None) or "",
+            key.chat_id,
+            key.thread_id or "",
+            key.user_id,
+            key.destiny,
+        ))
+    
+    def _is_expired(self, record: _Record, now: float) -> bool:
+        return self.ttl > 0 and now - record[2] > self.ttl
+    
+    def _load_memory(self, key: str, now: float):
+        """Запись из памяти: кеш → очередь записи → пачка в записи; _MISS — читать базу"""
+        record = self._cache.get(key)
+        if record is not None:
+            if not self._is_expired(record, now):
+                self._cache.move_to_end(key)
+                return self._touch(key, record, now)
+            del self._cache[key]
+        
+        for pending in (self._dirty, self._flushing):
+            if key in pending:
+                record = pending[key]
+                if record is not None and not self._is_expired(record, now):
+                    self._remember(key, record)
+                    return self._touch(key, record, now)
+                return (None, {}, now)
+        
+        return _MISS
+    
+    async def _load(self, key: str) -> _Record:
+        """Прочитать запись: память → база (в потоке, не блокируя event loop)"""
+        record = self._load_memory(key, time.time())
+        if record is not _MISS:
+            return record
+        
+        row = await asyncio.to_thread(self._read, key)
+        
+        # Пока шло чтение, ключ могли записать — запись в памяти новее базы
+        now = time.time()
+        record = self._load_memory(key, now)
+        if record is not _MISS:
+            return record
+        
+        if row:
+            record = (row[0], json.loads(row[1]), row[2])
+            if not self._is_expired(record, now):
+                self._remember(key, record)
+                return self._touch(key, record, now)
+        
+        return (None, {}, now)
+    
+    def _read(self, key: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+                (key,)
+            ).fetchone()
+    
+    def _touch(self, key: str, record: _Record, now: float) -> _Record:
+        """Продлить запись, к которой обратились: в базу — не чаще раза в ttl / 2"""
+        if self.ttl <= 0 or now - record[2] <= self.ttl / 2:
+            return record
+        record = (record[0], record[1], now)
+        self._remember(key, record)
+        self._dirty[key] = record
+        self._schedule_flush()
+        return record
+    
+    def _remember(self, key: str, record: _Record):
+        """Положить запись в LRU кеш, вытесняя самые старые"""
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    def _store(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        """Записать в кеш и поставить в очередь на сброс в базу"""
+        if state is None and not data:
+            # Пустая запись — FSM завершён, освобождаем память и базу
+            self._cache.pop(key, None)
+            self._dirty[key] = None
+        else:
+            record = (state, data, time.time())
+            self._remember(key, record)
+            self._dirty[key] = record
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+        # Записи, пришедшие во время сброса, не запланировали свой:
+        # эта задача ещё выполнялась (см. _schedule_flush)
+        if self._dirty:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+    
+    async def flush(self):
+        """Сбросить накопленные изменения в базу одной транзакцией"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        self._flushing.update(batch)
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи FSM состояний: {e}")
+            # Возвращаем неудачный батч, не затирая более свежие изменения
+            for key, record in batch.items():
+                self._dirty.setdefault(key, record)
+            self._schedule_flush()
+        finally:
+            # Ключ мог попасть и в следующую пачку — её запись не трогаем
+            for key, record in batch.items():
+                if key in self._flushing and self._flushing[key] is record:
+                    del self._flushing[key]
+    
+    def _write_batch(self, batch: Dict[str, Optional[_Record]]):
+        upserts = [
+            (key, record[0], json.dumps(record[1], ensure_ascii=False), record[2])
+            for key, record in batch.items() if record is not None
+        ]
+        deletes = [(key,) for key, record in batch.items() if record is None]
+        
+        now = time.time()
+        purge = self.ttl > 0 and now - self._last_purge > min(self.ttl, 3600)
+        
+        with self._lock, self._conn:
+            if upserts:
+                self._conn.executemany(
+                    """INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(key) DO UPDATE SET
+                           state = excluded.state, data = excluded.data, updated_at = excluded.updated_at""",
+                    upserts
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+            if purge:
+                self._conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (now - self.ttl,))
+        
+        if purge:
+            self._last_purge = now
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._make_key(key)
+        _, data, _ = await self._load(storage_key)
+        self._store(storage_key, state.state if isinstance(state, State) else state, data)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._make_key(key)))[0]
+    
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self._make_key(key)
+        state, _, _ = await self._load(storage_key)
+        self._store(storage_key, state, dict(data))
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self._make_key(key)))[1].copy()
+    
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+        logger.info("FSM хранилище SQLite закрыто")
@@ -0,0 +1,168 @@
+# core/logging_setup.py
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable, Optional, Tuple
+
+# Атрибуты LogRecord; всё остальное пришло через extra= и попадает в JSON
+# (кроме rate_limit — это указание фильтру, а не поле записи)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "rate_limit"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение частоты одинаковых «болтливых» сообщений.
+    
+    Ограничиваются только записи, которые об этом попросили:
+    logger.debug(..., extra={"rate_limit": True}) или записи логгеров
+    из loggers (вместе с дочерними). Остальные проходят всегда,
+    как и предупреждения (WARNING и выше).
+    
+    Ключ — логгер и шаблон сообщения (до подстановки аргументов), поэтому
+    «Found %s jettons» от разных кошельков считается одним сообщением.
+    Не больше burst записей за period секунд; число отброшенных
+    добавляется к следующей пропущенной записи (поле suppressed).
+    """
+    
+    def __init__(self, burst: int = 20, period: float = 60.0, max_keys: int = 10000,
+                 loggers: Iterable[str] = ()):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.max_keys = max_keys
+        self.loggers = tuple(loggers)
+        # Ключ → (начало окна, записей в окне, отброшено)
+        self._windows: Dict[Tuple[str, str], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+    
+    def _limited(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "rate_limit", False):
+            return True
+        return any(record.name == name or record.name.startswith(name + ".") for name in self.loggers)
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.WARNING or not self._limited(record):
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, passed, dropped = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.period:
+                started, passed = now, 0
+            if passed >= self.burst:
+                self._windows[key] = (started, passed, dropped + 1)
+                return False
+            if len(self._windows) >= self.max_keys and key not in self._windows:
+                self._windows.clear()
+            self._windows[key] = (started, passed + 1, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования исключений в вызывающем потоке.
+    
+    Аргументы подставляются сразу, как в стандартном prepare(): иначе
+    изменяемый объект из args, поменявшийся до записи, попал бы в лог
+    в новом виде. Исключение (traceback) и поля extra передаются как есть —
+    очередь живёт в том же процессе, форматирует их поток QueueListener.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", module_levels: Optional[Dict[str, str]] = None,
+                  rate_limit: int = 20, rate_period: float = 60.0,
+                  rate_limited_loggers: Iterable[str] = ()) -> QueueListener:
+    """
+    Настроить логирование: обработчики вызываются в фоновом потоке.
+    
+    В event loop остаётся только проверка уровня, фильтр частоты
+    и queue.put(); вывод в stderr и форматирование (JSON или текст) —
+    в потоке QueueListener.
+    """
+    global _listener
+    if _listener is None:
+        # Дописать хвост очереди при выходе
+        atexit.register(stop_logging)
+    else:
+        stop_logging()
+    
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(burst=rate_limit, period=rate_period, loggers=rate_limited_loggers))
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    
+    for name, module_level in (module_levels or {}).items():
+        set_log_level(name, module_level)
+    
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Остановить фоновый поток, записав всё, что осталось в очереди"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def set_log_level(name: str, level: str) -> int:
+    """Изменить уровень логгера на ходу ("" или "root" — корневой)"""
+    numeric_level = logging.getLevelName(level.upper())
+    if not isinstance(numeric_level, int):
+        raise ValueError(f"Неизвестный уровень логирования: {level}")
+    logging.getLogger(None if name in ("", "root") else name).setLevel(numeric_level)
+    return numeric_level
+
+
+def get_log_levels() -> Dict[str, str]:
+    """Логгеры с явно заданным уровнем (остальные наследуют от родителя)"""
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
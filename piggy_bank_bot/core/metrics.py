@@ -0,0 +1,224 @@
+# core/metrics.py
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class HandlerStats:
+    """Счётчики и гистограмма задержек одного обработчика"""
+    __slots__ = ("count", "errors", "total_time", "buckets")
+    
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        # Последняя корзина — всё, что дольше последней границы (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    
+    def observe(self, duration: float, failed: bool):
+        self.count += 1
+        self.total_time += duration
+        if failed:
+            self.errors += 1
+        self.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+    
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по гистограмме (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Хранилище метрик обработчиков: ключ — (модуль, обработчик, тип события)"""
+    
+    def __init__(self):
+        self.handlers: Dict[Tuple[str, str, str], HandlerStats] = {}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self.counters: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self.started_at = time.time()
+    
+    def observe(self, module: str, handler: str, event_type: str, duration: float, failed: bool = False):
+        key = (module, handler, event_type)
+        stats = self.handlers.get(key)
+        if stats is None:
+            stats = self.handlers[key] = HandlerStats()
+        stats.observe(duration, failed)
+    
+    def register_gauge(self, name: str, help_text: str, getter: Callable[[], float]):
+        """Метрика-значение, которое читается в момент экспорта"""
+        self.gauges[name] = (help_text, getter)
+    
+    def register_counter(self, name: str, help_text: str, getter: Callable[[], float]):
+        """Монотонный счётчик (*_total), который читается в момент экспорта"""
+        self.counters[name] = (help_text, getter)
+    
+    def top(self, limit: int = 10) -> List[Tuple[Tuple[str, str, str], HandlerStats]]:
+        """Самые «дорогие» обработчики по суммарному времени"""
+        return sorted(self.handlers.items(), key=lambda item: item[1].total_time, reverse=True)[:limit]
+    
+    def snapshot(self) -> Dict[str, Tuple[str, str, Any]]:
+        """
+        Текущие значения счётчиков и метрик-значений: имя → (тип, описание, значение).
+        Метрика, которую не удалось прочитать, пропускается.
+        """
+        values = {}
+        for metric_type, registered in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, (help_text, getter) in registered.items():
+                try:
+                    values[name] = (metric_type, help_text, getter())
+                except Exception as e:
+                    logger.error(f"Ошибка чтения метрики {name}: {e}")
+        return values
+    
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP bot_handler_calls_total Handler invocations",
+            "# TYPE bot_handler_calls_total counter",
+        ]
+        for key, stats in self.handlers.items():
+            lines.append(f"bot_handler_calls_total{{{_labels(*key)}}} {stats.count}")
+        
+        lines += [
+            "# HELP bot_handler_errors_total Handler invocations that raised",
+            "# TYPE bot_handler_errors_total counter",
+        ]
+        for key, stats in self.handlers.items():
+            lines.append(f"bot_handler_errors_total{{{_labels(*key)}}} {stats.errors}")
+        
+        lines += [
+            "# HELP bot_handler_latency_seconds Handler latency",
+            "# TYPE bot_handler_latency_seconds histogram",
+        ]
+        for key, stats in self.handlers.items():
+            labels = _labels(*key)
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += bucket_count
+                lines.append(f'bot_handler_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'bot_handler_latency_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f"bot_handler_latency_seconds_sum{{{labels}}} {stats.total_time:.6f}")
+            lines.append(f"bot_handler_latency_seconds_count{{{labels}}} {stats.count}")
+        
+        for name, (metric_type, help_text, value) in self.snapshot().items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+        
+        lines += [
+            "# HELP bot_uptime_seconds Seconds since start",
+            "# TYPE bot_uptime_seconds gauge",
+            f"bot_uptime_seconds {time.time() - self.started_at:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(module: str, handler: str, event_type: str) -> str:
+    return f'module="{_escape(module)}",handler="{_escape(handler)}",event="{event_type}"'
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замер обработчиков модуля.
+    
+    Вешается на роутер модуля при регистрации (см. core.module_manager).
+    Имя обработчика известно только после проверки фильтров, поэтому
+    middleware внутренний: замеряется ровно тот обработчик, который сработал.
+    """
+    
+    def __init__(self, module_name: str, event_type: str, registry: Optional[MetricsRegistry] = None):
+        self.module_name = module_name
+        self.event_type = event_type
+        self.registry = registry or metrics
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        handler_name = getattr(callback, "__name__", "unknown")
+        
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.registry.observe(
+                self.module_name, handler_name, self.event_type,
+                time.perf_counter() - started, failed
+            )
+
+
+def timed(module_name: str, registry: Optional[MetricsRegistry] = None):
+    """
+    Декоратор для замера вспомогательных корутин, которые не являются
+    обработчиками (например, finish_quiz), с типом события "call"
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                (registry or metrics).observe(
+                    module_name, func.__name__, "call",
+                    time.perf_counter() - started, failed
+                )
+        return wrapper
+    return decorator
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """HTTP обработчик /metrics"""
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def setup_metrics_routes(app: web.Application, path: str = "/metrics"):
+    """Добавить /metrics в существующее aiohttp приложение (например, webhook)"""
+    app.router.add_get(path, handle_metrics)
+
+
+async def start_metrics_server(host: str, port: int, path: str = "/metrics") -> web.AppRunner:
+    """Отдельный HTTP сервер для метрик (в режиме polling)"""
+    app = web.Application()
+    setup_metrics_routes(app, path)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}{path}")
+    return runner
+
+
+# Глобальный экземпляр
+metrics = MetricsRegistry()
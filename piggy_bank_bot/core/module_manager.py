@@ -1,56 +1,210 @@
 # core/module_manager.py
 import os
+import json
 import importlib
-from typing import Dict, Any
+import logging
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Union
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from core.metrics import MetricsMiddleware
+from core.dispatch_index import dispatch_index
+
+logger = logging.getLogger(__name__)
+
+# Папка modules рядом с core — не зависит от рабочей директории
+MODULES_DIR = Path(__file__).resolve().parent.parent / "modules"
+MANIFEST_FILE = "manifest.json"
 
 modules: Dict[str, Dict[str, Any]] = {}
+# Манифесты модулей: имя пакета → содержимое manifest.json
+manifests: Dict[str, Dict[str, Any]] = {}
+# Роутеры-заглушки модулей с манифестом (в порядке загрузки)
+lazy_routers: Dict[str, "LazyModuleRouter"] = {}
 
 def register_module(module_info: dict):
     """Регистрация модуля в системе"""
     module_name = module_info.get("name", "unknown")
     modules[module_name] = module_info
-    print(f"📦 Модуль зарегистрирован: {module_name}")
-    print(f"   Команды: {list(module_info.get('commands', {}).keys())}")  # Отладка
+    
+    # Замер задержек и ошибок всех обработчиков модуля
+    router = module_info.get("router")
+    if router is not None:
+        for event_type, observer in router.observers.items():
+            if observer.handlers and event_type != "error":
+                observer.middleware(MetricsMiddleware(module_name, event_type))
+    
+    logger.info("📦 Модуль зарегистрирован: %s", module_name)
+    logger.debug("   Команды: %s", list(module_info.get("commands", {})))
+
+class LazyModuleRouter(Router):
+    """
+    Роутер модуля, код которого импортируется при первом подходящем обновлении.
+    
+    Какие обновления относятся к модулю, описано в manifest.json:
+    команды, тексты кнопок, префиксы текстов и callback_data, группы FSM состояний.
+    Маршруты манифеста попадают в общий индекс (core.dispatch_index), и до
+    фильтров модуля доходят только адресованные ему обновления.
+    После импорта настоящий роутер модуля подключается как дочерний.
+    """
+    
+    def __init__(self, package: str, manifest: Dict[str, Any]):
+        super().__init__(name=f"lazy:{package}")
+        self.package = package
+        self.manifest = manifest
+        self.loaded = False
+        self.failed = False
+        
+        routes = manifest.get("routes", {})
+        dispatch_index.add_module(package, routes)
+        self._update_types = []
+        if any(routes.get(kind) for kind in ("commands", "texts", "text_prefixes", "states")):
+            self._update_types.append("message")
+        if routes.get("callback_prefixes"):
+            self._update_types.append("callback_query")
+    
+    def update_types(self) -> List[str]:
+        """Типы обновлений, которые модуль может обработать"""
+        return list(self._update_types)
+    
+    def load(self) -> bool:
+        """Импортировать код модуля и подключить его роутер"""
+        if self.loaded:
+            return True
+        try:
+            importlib.import_module(f"modules.{self.package}")
+        except Exception as e:
+            self.failed = True
+            logger.exception("❌ Ошибка загрузки модуля %s: %s", self.package, e)
+            return False
+        
+        module_info = modules.get(self.manifest.get("name"))
+        if not module_info or "router" not in module_info:
+            self.failed = True
+            logger.warning("⚠️ Модуль %s не зарегистрировал router с именем из манифеста", self.package)
+            return False
+        
+        self.include_router(module_info["router"])
+        self.loaded = True
+        logger.info("✅ Загружен модуль: %s", self.package)
+        return True
+    
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs: Any) -> Any:
+        # Модули-адресаты уже найдены по индексу (DispatchIndexMiddleware);
+        # чужие обновления отсекаются без проверки фильтров модуля
+        if "dispatch_modules" in kwargs:
+            candidates = kwargs["dispatch_modules"]
+        else:
+            candidates = dispatch_index.modules_for(event, kwargs.get("raw_state"))
+        
+        if candidates is not None and self.package not in candidates:
+            return UNHANDLED
+        if not self.loaded:
+            if self.failed or candidates is None or not self.load():
+                return UNHANDLED
+            # Маршруты обработчиков модуля появились в индексе только сейчас
+            if "dispatch_route" in kwargs:
+                kwargs["dispatch_route"] = dispatch_index.resolve(event)
+        return await super().propagate_event(update_type, event, **kwargs)
+
+def read_manifest(package: str) -> Optional[Dict[str, Any]]:
+    """Прочитать manifest.json модуля (None — манифеста нет)"""
+    manifest_path = MODULES_DIR / package / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _lazy_module_names() -> set:
+    """Имена модулей (module_info["name"]), подключаемых через манифест"""
+    return {manifest.get("name") for manifest in manifests.values()}
 
 def get_all_commands() -> dict:
     """Получить все команды из всех модулей"""
     all_commands = {}
-    for module_data in modules.values():
-        if "commands" in module_data:
+    # Модули с манифестом — без импорта их кода
+    for manifest in manifests.values():
+        all_commands.update(manifest.get("commands", {}))
+    lazy_names = _lazy_module_names()
+    for module_name, module_data in modules.items():
+        if module_name not in lazy_names and "commands" in module_data:
             all_commands.update(module_data["commands"])
     return all_commands
 
 def get_all_routers():
     """Получить все роутеры модулей"""
-    routers = []
-    for module_data in modules.values():
-        if "router" in module_data:
+    routers = list(lazy_routers.values())
+    lazy_names = _lazy_module_names()
+    for module_name, module_data in modules.items():
+        if module_name not in lazy_names and "router" in module_data:
             routers.append(module_data["router"])
     return routers
 
-def load_all_modules():
-    """Автоматическая загрузка всех модулей"""
-    modules_dir = "modules"
-    if not os.path.exists(modules_dir):
+def get_used_update_types(dispatcher: Router) -> List[str]:
+    """
+    Типы обновлений для allowed_updates.
+    
+    resolve_used_update_types видит только уже импортированные обработчики,
+    поэтому добавляем типы из манифестов ещё не загруженных модулей.
+    """
+    update_types = set(dispatcher.resolve_used_update_types())
+    for lazy_router in lazy_routers.values():
+        update_types.update(lazy_router.update_types())
+    return sorted(update_types)
+
+def load_all_modules(preload: Union[bool, Iterable[str]] = False):
+    """
+    Загрузка модулей.
+    
+    Модули с manifest.json подключаются лениво (код импортируется при первом
+    подходящем обновлении). preload=True — импортировать все сразу,
+    список имён пакетов — только указанные. Модули без манифеста
+    импортируются сразу, как раньше.
+    """
+    modules_dir = MODULES_DIR
+    if not modules_dir.exists():
         os.makedirs(modules_dir)
-        print(f"📁 Создана папка для модулей: {modules_dir}")
+        logger.info("📁 Создана папка для модулей: %s", modules_dir)
         return
     
-    for item in os.listdir(modules_dir):
-        module_path = os.path.join(modules_dir, item)
-        if os.path.isdir(module_path) and not item.startswith("__"):
-            try:
-                # ⭐️ Импортируем модуль
-                module = importlib.import_module(f"modules.{item}")
-                print(f"✅ Загружен модуль: {item}")
+    preload_all = preload is True
+    preload_set = set() if isinstance(preload, bool) else set(preload)
                 
-                # Проверяем, есть ли в модуле router
-                if hasattr(module, 'router'):
-                    print(f"   Найден router в {item}")
-            except ImportError as e:
-                print(f"⚠️ Модуль {item} не загружен: {e}")
-            except Exception as e:
-                print(f"❌ Ошибка загрузки модуля {item}: {e}")
-    
-    print(f"\n📊 Итог: зарегистрировано {len(modules)} модулей")
-    print(f"Модули: {list(modules.keys())}")
\ No newline at end of file
+    for item in sorted(os.listdir(modules_dir)):
+        module_path = modules_dir / item
+        if not module_path.is_dir() or item.startswith("__") or item in lazy_routers:
+            continue
+    
+        try:
+            manifest = read_manifest(item)
+        except Exception as e:
+            logger.error("❌ Ошибка чтения манифеста модуля %s: %s", item, e)
+            continue
+        
+        if manifest is not None:
+            manifests[item] = manifest
+            lazy_routers[item] = LazyModuleRouter(item, manifest)
+            if preload_all or item in preload_set:
+                lazy_routers[item].load()
+            else:
+                logger.info("💤 Модуль %s будет загружен при первом обращении", item)
+            continue
+        
+        try:
+            # ⭐️ Импортируем модуль
+            module = importlib.import_module(f"modules.{item}")
+            logger.info("✅ Загружен модуль: %s", item)
+            
+            # Проверяем, есть ли в модуле router
+            if hasattr(module, 'router'):
+                logger.debug("   Найден router в %s", item)
+        except ImportError as e:
+            logger.warning("⚠️ Модуль %s не загружен: %s", item, e)
+        except Exception as e:
+            logger.exception("❌ Ошибка загрузки модуля %s: %s", item, e)
+    
+    logger.info("📊 Итог: %d модулей с манифестом, импортировано %d: %s",
+                len(manifests), len(modules), list(manifests))
@@ -0,0 +1,280 @@
+# core/outbound.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery, EditMessageCaption, EditMessageReplyMarkup, EditMessageText, SendMessage
+)
+from aiogram.methods.base import TelegramMethod, TelegramType
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты общего лимита: меньше — раньше
+# (ответы на callback идут вне очереди — они не считаются сообщениями)
+PRIORITY_SEND = 1
+PRIORITY_EDIT = 2
+
+_EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def try_acquire(self) -> float:
+        """Взять токен. 0 — взят, иначе сколько секунд подождать"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+    
+    def pause(self, seconds: float):
+        """Telegram попросил подождать (429) — ведро пустеет на seconds"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class _PriorityGate:
+    """Общий лимит: токены раздаются ожидающим в порядке приоритета, затем очереди"""
+    
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._drainer: Optional[asyncio.Task] = None
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._heap)
+    
+    async def acquire(self, priority: int):
+        # Без очереди и с запасом токенов — сразу
+        if not self._heap and self.bucket.try_acquire() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._order), future))
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.get_running_loop().create_task(self._drain())
+        await future
+    
+    async def _drain(self):
+        while self._heap:
+            delay = self.bucket.try_acquire()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._heap)
+            if future.done():
+                # Отправитель отменён — токен достаётся следующему
+                self.bucket.refund()
+                continue
+            future.set_result(None)
+
+
+class _ChatLimit:
+    """Лимит одного чата: ведро + замок, чтобы сообщения уходили по порядку"""
+    __slots__ = ("bucket", "lock")
+    
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = asyncio.Lock()
+
+
+class _PendingEdit:
+    """Правка, ждущая своей очереди; более свежая правка того же сообщения заменяет method"""
+    __slots__ = ("method", "task")
+    
+    def __init__(self, method: TelegramMethod):
+        self.method = method
+        self.task: Optional[asyncio.Task] = None
+
+
+def _edit_signature(method: TelegramMethod) -> Tuple:
+    """То, что правка меняет в сообщении: совпадает — правка ничего не изменит"""
+    return (
+        # Правки разных типов меняют разные части сообщения — их подписи не равны
+        EditMessageText if isinstance(method, SendMessage) else type(method),
+        getattr(method, "text", None),
+        getattr(method, "caption", None),
+        repr(getattr(method, "parse_mode", None)),
+        repr(getattr(method, "reply_markup", None)),
+    )
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Слой исходящих запросов к Telegram (middleware сессии бота).
+    
+    - общий лимит global_rate сообщений в секунду с приоритетами:
+      ответы на callback без очереди, затем новые сообщения, затем правки;
+    - лимит на чат: chat_rate в секунду для личных чатов, group_rate для групп;
+    - правки одного сообщения, ждущие очереди, схлопываются в последнюю —
+      все вызывающие получают её результат;
+    - правка, которая повторяет последнее отправленное содержимое сообщения,
+      не отправляется; содержимое помнится content_ttl секунд (0 — не пропускать:
+      правки других реплик этого бота здесь не видны);
+    - на 429 на паузу retry_after ставятся и чат, и общий лимит (Telegram
+      не сообщает, какой лимит сработал), и запрос повторяется.
+    
+    Запросы без chat_id (getUpdates, setWebhook, ...) проходят без ограничений.
+    """
+    
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate: float = 20 / 60,
+                 chat_burst: float = 3, max_retries: int = 3, max_chats: int = 10000, content_ttl: float = 10):
+        self.gate = _PriorityGate(TokenBucket(global_rate, global_rate))
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.content_ttl = content_ttl
+        
+        self._chats: "OrderedDict[Hashable, _ChatLimit]" = OrderedDict()
+        self._pending_edits: Dict[Tuple, _PendingEdit] = {}
+        # Последнее отправленное содержимое сообщений: (чат, id) → (подпись, когда отправлено)
+        self._last_content: "OrderedDict[Tuple, Tuple[Tuple, float]]" = OrderedDict()
+        
+        self.coalesced = 0
+        self.skipped = 0
+        self.retries = 0
+    
+    @property
+    def waiting(self) -> int:
+        """Сколько запросов ждут общего лимита"""
+        return self.gate.waiting
+    
+    def _chat(self, chat_id: Hashable) -> _ChatLimit:
+        limit = self._chats.get(chat_id)
+        if limit is None:
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            limit = self._chats[chat_id] = _ChatLimit(rate, self.chat_burst)
+            # Вытесняем давно молчавшие чаты; занятые замки не трогаем
+            while len(self._chats) > self.max_chats:
+                old_id, old_limit = next(iter(self._chats.items()))
+                if old_limit.lock.locked():
+                    break
+                del self._chats[old_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return limit
+    
+    def _remember_content(self, key: Tuple, signature: Tuple):
+        if self.content_ttl <= 0:
+            return
+        self._last_content[key] = (signature, time.monotonic())
+        self._last_content.move_to_end(key)
+        while len(self._last_content) > self.max_chats:
+            self._last_content.popitem(last=False)
+    
+    def _is_unchanged(self, key: Tuple, signature: Tuple) -> bool:
+        remembered = self._last_content.get(key)
+        return (
+            remembered is not None
+            and remembered[0] == signature
+            and time.monotonic() - remembered[1] < self.content_ttl
+        )
+    
+    async def _send(self, make_request: NextRequestMiddlewareType[TelegramType], bot,
+                    method: TelegramMethod[TelegramType], chat: _ChatLimit, priority: int):
+        attempt = 0
+        while True:
+            delay = chat.bucket.try_acquire()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = chat.bucket.try_acquire()
+            await self.gate.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("⏳ Flood control (%s), повтор через %s с", type(method).__name__, e.retry_after)
+                chat.bucket.pause(e.retry_after)
+                self.gate.bucket.pause(e.retry_after)
+    
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot,
+                       method: TelegramMethod[TelegramType]) -> Any:
+        if isinstance(method, AnswerCallbackQuery):
+            # Ответ на callback не считается сообщением и должен успеть до таймаута
+            return await make_request(bot, method)
+        
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        
+        if isinstance(method, _EDIT_METHODS) and getattr(method, "message_id", None) is not None:
+            return await self._edit(make_request, bot, method, chat_id)
+        
+        chat = self._chat(chat_id)
+        async with chat.lock:
+            result = await self._send(make_request, bot, method, chat, PRIORITY_SEND)
+        
+        if isinstance(method, SendMessage) and isinstance(result, Message):
+            # Первая правка с тем же содержимым будет пропущена
+            self._remember_content((chat_id, result.message_id), _edit_signature(method))
+        return result
+    
+    async def _edit(self, make_request, bot, method: TelegramMethod, chat_id: Hashable) -> Any:
+        key = (type(method), chat_id, method.message_id)
+        
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Предыдущая правка ещё в очереди — отправится только последняя
+            pending.method = method
+            self.coalesced += 1
+        else:
+            pending = self._pending_edits[key] = _PendingEdit(method)
+            # Отправка — отдельной задачей: отмена одного из ждущих не отменяет её для остальных
+            pending.task = asyncio.get_running_loop().create_task(
+                self._send_edit(make_request, bot, key, chat_id, pending)
+            )
+            # Исключение может никто не прочитать, если все ждущие отменены
+            pending.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(pending.task)
+        
+    async def _send_edit(self, make_request, bot, key: Tuple, chat_id: Hashable, pending: _PendingEdit) -> Any:
+        content_key = (chat_id, pending.method.message_id)
+        chat = self._chat(chat_id)
+        try:
+            async with chat.lock:
+                # Пока ждали замок, правку могли заменить более свежей
+                if self._pending_edits.get(key) is pending:
+                    del self._pending_edits[key]
+                method = pending.method
+                signature = _edit_signature(method)
+                if self._is_unchanged(content_key, signature):
+                    self.skipped += 1
+                    return True
+                # Любая отправленная правка меняет сообщение: прежняя подпись больше не верна
+                self._last_content.pop(content_key, None)
+                result = await self._send(make_request, bot, method, chat, PRIORITY_EDIT)
+                self._remember_content(content_key, signature)
+                return result
+        finally:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+        
\ No newline at end of file
@@ -0,0 +1,74 @@
+# core/scheduler.py
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Hashable
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatQueue:
+    """Очередь обновлений одного чата: замок + число ожидающих"""
+    __slots__ = ("lock", "waiters")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class UpdateScheduler(BaseEventIsolation):
+    """
+    Планировщик обработки обновлений.
+    
+    Каждое обновление уже выполняется отдельной задачей (polling с
+    handle_as_tasks / webhook в фоне), планировщик решает, когда ей можно работать:
+    - обновления одного чата обрабатываются строго по порядку поступления,
+      поэтому FSM диалоги и callback'и тестов не гоняются друг с другом;
+    - одновременно выполняется не больше max_concurrency обработчиков.
+    
+    Подключается как events_isolation диспетчера: FSMContextMiddleware берёт
+    блокировку до чтения состояния, так что следующий апдейт чата увидит
+    состояние, записанное предыдущим.
+    """
+    
+    def __init__(self, max_concurrency: int = 100):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chats: Dict[Hashable, _ChatQueue] = {}
+        self.active = 0
+    
+    @property
+    def waiting(self) -> int:
+        """Сколько обновлений ждут своей очереди"""
+        return sum(queue.waiters for queue in self._chats.values()) - self.active
+    
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        # Порядок важен внутри чата, а не для отдельного пользователя в нём
+        chat_key = (key.bot_id, key.chat_id)
+        
+        queue = self._chats.get(chat_key)
+        if queue is None:
+            queue = self._chats[chat_key] = _ChatQueue()
+        queue.waiters += 1
+        try:
+            # Сначала очередь чата, потом общий лимит: ожидающие обновления
+            # того же чата не занимают слоты других пользователей.
+            # asyncio.Lock отдаёт захват в порядке ожидания (FIFO).
+            async with queue.lock:
+                async with self._semaphore:
+                    self.active += 1
+                    try:
+                        yield
+                    finally:
+                        self.active -= 1
+        finally:
+            queue.waiters -= 1
+            if queue.waiters == 0:
+                # Пустые очереди удаляем, чтобы память не росла с числом чатов
+                del self._chats[chat_key]
+    
+    async def close(self) -> None:
+        self._chats.clear()
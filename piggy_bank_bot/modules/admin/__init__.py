@@ -0,0 +1 @@
+from .admin_module import *
\ No newline at end of file
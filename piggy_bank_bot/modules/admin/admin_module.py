@@ -0,0 +1,86 @@
+# modules/admin/admin_module.py
+from aiogram import Router, types
+from aiogram.filters import Command, CommandObject
+
+from core.metrics import metrics, LATENCY_BUCKETS
+from core.logging_setup import get_log_levels, set_log_level
+from core.module_manager import register_module
+from shared.config import config
+
+router = Router()
+
+
+def is_admin(message: types.Message) -> bool:
+    """Команды модуля доступны только администратору из ADMIN_TELEGRAM_ID"""
+    return (
+        bool(config.ADMIN_TELEGRAM_ID)
+        and message.from_user is not None
+        and message.from_user.id == config.ADMIN_TELEGRAM_ID
+    )
+
+
+@router.message(Command("stats"), is_admin)
+async def cmd_stats(message: types.Message):
+    """Самые медленные обработчики по суммарному времени"""
+    top = metrics.top(limit=15)
+    
+    if not top:
+        await message.answer("📭 Метрик пока нет")
+        return
+    
+    text = "📈 Обработчики (по суммарному времени):\n\n"
+    for (module_name, handler_name, event_type), stats in top:
+        avg_ms = stats.total_time / stats.count * 1000
+        p95 = stats.quantile(0.95)
+        if p95 == float("inf"):
+            p95_text = f"> {LATENCY_BUCKETS[-1] * 1000:.0f} мс"
+        else:
+            p95_text = f"≤ {p95 * 1000:.0f} мс"
+        text += f"🔹 {module_name} / {handler_name} ({event_type})\n"
+        text += f"   вызовов: {stats.count}, ошибок: {stats.errors}\n"
+        text += f"   среднее: {avg_ms:.1f} мс, p95: {p95_text}, всего: {stats.total_time:.1f} с\n"
+    
+    for name, (_, _, value) in metrics.snapshot().items():
+        text += f"\n{name}: {value}"
+    
+    await message.answer(text)
+
+
+@router.message(Command("loglevel"), is_admin)
+async def cmd_loglevel(message: types.Message, command: CommandObject):
+    """
+    /loglevel — текущие уровни логгеров
+    /loglevel <логгер> <уровень> — изменить на ходу (например, modules.ton_wallet DEBUG)
+    """
+    args = (command.args or "").split()
+    
+    if not args:
+        text = "📝 Уровни логирования:\n\n"
+        for name, level in get_log_levels().items():
+            text += f"{name}: {level}\n"
+        text += "\nИзменить: /loglevel <логгер> <уровень>"
+        await message.answer(text)
+        return
+    
+    if len(args) != 2:
+        await message.answer("Формат: /loglevel <логгер> <уровень>")
+        return
+    
+    name, level = args
+    try:
+        set_log_level(name, level)
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+    await message.answer(f"✅ {name}: {level.upper()}")
+
+
+# Регистрация модуля (команды служебные — в /help не показываются)
+module_info = {
+    "name": "Администрирование",
+    "description": "Служебные команды администратора",
+    "commands": {},
+    "router": router
+}
+
+register_module(module_info)
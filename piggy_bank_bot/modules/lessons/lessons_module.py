@@ -8,17 +8,22 @@ import sys
 import os
 
 from core.module_manager import register_module
+from shared.config import config
+from core.metrics import timed
+from core.dispatch_index import callback_route
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Импортируем локальную базу данных
+# Подключаем хранилище прогресса (бэкенд выбирает db_manager)
 try:
-    from shared.local_database import local_db
+    from shared.db_manager import db_manager
+    from .progress_service import ProgressService
+    storage = db_manager.get_storage()
     HAS_DATABASE = True
-    print("✅ Локальная база данных доступна для модуля lessons")
-except ImportError as e:
-    print(f"⚠️ Локальная база данных не доступна: {e}")
+    logger.debug("✅ Хранилище %s доступно для модуля lessons", storage.name)
+except Exception as e:
+    logger.warning("⚠️ Хранилище данных не доступно: %s", e)
     HAS_DATABASE = False
 
 # Создаем полные уроки прямо здесь
@@ -189,147 +194,73 @@ QUIZZES = {
     ]
 }
 
-print(f"✅ Данные загружены: {len(LESSONS)} уроков, {len(QUIZZES)} тестов")
+logger.debug("✅ Данные загружены: %d уроков, %d тестов", len(LESSONS), len(QUIZZES))
+
+# Быстрый поиск урока по id
+LESSONS_BY_ID = {lesson["id"]: lesson for lesson in LESSONS}
+
+# Биты всех уроков курса (бит N — урок N, как users.completed_mask)
+ALL_LESSONS_MASK = sum(1 << lesson["id"] for lesson in LESSONS)
 
 # Для хранения состояния тестирования в памяти
 user_quiz_attempts = {}
 
+# Прогресс пользователей с кешем: меню уроков не ходят в базу
+if HAS_DATABASE:
+    LESSON_REWARDS = {lesson["id"]: lesson["reward_spw"] for lesson in LESSONS}
+    progress_service = ProgressService(
+        storage.lessons,
+        rewards=LESSON_REWARDS,
+        max_size=config.PROGRESS_CACHE_SIZE,
+        ttl=config.PROGRESS_CACHE_TTL
+    )
+else:
+    progress_service = None
+
 # =========== ФУНКЦИИ ДЛЯ РАБОТЫ С ЛОКАЛЬНОЙ БАЗОЙ ===========
 
 async def get_user_progress(user_id: int):
-    """Получить прогресс пользователя из локальной базы данных"""
+    """Получить прогресс пользователя (из кеша или хранилища)"""
     try:
         if HAS_DATABASE:
-            # Ищем пользователя в базе по telegram_id
-            user_row = local_db.fetch_one(
-                "SELECT id, spw_balance FROM users WHERE telegram_id = ?",
-                (str(user_id),)
-            )
-            
-            if user_row:
-                db_user_id = user_row[0]
-                user_spw_balance = user_row[1]
-                
-                # Получаем пройденные уроки пользователя
-                lessons_rows = local_db.fetch_all(
-                    """SELECT lesson_id, quiz_score, completed_at, reward_granted 
-                       FROM user_lessons 
-                       WHERE user_id = ?""",
-                    (db_user_id,)
-                )
-                
-                completed_lessons = []
-                total_rewards = 0
-                
-                for row in lessons_rows:
-                    lesson_id = row[0]
-                    reward_granted = row[3]
-                    completed_lessons.append(lesson_id)
-                    
-                    # Находим урок в списке для получения награды
-                    lesson_data = next((l for l in LESSONS if l['id'] == lesson_id), None)
-                    if lesson_data and reward_granted:
-                        total_rewards += lesson_data['reward_spw']
-                
-                return {
-                    "completed": completed_lessons,
-                    "rewards": total_rewards,
-                    "db_user_id": db_user_id,
-                    "spw_balance": user_spw_balance
-                }
-            else:
-                # Пользователь не найден, создаем его
-                try:
-                    local_db.execute_query(
-                        """INSERT INTO users (telegram_id, spw_balance) 
-                           VALUES (?, 0)""",
-                        (str(user_id),)
-                    )
-                    print(f"✅ Создан новый пользователь в локальной базе: {user_id}")
-                    
-                    # Получаем ID нового пользователя
-                    new_user_row = local_db.fetch_one(
-                        "SELECT id FROM users WHERE telegram_id = ?",
-                        (str(user_id),)
-                    )
-                    
-                    if new_user_row:
-                        return {
-                            "completed": [],
-                            "rewards": 0,
-                            "db_user_id": new_user_row[0],
-                            "spw_balance": 0
-                        }
-                except Exception as e:
-                    logger.error(f"Ошибка при создании пользователя: {e}")
+            return (await progress_service.get(user_id)).as_dict()
         
         # Если база не доступна
-        return {"completed": [], "rewards": 0, "db_user_id": None, "spw_balance": 0}
+        return {"completed": (), "completed_mask": 0, "rewards": 0, "db_user_id": None, "spw_balance": 0}
         
     except Exception as e:
         logger.error(f"❌ Ошибка при получении прогресса пользователя {user_id}: {e}")
-        return {"completed": [], "rewards": 0, "db_user_id": None, "spw_balance": 0}
+        return {"completed": (), "completed_mask": 0, "rewards": 0, "db_user_id": None, "spw_balance": 0}
 
-async def save_lesson_result(user_id: int, lesson_id: int, quiz_score: int, reward_spw: int):
-    """Сохранить результат прохождения урока в локальную базу данных"""
+async def save_lesson_result(user_id: int, lesson_id: int, quiz_score: int):
+    """
+    Сохранить результат прохождения урока в локальную базу данных.
+    
+    Один вызов базы: запись урока, начисление награды (только за первое
+    прохождение) и новый прогресс — в одной транзакции; кеш прогресса
+    обновляется тем же результатом.
+    Возвращает прогресс как get_user_progress плюс newly_completed, None — ошибка.
+    """
     try:
         if not HAS_DATABASE:
             logger.warning("Локальная база данных не доступна, результат не сохранен")
-            return False
-        
-        # Получаем или создаем пользователя
-        progress = await get_user_progress(user_id)
-        db_user_id = progress["db_user_id"]
+            return None
         
-        if not db_user_id:
-            logger.warning(f"Не удалось получить/создать пользователя {user_id}")
-            return False
+        progress, newly_completed = await progress_service.complete_lesson(user_id, lesson_id, quiz_score)
         
-        # Проверяем, существует ли уже запись об этом уроке
-        existing_row = local_db.fetch_one(
-            "SELECT id FROM user_lessons WHERE user_id = ? AND lesson_id = ?",
-            (db_user_id, lesson_id)
-        )
-        
-        if existing_row:
-            # Обновляем существующую запись
-            local_db.execute_query(
-                """UPDATE user_lessons 
-                   SET quiz_score = ?, completed_at = CURRENT_TIMESTAMP, reward_granted = TRUE
-                   WHERE id = ?""",
-                (quiz_score, existing_row[0])
-            )
-            logger.info(f"✅ Обновлен результат урока {lesson_id} для пользователя {user_id}")
-        else:
-            # Создаем новую запись
-            local_db.execute_query(
-                """INSERT INTO user_lessons (user_id, lesson_id, quiz_score, reward_granted)
-                   VALUES (?, ?, ?, TRUE)""",
-                (db_user_id, lesson_id, quiz_score)
+        if newly_completed:
+            logger.info(
+                "✅ Сохранен новый результат урока %s для пользователя %s, баланс: %s SPW",
+                lesson_id, user_id, progress.spw_balance
             )
-            logger.info(f"✅ Сохранен новый результат урока {lesson_id} для пользователя {user_id}")
-        
-        # Обновляем баланс SPW пользователя
-        try:
-            current_balance = progress.get("spw_balance", 0)
-            new_balance = current_balance + reward_spw
-            
-            local_db.execute_query(
-                "UPDATE users SET spw_balance = ? WHERE id = ?",
-                (new_balance, db_user_id)
-            )
-            
-            logger.info(f"💰 Баланс пользователя {user_id} увеличен на {reward_spw} SPW (новый баланс: {new_balance})")
             
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении баланса: {e}")
-            return False
-        
-        return True
+        result = progress.as_dict()
+        result["newly_completed"] = newly_completed
+        return result
         
     except Exception as e:
         logger.error(f"❌ Ошибка при сохранении результата урока: {e}")
-        return False
+        return None
 
 # =========== ОСТАВШИЕСЯ ФУНКЦИИ (БЕЗ ИЗМЕНЕНИЙ) ===========
 
@@ -338,6 +269,8 @@ async def show_lessons_progress(user_id: int, chat_id: int, bot=None, message=No
     # Получаем прогресс пользователя
     progress = await get_user_progress(user_id)
     completed = progress["completed"]
+    completed_mask = progress["completed_mask"]
+    all_done = completed_mask & ALL_LESSONS_MASK == ALL_LESSONS_MASK
     earned = progress["rewards"]
     total_rewards = sum(lesson["reward_spw"] for lesson in LESSONS)
     spw_balance = progress.get("spw_balance", 0)
@@ -355,15 +288,15 @@ async def show_lessons_progress(user_id: int, chat_id: int, bot=None, message=No
 """
     
     for lesson in LESSONS:
-        status = "✅" if lesson["id"] in completed else "📘"
+        status = "✅" if completed_mask >> lesson["id"] & 1 else "📘"
         text += f"\n{status} Урок {lesson['id']}: {lesson['title']} ({lesson['reward_spw']} SPW)"
     
-    if len(completed) == len(LESSONS):
+    if all_done:
         text += "\n\n🎉 **ВЫ ЗАВЕРШИЛИ ВСЕ УРОКИ!** 🎉"
         text += f"\n🏆 Итоговая награда: {earned} SPW"
         text += "\n💡 Поздравляем! Вы прошли полный курс основ криптовалют."
     else:
-        next_lesson = next((l for l in LESSONS if l["id"] not in completed), None)
+        next_lesson = next((l for l in LESSONS if not completed_mask >> l["id"] & 1), None)
         if next_lesson:
             text += f"\n\n🎯 **Следующий урок:** Урок {next_lesson['id']}: {next_lesson['title']}"
             text += f"\n🎁 Награда: {next_lesson['reward_spw']} SPW"
@@ -375,7 +308,7 @@ async def show_lessons_progress(user_id: int, chat_id: int, bot=None, message=No
     
     # Кнопки для непройденных уроков
     for lesson in LESSONS:
-        if lesson["id"] not in completed:
+        if not completed_mask >> lesson["id"] & 1:
             keyboard.inline_keyboard.append([
                 InlineKeyboardButton(
                     text=f"📚 Урок {lesson['id']}: {lesson['title'][:30]}...",
@@ -393,7 +326,7 @@ async def show_lessons_progress(user_id: int, chat_id: int, bot=None, message=No
         ])
     
     # Если все уроки пройдены
-    if len(completed) == len(LESSONS):
+    if all_done:
         keyboard.inline_keyboard.append([
             InlineKeyboardButton(
                 text="🏆 Сертификат об окончании",
@@ -420,11 +353,10 @@ async def cmd_learn(message: types.Message):
         message=message
     )
 
-@router.callback_query(lambda c: c.data.startswith("show_lesson_"))
-async def show_lesson(callback: types.CallbackQuery):
+@router.callback_query(callback_route("show_lesson_{lesson_id:int}"))
+async def show_lesson(callback: types.CallbackQuery, lesson_id: int):
     """Показывает выбранный урок"""
-    lesson_id = int(callback.data.split("_")[-1])
-    lesson = next((l for l in LESSONS if l["id"] == lesson_id), None)
+    lesson = LESSONS_BY_ID.get(lesson_id)
     
     if not lesson:
         await callback.answer("Урок не найден", show_alert=True)
@@ -460,10 +392,9 @@ async def show_lesson(callback: types.CallbackQuery):
 
 # =========== ФУНКЦИИ ДЛЯ ТЕСТОВ (БЕЗ ИЗМЕНЕНИЙ) ===========
 
-@router.callback_query(lambda c: c.data.startswith("start_quiz_"))
-async def start_quiz(callback: types.CallbackQuery):
+@router.callback_query(callback_route("start_quiz_{lesson_id:int}"))
+async def start_quiz(callback: types.CallbackQuery, lesson_id: int):
     """Начинает тестирование после урока"""
-    lesson_id = int(callback.data.split("_")[-1])
     user_id = callback.from_user.id
     user_id_str = str(user_id)
     
@@ -541,18 +472,12 @@ async def show_quiz_question(message: types.Message, user_id_str: str, lesson_id
     
     await message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
 
-@router.callback_query(lambda c: c.data.startswith("quiz_answer_"))
-async def handle_quiz_answer(callback: types.CallbackQuery):
+@router.callback_query(callback_route("quiz_answer_{lesson_id:int}_{question_index:int}_{selected_option:int}"))
+async def handle_quiz_answer(callback: types.CallbackQuery, lesson_id: int, question_index: int, selected_option: int):
     """Обрабатывает ответ на вопрос теста"""
     user_id = callback.from_user.id
     user_id_str = str(user_id)
     
-    # Парсим данные из callback
-    parts = callback.data.split("_")
-    lesson_id = int(parts[2])
-    question_index = int(parts[3])
-    selected_option = int(parts[4])
-    
     # Получаем состояние теста
     quiz_state = user_quiz_attempts.get(user_id_str)
     if not quiz_state or quiz_state["lesson_id"] != lesson_id:
@@ -561,11 +486,15 @@ async def handle_quiz_answer(callback: types.CallbackQuery):
     
     # Получаем данные вопроса
     quiz_questions = quiz_state["questions"]
-    if question_index >= len(quiz_questions):
+    if not 0 <= question_index < len(quiz_questions):
         await callback.answer("Ошибка: вопрос не найден", show_alert=True)
         return
     
     question_data = quiz_questions[question_index]
+    # callback_data приходит от клиента: номер варианта проверяем сами
+    if not 0 <= selected_option < len(question_data['options']):
+        await callback.answer("Ошибка: такого варианта ответа нет", show_alert=True)
+        return
     is_correct = (selected_option == question_data['correct'])
     
     # Сохраняем ответ
@@ -614,18 +543,15 @@ async def handle_quiz_answer(callback: types.CallbackQuery):
     
     await callback.answer()
 
-@router.callback_query(lambda c: c.data.startswith("next_question_"))
-async def next_question(callback: types.CallbackQuery):
+@router.callback_query(callback_route("next_question_{lesson_id:int}_{question_index:int}"))
+async def next_question(callback: types.CallbackQuery, lesson_id: int, question_index: int):
     """Переход к следующему вопросу"""
-    parts = callback.data.split("_")
-    lesson_id = int(parts[2])
-    question_index = int(parts[3])
-    
     user_id_str = str(callback.from_user.id)
     
     await show_quiz_question(callback.message, user_id_str, lesson_id, question_index)
     await callback.answer()
 
+@timed("Обучение криптовалютам")
 async def finish_quiz(message: types.Message, user_id_str: str, lesson_id: int):
     """Завершает тестирование и показывает результаты"""
     quiz_state = user_quiz_attempts.get(user_id_str)
@@ -650,28 +576,24 @@ async def finish_quiz(message: types.Message, user_id_str: str, lesson_id: int):
         text += f"\n🎉 **ТЕСТ ПРОЙДЕН!** 🎉"
         
         # Находим урок
-        lesson = next((l for l in LESSONS if l["id"] == lesson_id), None)
+        lesson = LESSONS_BY_ID.get(lesson_id)
+        user_id = int(user_id_str)
+        progress = None
         
         if lesson:
-            # Проверяем, не проходил ли пользователь уже этот урок
-            user_id = int(user_id_str)
-            progress = await get_user_progress(user_id)
+            # Запись урока, награда и новый прогресс — один запрос к базе
+            progress = await save_lesson_result(
+                user_id=user_id,
+                lesson_id=lesson_id,
+                quiz_score=quiz_score
+            )
             
-            if lesson_id not in progress["completed"]:
-                # Сохраняем результат в базу данных
-                success = await save_lesson_result(
-                    user_id=user_id,
-                    lesson_id=lesson_id,
-                    quiz_score=quiz_score,
-                    reward_spw=lesson["reward_spw"]
-                )
-                
-                if success:
-                    text += f"\n\n🏆 Вы получили: {lesson['reward_spw']} SPW"
-                    text += f"\n📚 Урок '{lesson['title']}' теперь отмечен как пройденный!"
-                    text += f"\n💾 Результат сохранён в локальной базе данных"
-                else:
-                    text += f"\n\n⚠️ Ошибка при сохранении результата. Награда не начислена."
+            if progress is None:
+                text += f"\n\n⚠️ Ошибка при сохранении результата. Награда не начислена."
+            elif progress["newly_completed"]:
+                text += f"\n\n🏆 Вы получили: {lesson['reward_spw']} SPW"
+                text += f"\n📚 Урок '{lesson['title']}' теперь отмечен как пройденный!"
+                text += f"\n💾 Результат сохранён в локальной базе данных"
             else:
                 text += f"\n\nℹ️ Вы уже проходили этот урок ранее."
         
@@ -680,9 +602,7 @@ async def finish_quiz(message: types.Message, user_id_str: str, lesson_id: int):
             del user_quiz_attempts[user_id_str]
         
         # Проверяем, все ли уроки пройдены
-        user_id = int(user_id_str)
-        progress = await get_user_progress(user_id)
-        if len(progress["completed"]) == len(LESSONS):
+        if progress and progress["completed_mask"] & ALL_LESSONS_MASK == ALL_LESSONS_MASK:
             text += "\n\n🎊 **ПОЗДРАВЛЯЕМ! ВЫ ЗАВЕРШИЛИ ВСЕ УРОКИ!** 🎊"
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -703,7 +623,7 @@ async def finish_quiz(message: types.Message, user_id_str: str, lesson_id: int):
     
     await message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
 
-@router.callback_query(lambda c: c.data == "cancel_quiz")
+@router.callback_query(callback_route("cancel_quiz"))
 async def cancel_quiz(callback: types.CallbackQuery):
     """Отменяет тестирование"""
     user_id = str(callback.from_user.id)
@@ -721,7 +641,7 @@ async def cancel_quiz(callback: types.CallbackQuery):
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
     await callback.answer()
 
-@router.callback_query(lambda c: c.data == "back_to_lessons")
+@router.callback_query(callback_route("back_to_lessons"))
 async def back_to_lessons(callback: types.CallbackQuery):
     """Возврат к списку уроков"""
     # Очищаем состояние теста, если оно есть
@@ -737,7 +657,7 @@ async def back_to_lessons(callback: types.CallbackQuery):
     )
     await callback.answer()
 
-@router.callback_query(lambda c: c.data == "review_lessons")
+@router.callback_query(callback_route("review_lessons"))
 async def review_lessons(callback: types.CallbackQuery):
     """Показывает пройденные уроки"""
     user_id = callback.from_user.id
@@ -752,7 +672,7 @@ async def review_lessons(callback: types.CallbackQuery):
     else:
         text = "📚 **Пройденные уроки:**\n\n"
         for lesson_id in completed:
-            lesson = next((l for l in LESSONS if l["id"] == lesson_id), None)
+            lesson = LESSONS_BY_ID.get(lesson_id)
             if lesson:
                 text += f"✅ Урок {lesson['id']}: {lesson['title']}\n"
         
@@ -761,7 +681,7 @@ async def review_lessons(callback: types.CallbackQuery):
         # Создаём клавиатуру с пройденными уроками
         keyboard = InlineKeyboardMarkup(inline_keyboard=[])
         for lesson_id in completed:
-            lesson = next((l for l in LESSONS if l["id"] == lesson_id), None)
+            lesson = LESSONS_BY_ID.get(lesson_id)
             if lesson:
                 keyboard.inline_keyboard.append([
                     InlineKeyboardButton(
@@ -777,15 +697,14 @@ async def review_lessons(callback: types.CallbackQuery):
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
     await callback.answer()
 
-@router.callback_query(lambda c: c.data == "certificate")
+@router.callback_query(callback_route("certificate"))
 async def show_certificate(callback: types.CallbackQuery):
     """Показывает сертификат об окончании"""
     user_id = callback.from_user.id
     progress = await get_user_progress(user_id)
-    completed = progress["completed"]
     earned = progress["rewards"]
     
-    if len(completed) == len(LESSONS):
+    if progress["completed_mask"] & ALL_LESSONS_MASK == ALL_LESSONS_MASK:
         text = f"""🏆 **СЕРТИФИКАТ ОБ ОКОНЧАНИИ**
 
 Удостоверяем, что пользователь **{callback.from_user.first_name}**
@@ -827,4 +746,4 @@ module_info = {
 
 register_module(module_info)
 
-print(f"✅ Модуль lessons загружен. Уроков: {len(LESSONS)}, Тестов: {len(QUIZZES)}")
+logger.info("✅ Модуль lessons загружен. Уроков: %d, Тестов: %d", len(LESSONS), len(QUIZZES))
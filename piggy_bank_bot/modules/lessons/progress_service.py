@@ -0,0 +1,101 @@
+# modules/lessons/progress_service.py
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from shared.storage import LessonProgressStore
+
+def mask_to_ids(mask: int) -> Tuple[int, ...]:
+    """id уроков из битовой маски по возрастанию"""
+    return tuple(bit for bit in range(mask.bit_length()) if mask >> bit & 1)
+
+
+class UserProgress:
+    """Прогресс пользователя в компактном виде"""
+    __slots__ = ("db_user_id", "completed_mask", "rewards", "spw_balance")
+    
+    def __init__(self, db_user_id: Optional[int], completed_mask: int, rewards: int, spw_balance: int):
+        self.db_user_id = db_user_id
+        self.completed_mask = completed_mask  # бит N — урок N пройден
+        self.rewards = rewards
+        self.spw_balance = spw_balance
+    
+    def has(self, lesson_id: int) -> bool:
+        """Пройден ли урок (проверка бита)"""
+        return bool(self.completed_mask >> lesson_id & 1)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Формат, который ждут обработчики модуля"""
+        return {
+            "completed": mask_to_ids(self.completed_mask),
+            "completed_mask": self.completed_mask,
+            "rewards": self.rewards,
+            "db_user_id": self.db_user_id,
+            "spw_balance": self.spw_balance
+        }
+
+
+class ProgressService:
+    """
+    Прогресс обучения с LRU+TTL кешем по telegram_id.
+    
+    Меню уроков читают прогресс из кеша без запросов к базе.
+    Прохождение урока обновляет запись кеша на месте результатом
+    той же транзакции, которая записала урок (см. complete_lesson).
+    """
+    
+    def __init__(self, store: LessonProgressStore, rewards: Mapping[int, int],
+                 max_size: int = 10000, ttl: float = 300):
+        self.store = store
+        # id урока → награда за первое прохождение
+        self.rewards = dict(rewards)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache: "OrderedDict[int, Tuple[float, UserProgress]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def _remember(self, telegram_id: int, progress: UserProgress) -> UserProgress:
+        self._cache[telegram_id] = (time.monotonic() + self.ttl, progress)
+        self._cache.move_to_end(telegram_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return progress
+    
+    def invalidate(self, telegram_id: int):
+        """Забыть прогресс пользователя (следующее чтение пойдёт в базу)"""
+        self._cache.pop(telegram_id, None)
+    
+    async def get(self, telegram_id: int) -> UserProgress:
+        """Прогресс пользователя; новый пользователь создаётся в базе"""
+        cached = self._cache.get(telegram_id)
+        if cached is not None:
+            expires, progress = cached
+            if expires > time.monotonic():
+                self._cache.move_to_end(telegram_id)
+                self.hits += 1
+                return progress
+            del self._cache[telegram_id]
+        
+        self.misses += 1
+        return self._remember(telegram_id, await self._load(telegram_id))
+    
+    async def _load(self, telegram_id: int) -> UserProgress:
+        row = await self.store.get_progress(telegram_id)
+        return UserProgress(row["db_user_id"], row["completed_mask"], row["rewards_earned"], row["spw_balance"])
+    
+    async def complete_lesson(self, telegram_id: int, lesson_id: int, quiz_score: int) -> Tuple[UserProgress, bool]:
+        """
+        Засчитать урок (одна транзакция в базе) и обновить кеш.
+        Возвращает новый прогресс и признак первого прохождения.
+        """
+        try:
+            result = await self.store.complete_lesson(telegram_id, lesson_id, quiz_score, self.rewards.get(lesson_id, 0))
+        except Exception:
+            # Состояние в базе неизвестно — кеш не должен ему противоречить
+            self.invalidate(telegram_id)
+            raise
+        progress = UserProgress(
+            result["db_user_id"], result["completed_mask"], result["rewards_earned"], result["spw_balance"]
+        )
+        return self._remember(telegram_id, progress), result["newly_completed"]
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence, Set
+
+from .models import LatestBalance
+from .repository import WalletRepository, wallet_repository
+from .ton_service import TONService
+from shared.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceService:
+    """
+    Балансы кошельков для /balance: ответ — из последних сохранённых
+    балансов (wallet_latest_balance), обновление из TON API — в фоне.
+    
+    Баланс свежий fresh_ttl секунд. Адрес, который уже запрашивается
+    у TON API, не запрашивается второй раз: все ждут один ответ.
+    """
+    
+    def __init__(self, repository: WalletRepository, api_key: Optional[str] = None, fresh_ttl: float = 60):
+        self.repository = repository
+        self.api_key = api_key
+        self.fresh_ttl = fresh_ttl
+        # Адрес → запрос к TON API, который сейчас выполняется
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Фоновые обновления (ссылки держим, иначе задачу может собрать GC)
+        self._background: Set[asyncio.Task] = set()
+        self.api_fetches = 0
+    
+    def is_fresh(self, balance: Optional[LatestBalance]) -> bool:
+        if balance is None:
+            return False
+        # updated_at — в UTC с поясом (см. repository._to_latest)
+        return datetime.now(timezone.utc) - balance.updated_at < timedelta(seconds=self.fresh_ttl)
+    
+    async def get_cached(self, wallet_addresses: Sequence[str]) -> Dict[str, LatestBalance]:
+        """Последние сохранённые балансы (адрес → баланс)"""
+        return await self.repository.get_latest_balances(wallet_addresses)
+    
+    async def refresh(self, wallet_addresses: Sequence[str]) -> Dict[str, LatestBalance]:
+        """
+        Получить балансы из TON API и сохранить их.
+        Адреса, которые не удалось получить (TONAPIError), в ответ
+        не попадают и не сохраняются: сохранённый баланс остаётся прежним.
+        """
+        tasks: Dict[str, asyncio.Task] = {}
+        owned = []
+        async with TONService(self.api_key) as ton_service:
+            for address in dict.fromkeys(wallet_addresses):
+                task = self._inflight.get(address)
+                if task is None:
+                    task = asyncio.ensure_future(self._fetch(ton_service, address))
+                    self._inflight[address] = task
+                    task.add_done_callback(lambda _, address=address: self._inflight.pop(address, None))
+                    owned.append(address)
+                tasks[address] = task
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        
+        balances = {}
+        for address, result in zip(tasks, results):
+            if isinstance(result, BaseException):
+                logger.error("Ошибка получения баланса для %s: %s", address, result)
+            else:
+                balances[address] = result
+        # Сохраняет тот, кто запрашивал: остальные ждали чужой запрос
+        await self.repository.save_latest_balances([balances[address] for address in owned if address in balances])
+        return balances
+    
+    async def _fetch(self, ton_service: TONService, address: str) -> LatestBalance:
+        self.api_fetches += 1
+        balances = await ton_service.get_wallet_balances(address)
+        return LatestBalance(
+            wallet_address=address,
+            ton_balance=balances["ton_balance"],
+            spw_balance=balances["spw_balance"],
+            updated_at=balances["last_updated"]
+        )
+    
+    def spawn(self, coro) -> asyncio.Task:
+        """Запустить фоновое обновление (ошибки coro обрабатывает сама)"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+    
+    async def wait_idle(self):
+        """Дождаться всех фоновых обновлений"""
+        while self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+
+# Глобальный экземпляр
+balance_service = BalanceService(wallet_repository, api_key=config.TON_API_KEY, fresh_ttl=config.BALANCE_FRESH_TTL)
@@ -0,0 +1,107 @@
+-- Миграция: wallet_balance_history → секционированная по месяцам таблица
+-- с индексами (wallet_address | telegram_id, recorded_at DESC, id DESC).
+--
+-- Для баз, где wallet_balance_history создана раньше обычной таблицей;
+-- новые базы создаются сразу по schema.sql. Функции секций объявлены и здесь.
+-- Всё в одной транзакции: при ошибке старая таблица остаётся как была.
+
+BEGIN;
+
+ALTER TABLE wallet_balance_history RENAME TO wallet_balance_history_old;
+
+-- RENAME не переименовывает ограничения: первичный ключ старой таблицы
+-- остался wallet_balance_history_pkey и занял бы имя ключа новой
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'wallet_balance_history_old'::regclass
+          AND conname = 'wallet_balance_history_pkey'
+    ) THEN
+        ALTER TABLE wallet_balance_history_old
+            RENAME CONSTRAINT wallet_balance_history_pkey TO wallet_balance_history_old_pkey;
+    END IF;
+END;
+$$;
+
+-- Имена индексов старой таблицы могли совпасть с новыми
+DROP INDEX IF EXISTS idx_history_wallet_recorded;
+DROP INDEX IF EXISTS idx_history_telegram_recorded;
+
+CREATE TABLE wallet_balance_history (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    telegram_id BIGINT NOT NULL,
+    wallet_address TEXT NOT NULL,
+    ton_balance NUMERIC(40, 0) NOT NULL,
+    spw_balance NUMERIC(40, 0) NOT NULL,
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    CONSTRAINT wallet_balance_history_pkey PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+CREATE TABLE wallet_balance_history_default
+    PARTITION OF wallet_balance_history DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_balance_history_partition(month DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := 'wallet_balance_history_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF wallet_balance_history FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ensure_balance_history_partitions(months_ahead INTEGER DEFAULT 2)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        PERFORM create_balance_history_partition((CURRENT_DATE + make_interval(months => i))::DATE);
+    END LOOP;
+END;
+$$;
+
+-- Секции для всех месяцев старых данных и на два месяца вперёд —
+-- до переноса строк, чтобы ничего не попало в секцию по умолчанию
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    SELECT date_trunc('month', MIN(recorded_at))::DATE INTO month FROM wallet_balance_history_old;
+    WHILE month IS NOT NULL AND month < date_trunc('month', CURRENT_DATE)::DATE LOOP
+        PERFORM create_balance_history_partition(month);
+        month := (month + INTERVAL '1 month')::DATE;
+    END LOOP;
+    PERFORM ensure_balance_history_partitions();
+END;
+$$;
+
+-- Балансы раньше могли храниться строками; id без значения получает новый UUID
+INSERT INTO wallet_balance_history (id, telegram_id, wallet_address, ton_balance, spw_balance, recorded_at)
+SELECT
+    COALESCE(id::UUID, gen_random_uuid()),
+    telegram_id,
+    wallet_address,
+    ton_balance::NUMERIC(40, 0),
+    spw_balance::NUMERIC(40, 0),
+    COALESCE(recorded_at, NOW())
+FROM wallet_balance_history_old;
+
+-- Индексы — после переноса: так быстрее, чем обновлять их на каждой строке
+CREATE INDEX idx_history_wallet_recorded
+    ON wallet_balance_history (wallet_address, recorded_at DESC, id DESC);
+CREATE INDEX idx_history_telegram_recorded
+    ON wallet_balance_history (telegram_id, recorded_at DESC, id DESC);
+
+ANALYZE wallet_balance_history;
+
+COMMIT;
+
+-- Старая таблица оставлена для проверки; после сверки числа строк:
+-- DROP TABLE wallet_balance_history_old;
@@ -31,4 +31,39 @@ class WalletBalanceHistory:
     spw_balance: Decimal  # В нанотокенах SPW
     recorded_at: datetime  # Когда был записан баланс
     id: Optional[str] = None  # UUID из Supabase
-    telegram_id: Optional[int] = None  # Для связи с пользователем
\ No newline at end of file
+    telegram_id: Optional[int] = None  # Для связи с пользователем
+
+
+@dataclass
+class BalanceSnapshot:
+    """Балансы кошелька для записи в историю"""
+    telegram_id: int
+    wallet_address: str
+    ton_balance: Decimal  # В нанотонах
+    spw_balance: Decimal  # В нанотокенах SPW
+
+
+@dataclass
+class LatestBalance:
+    """Последний известный баланс кошелька"""
+    wallet_address: str
+    ton_balance: Decimal  # В нанотонах
+    spw_balance: Decimal  # В нанотокенах SPW
+    updated_at: datetime  # Когда баланс получен из TON API
+
+
+@dataclass
+class BalancePoint:
+    """Точка ряда балансов: сырая запись или агрегат за час/сутки"""
+    wallet_address: str
+    resolution: str  # "raw", "hour" или "day"
+    bucket_start: datetime  # Время записи или начало корзины
+    ton_open: Decimal  # В нанотонах
+    ton_close: Decimal
+    ton_min: Decimal
+    ton_max: Decimal
+    spw_open: Decimal  # В нанотокенах SPW
+    spw_close: Decimal
+    spw_min: Decimal
+    spw_max: Decimal
+    samples: int = 1  # Сколько сырых записей в точке
@@ -8,13 +8,19 @@ from decimal import Decimal
 from datetime import datetime
 
 from .ton_service import TONService
-from .repository import WalletRepository
+from .models import BalanceSnapshot
+from .repository import wallet_repository
+from .balance_service import balance_service
 from shared.config import config
 from core.module_manager import register_module
+from core.metrics import metrics
+from core.dispatch_index import text_route
 
 
 logger = logging.getLogger(__name__)
 router = Router()
+# Только для форматирования балансов, без сессии
+balance_formatter = TONService()
 
 # Состояния FSM
 class WalletStates(StatesGroup):
@@ -49,7 +55,7 @@ async def cmd_wallet(message: Message):
 
 
 @router.message(Command("connect_wallet"))
-@router.message(lambda message: message.text and message.text in ["➕ Добавить", "➕ Добавить кошелек"])
+@router.message(text_route("➕ Добавить", "➕ Добавить кошелек"))
 async def cmd_connect_wallet(message: Message, state: FSMContext, command: CommandObject = None):
     """Привязать новый кошелек"""
     if command and command.args:
@@ -122,8 +128,7 @@ async def process_wallet_name(message: Message, state: FSMContext):
     friendly_name = message.text.strip() if message.text != "/skip" else None
     
     # Сохраняем в базу
-    repo = WalletRepository()
-    success = await repo.add_wallet(message.from_user.id, address, friendly_name)
+    success = await wallet_repository.add_wallet(message.from_user.id, address, friendly_name)
     
     if success:
         # Укорачиваем адрес для отображения
@@ -151,11 +156,10 @@ async def process_wallet_name(message: Message, state: FSMContext):
 
 
 @router.message(Command("my_wallets"))
-@router.message(lambda message: message.text and message.text in ["👛 Кошельки", "👛 Мои кошельки"])
+@router.message(text_route("👛 Кошельки", "👛 Мои кошельки"))
 async def cmd_my_wallets(message: Message):
     """Список кошельков"""
-    repo = WalletRepository()
-    wallets = await repo.get_user_wallets(message.from_user.id)
+    wallets = await wallet_repository.get_user_wallets(message.from_user.id)
     
     if not wallets:
         await message.answer(
@@ -179,63 +183,106 @@ async def cmd_my_wallets(message: Message):
     await message.answer(text, parse_mode="Markdown")
 
 
-@router.message(Command("balance"))
-@router.message(lambda message: message.text and message.text in ["📊 Баланс", "📊 Мой баланс"])
-async def cmd_balance(message: Message):
-    """Проверка баланса"""
-    repo = WalletRepository()
-    wallets = await repo.get_user_wallets(message.from_user.id)
-    
-    if not wallets:
-        await message.answer(
-            "📭 *Сначала привяжите кошелек*",
-            parse_mode="Markdown"
-        )
-        return
-    
-    await message.answer("⏳ *Проверяю балансы...*", parse_mode="Markdown")
+def format_balances(wallets, balances, pending=(), failed=()) -> str:
+    """
+    Текст ответа /balance
     
+    Args:
+        wallets: Кошельки пользователя
+        balances: Адрес → последний известный баланс
+        pending: Адреса, которые сейчас обновляются из TON API
+        failed: Адреса, которые не удалось обновить
+    """
     total_ton = Decimal(0)
     total_spw = Decimal(0)
     text = "💎 *Балансы:*\n\n"
     has_data = False
+    oldest = None
     
-    async with TONService(config.TON_API_KEY) as ton_service:
-        for i, wallet in enumerate(wallets, 1):
-            try:
-                balances = await ton_service.get_wallet_balances(wallet.wallet_address)
-                
-                name = wallet.friendly_name or f"Кошелек {i}"
-                short_addr = wallet.wallet_address[:8] + "..." + wallet.wallet_address[-4:]
-                
-                # Если оба баланса 0
-                if balances['ton_balance'] == 0 and balances['spw_balance'] == 0:
-                    text += f"*{name}* (`{short_addr}`)\n"
-                    text += "Баланс: 0.00 TON, 0.00 SPW\n\n"
-                else:
-                    text += f"*{name}* (`{short_addr}`)\n"
-                    text += f"TON: {balances['ton_human']}\n"
-                    text += f"SPW: {balances['spw_human']}\n\n"
-                    
-                    total_ton += balances['ton_balance']
-                    total_spw += balances['spw_balance']
-                    has_data = True
-                    
-            except Exception as e:
-                logger.error(f"Ошибка: {e}")
-                text += f"*{wallet.friendly_name or f'Кошелек {i}'}* - ❌ Ошибка\n\n"
+    for i, wallet in enumerate(wallets, 1):
+        name = wallet.friendly_name or f"Кошелек {i}"
+        short_addr = wallet.wallet_address[:8] + "..." + wallet.wallet_address[-4:]
+        balance = balances.get(wallet.wallet_address)
+        
+        if balance is None:
+            if wallet.wallet_address in failed:
+                text += f"*{name}* - ❌ Ошибка\n\n"
+            else:
+                text += f"*{name}* (`{short_addr}`)\n"
+                text += "⏳ Загружается...\n\n"
+            continue
+        
+        oldest = balance.updated_at if oldest is None else min(oldest, balance.updated_at)
+        # Если оба баланса 0
+        if balance.ton_balance == 0 and balance.spw_balance == 0:
+            text += f"*{name}* (`{short_addr}`)\n"
+            text += "Баланс: 0.00 TON, 0.00 SPW\n\n"
+        else:
+            text += f"*{name}* (`{short_addr}`)\n"
+            text += f"TON: {balance_formatter.format_balance(balance.ton_balance, 9)}\n"
+            text += f"SPW: {balance_formatter.format_balance(balance.spw_balance, 9)}\n\n"
+            
+            total_ton += balance.ton_balance
+            total_spw += balance.spw_balance
+            has_data = True
     
     if has_data:
-        ton_total = ton_service.format_balance(total_ton, 9)
-        spw_total = ton_service.format_balance(total_spw, 9)
-        
         text += f"💰 *Итого:*\n"
-        text += f"TON: *{ton_total}*\n"
-        text += f"SPW: *{spw_total}*\n"
+        text += f"TON: *{balance_formatter.format_balance(total_ton, 9)}*\n"
+        text += f"SPW: *{balance_formatter.format_balance(total_spw, 9)}*\n"
+    
+    if oldest is not None:
+        # updated_at — в UTC, пользователю показываем местное время сервера
+        oldest = oldest.astimezone()
+        time_format = '%H:%M' if oldest.date() == datetime.now().date() else '%d.%m.%Y %H:%M'
+        text += f"\n_Обновлено: {oldest.strftime(time_format)}_"
+    if pending:
+        text += "\n_⏳ Обновляю балансы..._"
+    
+    return text
+
+
+async def refresh_balances(message: Message, sent: Message, wallets, balances, stale):
+    """Обновить устаревшие балансы из TON API и отредактировать ответ /balance"""
+    try:
+        fresh = await balance_service.refresh(stale)
+        balances.update(fresh)
+        failed = [address for address in stale if address not in fresh]
+        await message.bot.edit_message_text(
+            format_balances(wallets, balances, failed=failed),
+            chat_id=sent.chat.id,
+            message_id=sent.message_id,
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        logger.error("Ошибка обновления балансов: %s", e)
+
+
+@router.message(Command("balance"))
+@router.message(text_route("📊 Баланс", "📊 Мой баланс"))
+async def cmd_balance(message: Message):
+    """
+    Проверка баланса
     
-    text += f"\n_Обновлено: {datetime.now().strftime('%H:%M')}_"
+    Ответ сразу — из последних сохранённых балансов; устаревшие
+    и ещё не известные обновляются в фоне, затем ответ редактируется
+    """
+    wallets = await wallet_repository.get_user_wallets(message.from_user.id)
     
-    await message.answer(text, parse_mode="Markdown")
+    if not wallets:
+        await message.answer(
+            "📭 *Сначала привяжите кошелек*",
+            parse_mode="Markdown"
+        )
+        return
+    
+    addresses = [wallet.wallet_address for wallet in wallets]
+    balances = await balance_service.get_cached(addresses)
+    stale = [address for address in addresses if not balance_service.is_fresh(balances.get(address))]
+    
+    sent = await message.answer(format_balances(wallets, balances, pending=stale), parse_mode="Markdown")
+    if stale:
+        balance_service.spawn(refresh_balances(message, sent, wallets, balances, stale))
 
 
 @router.message(Command("save_balance"))
@@ -244,8 +291,7 @@ async def cmd_save_balance(message: Message):
     Сохранить текущие балансы всех кошельков в историю
     Используется для ручного сохранения статистики
     """
-    repo = WalletRepository()
-    wallets = await repo.get_user_wallets(message.from_user.id)
+    wallets = await wallet_repository.get_user_wallets(message.from_user.id)
     
     if not wallets:
         await message.answer(
@@ -256,7 +302,7 @@ async def cmd_save_balance(message: Message):
     
     await message.answer("⏳ *Получаю балансы и сохраняю в историю...*", parse_mode="Markdown")
     
-    saved_count = 0
+    snapshots = []
     failed_count = 0
     
     async with TONService(config.TON_API_KEY) as ton_service:
@@ -264,23 +310,20 @@ async def cmd_save_balance(message: Message):
             try:
                 # Получаем текущие балансы
                 balances = await ton_service.get_wallet_balances(wallet.wallet_address)
-                
-                # Сохраняем в историю
-                success = await repo.save_balance_history(
+                snapshots.append(BalanceSnapshot(
                     telegram_id=message.from_user.id,
                     wallet_address=wallet.wallet_address,
                     ton_balance=balances['ton_balance'],
                     spw_balance=balances['spw_balance']
-                )
-                
-                if success:
-                    saved_count += 1
-                else:
-                    failed_count += 1
-                    
+                ))
             except Exception as e:
-                logger.error(f"Ошибка сохранения баланса для {wallet.wallet_address}: {e}")
+                logger.error(f"Ошибка получения баланса для {wallet.wallet_address}: {e}")
                 failed_count += 1
+                
+    # Сохраняем в историю одним запросом
+    results = await wallet_repository.save_balance_history_batch(snapshots)
+    saved_count = sum(results)
+    failed_count += len(results) - saved_count
     
     # Формируем сообщение о результате
     result_text = "✅ *Балансы сохранены в историю!*\n\n"
@@ -295,11 +338,10 @@ async def cmd_save_balance(message: Message):
 
 
 @router.message(Command("remove_wallet"))
-@router.message(lambda message: message.text and message.text in ["❌ Удалить", "❌ Удалить кошелек"])
+@router.message(text_route("❌ Удалить", "❌ Удалить кошелек"))
 async def cmd_remove_wallet(message: Message):
     """Удаление кошелька"""
-    repo = WalletRepository()
-    wallets = await repo.get_user_wallets(message.from_user.id)
+    wallets = await wallet_repository.get_user_wallets(message.from_user.id)
     
     if not wallets:
         await message.answer("📭 *Нет кошельков для удаления*", parse_mode="Markdown")
@@ -321,18 +363,15 @@ async def cmd_remove_wallet(message: Message):
     )
 
 
-@router.message(lambda message: message.text and message.text.startswith("🗑️ "))
-async def process_remove(message: Message):
+@router.message(text_route("🗑️ {selected}"))
+async def process_remove(message: Message, selected: str):
     """Обработка удаления"""
-    repo = WalletRepository()
-    wallets = await repo.get_user_wallets(message.from_user.id)
-    
-    selected = message.text.replace("🗑️ ", "")
+    wallets = await wallet_repository.get_user_wallets(message.from_user.id)
     
     for wallet in wallets:
         name = wallet.friendly_name or wallet.wallet_address[:15] + "..."
         if name == selected:
-            success = await repo.remove_wallet(message.from_user.id, wallet.wallet_address)
+            success = await wallet_repository.remove_wallet(message.from_user.id, wallet.wallet_address)
             if success:
                 await message.answer(f"✅ Кошелек '{name}' удален", reply_markup=get_main_keyboard())
             else:
@@ -342,7 +381,7 @@ async def process_remove(message: Message):
     await message.answer("❌ Кошелек не найден", reply_markup=get_main_keyboard())
 
 
-@router.message(lambda message: message.text and message.text == "🔙 Назад")
+@router.message(text_route("🔙 Назад"))
 async def cmd_back(message: Message):
     """Назад в меню"""
     await message.answer("Меню:", reply_markup=get_main_keyboard())
@@ -375,4 +414,11 @@ module_info = {
     "router": router
 }
 
-register_module(module_info)
\ No newline at end of file
+register_module(module_info)
+
+metrics.register_counter("bot_wallet_cache_hits_total", "Wallet lists served from the repository cache",
+                         lambda: wallet_repository.cache_hits)
+metrics.register_counter("bot_wallet_cache_misses_total", "Wallet lists loaded from storage",
+                         lambda: wallet_repository.cache_misses)
+metrics.register_counter("bot_wallet_balance_fetches_total", "Wallet balances fetched from TON API",
+                         lambda: balance_service.api_fetches)
@@ -1,38 +1,135 @@
 import logging
-from typing import List, Optional
-from datetime import datetime
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from .models import Wallet, WalletBalanceHistory
-from shared.database import db
+from .models import BalancePoint, BalanceSnapshot, LatestBalance, Wallet, WalletBalanceHistory
+from shared.config import config
+from shared.db_manager import db_manager
+from shared.storage import Row, Storage
+from shared.storage.rollups import RESOLUTIONS, bucket_start
 
 logger = logging.getLogger(__name__)
 
+# Строк истории в одном INSERT
+HISTORY_CHUNK_SIZE = 500
+# Строк истории в одной странице при потоковом чтении
+HISTORY_PAGE_SIZE = 500
+# Ряды балансов: окна не длиннее этого читаются из сырых записей
+SERIES_RAW_WINDOW = timedelta(days=1)
+# Ряды балансов: не больше стольких корзин на кошелёк
+SERIES_MAX_POINTS = 500
+
+
+def _to_wallet(row: Row) -> Wallet:
+    return Wallet(
+        id=row.get("id"),
+        telegram_id=row["telegram_id"],
+        wallet_address=row["wallet_address"],
+        friendly_name=row.get("friendly_name"),
+        created_at=datetime.fromisoformat(row["created_at"]) if row.get("created_at") else None
+    )
+
+
+def _to_history(row: Row) -> WalletBalanceHistory:
+    return WalletBalanceHistory(
+        id=row.get("id"),
+        telegram_id=row.get("telegram_id"),
+        wallet_address=row["wallet_address"],
+        ton_balance=Decimal(row["ton_balance"]),
+        spw_balance=Decimal(row["spw_balance"]),
+        recorded_at=datetime.fromisoformat(row["recorded_at"])
+    )
+
+
+def _as_utc(moment: datetime) -> datetime:
+    """Момент в UTC с поясом; время без пояса считается местным"""
+    return moment.astimezone(timezone.utc)
+
+
+def _to_latest(row: Row) -> LatestBalance:
+    return LatestBalance(
+        wallet_address=row["wallet_address"],
+        ton_balance=Decimal(row["ton_balance"]),
+        spw_balance=Decimal(row["spw_balance"]),
+        updated_at=_as_utc(datetime.fromisoformat(row["updated_at"]))
+    )
+
+
+def _latest_row(balance: LatestBalance) -> Row:
+    return {
+        "wallet_address": balance.wallet_address,
+        "ton_balance": str(balance.ton_balance),
+        "spw_balance": str(balance.spw_balance),
+        "updated_at": _as_utc(balance.updated_at).isoformat()
+    }
+
+
+def _raw_point(row: Row) -> BalancePoint:
+    ton = Decimal(row["ton_balance"])
+    spw = Decimal(row["spw_balance"])
+    return BalancePoint(
+        wallet_address=row["wallet_address"],
+        resolution="raw",
+        bucket_start=datetime.fromisoformat(row["recorded_at"]),
+        ton_open=ton, ton_close=ton, ton_min=ton, ton_max=ton,
+        spw_open=spw, spw_close=spw, spw_min=spw, spw_max=spw
+    )
+
+
+def _rollup_point(row: Row) -> BalancePoint:
+    return BalancePoint(
+        wallet_address=row["wallet_address"],
+        resolution=row["resolution"],
+        bucket_start=datetime.fromisoformat(row["bucket_start"]),
+        ton_open=Decimal(row["ton_open"]),
+        ton_close=Decimal(row["ton_close"]),
+        ton_min=Decimal(row["ton_min"]),
+        ton_max=Decimal(row["ton_max"]),
+        spw_open=Decimal(row["spw_open"]),
+        spw_close=Decimal(row["spw_close"]),
+        spw_min=Decimal(row["spw_min"]),
+        spw_max=Decimal(row["spw_max"]),
+        samples=row["samples"]
+    )
+
 
 class WalletRepository:
-    def __init__(self):
-        self.client = db.get_client()
+    """
+    Кошельки и история балансов поверх хранилищ shared.storage.
+    
+    Бэкенд (Supabase, SQLite, память) выбирает db_manager; репозиторий
+    переводит строки в модели и не пропускает ошибки хранилища в обработчики.
+    
+    Списки кошельков кешируются по пользователю (LRU на cache_size
+    пользователей, запись живёт cache_ttl секунд): меню кошельков не ходят
+    в базу. add_wallet и remove_wallet сбрасывают запись пользователя.
+    """
+    
+    def __init__(self, storage: Optional[Storage] = None, cache_size: int = 10000, cache_ttl: float = 300,
+                 raw_retention_days: int = 0):
+        self.storage = storage or db_manager.get_storage()
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # Сырые записи старше стольких дней могут быть удалены (0 — хранятся всегда)
+        self.raw_retention_days = raw_retention_days
+        # telegram_id → (до какого момента запись свежая, кошельки)
+        self._wallets: "OrderedDict[int, Tuple[float, Tuple[Wallet, ...]]]" = OrderedDict()
+        # Растёт при каждом сбросе: чтение, начатое до сброса, не кладёт старый список в кеш
+        self._generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def invalidate(self, telegram_id: int):
+        """Забыть кошельки пользователя (следующее чтение пойдёт в базу)"""
+        self._generation += 1
+        self._wallets.pop(telegram_id, None)
 
     async def create_user(self, telegram_id: int, username: str = None) -> bool:
         """Создать нового пользователя"""
         try:
-            # Проверяем существует ли уже пользователь
-            existing = self.client.table("users") \
-                .select("telegram_id") \
-                .eq("telegram_id", telegram_id) \
-                .execute()
-            
-            if existing.data:
-                return True
-            
-            # Создаем нового пользователя
-            user_data = {
-                "telegram_id": telegram_id,
-                "username": username,
-                "created_at": datetime.now().isoformat()
-            }
-            
-            result = self.client.table("users").insert(user_data).execute()
-            return len(result.data) > 0
+            return await self.storage.users.ensure_user(telegram_id, username)
         except Exception as e:
             logger.error(f"Error creating user: {e}")
             return False
@@ -40,76 +137,53 @@ class WalletRepository:
     async def add_wallet(self, telegram_id: int, wallet_address: str, friendly_name: str = None) -> bool:
         """Добавить кошелек пользователю"""
         try:
-            # Сначала создаем пользователя если его нет
-            await self.create_user(telegram_id, username=None)
-            
-            # Проверяем нет ли уже такого кошелька у пользователя
-            existing = await self.wallet_exists(telegram_id, wallet_address)
-            if existing:
-                return False
-            
-            wallet_data = {
-                "telegram_id": telegram_id,
-                "wallet_address": wallet_address,
-                "friendly_name": friendly_name,
-                "created_at": datetime.now().isoformat()
-            }
-            
-            result = self.client.table("wallets").insert(wallet_data).execute()
-            return len(result.data) > 0
+            return await self.storage.wallets.add_wallet(telegram_id, wallet_address, friendly_name)
         except Exception as e:
             logger.error(f"Error adding wallet: {e}")
             return False
+        finally:
+            # И при ошибке: запись могла дойти до базы
+            self.invalidate(telegram_id)
 
     async def get_user_wallets(self, telegram_id: int) -> List[Wallet]:
         """Получить все кошельки пользователя"""
+        cached = self._wallets.get(telegram_id)
+        if cached is not None:
+            expires, wallets = cached
+            if expires > time.monotonic():
+                self._wallets.move_to_end(telegram_id)
+                self.cache_hits += 1
+                return list(wallets)
+            del self._wallets[telegram_id]
+        
+        self.cache_misses += 1
+        generation = self._generation
         try:
-            result = self.client.table("wallets") \
-                .select("*") \
-                .eq("telegram_id", telegram_id) \
-                .order("created_at", desc=True) \
-                .execute()
-            
-            wallets = []
-            for row in result.data:
-                wallet = Wallet(
-                    id=row.get("id"),
-                    telegram_id=row["telegram_id"],
-                    wallet_address=row["wallet_address"],
-                    friendly_name=row.get("friendly_name"),
-                    created_at=datetime.fromisoformat(row["created_at"]) if row.get("created_at") else None
-                )
-                wallets.append(wallet)
-            
-            return wallets
+            wallets = tuple(_to_wallet(row) for row in await self.storage.wallets.get_user_wallets(telegram_id))
         except Exception as e:
             logger.error(f"Error getting user wallets: {e}")
             return []
+        
+        if generation == self._generation:
+            self._wallets[telegram_id] = (time.monotonic() + self.cache_ttl, wallets)
+            while len(self._wallets) > self.cache_size:
+                self._wallets.popitem(last=False)
+        return list(wallets)
 
     async def remove_wallet(self, telegram_id: int, wallet_address: str) -> bool:
         """Удалить кошелек пользователя"""
         try:
-            result = self.client.table("wallets") \
-                .delete() \
-                .eq("telegram_id", telegram_id) \
-                .eq("wallet_address", wallet_address) \
-                .execute()
-            
-            return len(result.data) > 0
+            return await self.storage.wallets.remove_wallet(telegram_id, wallet_address)
         except Exception as e:
             logger.error(f"Error removing wallet: {e}")
             return False
+        finally:
+            self.invalidate(telegram_id)
 
     async def wallet_exists(self, telegram_id: int, wallet_address: str) -> bool:
         """Проверить, существует ли уже такой кошелек у пользователя"""
         try:
-            result = self.client.table("wallets") \
-                .select("id") \
-                .eq("telegram_id", telegram_id) \
-                .eq("wallet_address", wallet_address) \
-                .execute()
-            
-            return len(result.data) > 0
+            return await self.storage.wallets.wallet_exists(telegram_id, wallet_address)
         except Exception:
             return False
 
@@ -128,25 +202,96 @@ class WalletRepository:
             True если успешно сохранено, False если ошибка
         """
         try:
-            # Подготавливаем данные для записи
-            history_data = {
-                "telegram_id": telegram_id,
-                "wallet_address": wallet_address,
-                "ton_balance": str(ton_balance),  # Преобразуем Decimal в строку для JSON
-                "spw_balance": str(spw_balance),
-                "recorded_at": datetime.now().isoformat()
-            }
-            
-            # Сохраняем в таблицу wallet_balance_history
-            result = self.client.table("wallet_balance_history").insert(history_data).execute()
-            
-            logger.info(f"Баланс сохранён в историю: {wallet_address[:10]}... TON={ton_balance}, SPW={spw_balance}")
-            return len(result.data) > 0
+            saved = await self.storage.history.save_balance(telegram_id, wallet_address, ton_balance, spw_balance)
+            logger.info("Баланс сохранён в историю: %s... TON=%s, SPW=%s", wallet_address[:10], ton_balance, spw_balance)
+            await self.save_latest_balances([
+                LatestBalance(wallet_address, ton_balance, spw_balance, datetime.now(timezone.utc))
+            ])
+            return saved
             
         except Exception as e:
             logger.error(f"Error saving balance history: {e}")
             return False
 
+    async def save_balance_history_batch(self, snapshots: Sequence[BalanceSnapshot],
+                                         chunk_size: int = HISTORY_CHUNK_SIZE) -> List[bool]:
+        """
+        Сохранить балансы нескольких кошельков в историю пачками
+        
+        Args:
+            snapshots: Балансы кошельков
+            chunk_size: Сколько строк записывать одним запросом
+        
+        Returns:
+            Успех по каждому снимку в том же порядке: ошибка запроса
+            помечает неудачными только строки его пачки
+        """
+        recorded_at = datetime.now().isoformat()
+        rows = [
+            {
+                "telegram_id": snapshot.telegram_id,
+                "wallet_address": snapshot.wallet_address,
+                "ton_balance": str(snapshot.ton_balance),
+                "spw_balance": str(snapshot.spw_balance),
+                "recorded_at": recorded_at
+            }
+            for snapshot in snapshots
+        ]
+        
+        results: List[bool] = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                results.extend(await self.storage.history.save_balances(chunk))
+            except Exception as e:
+                logger.error("Error saving balance history batch (%d rows): %s", len(chunk), e)
+                results.extend([False] * len(chunk))
+        
+        logger.info("Балансы сохранены в историю: %d из %d", sum(results), len(results))
+        # Снимки — те же свежие балансы из TON API
+        await self.save_latest_balances([
+            LatestBalance(snapshot.wallet_address, snapshot.ton_balance, snapshot.spw_balance,
+                          _as_utc(datetime.fromisoformat(recorded_at)))
+            for snapshot in snapshots
+        ])
+        return results
+    
+    async def get_latest_balances(self, wallet_addresses: Sequence[str]) -> Dict[str, LatestBalance]:
+        """
+        Последние известные балансы кошельков
+        
+        Args:
+            wallet_addresses: Адреса кошельков
+        
+        Returns:
+            Адрес → баланс; адресов, для которых баланс ещё не получали, нет
+        """
+        try:
+            rows = await self.storage.latest.get_latest(wallet_addresses)
+            return {row["wallet_address"]: _to_latest(row) for row in rows}
+        except Exception as e:
+            logger.error("Error getting latest balances: %s", e)
+            return {}
+    
+    async def save_latest_balances(self, balances: Sequence[LatestBalance]) -> bool:
+        """
+        Запомнить последние балансы кошельков одним запросом
+        
+        Args:
+            balances: Балансы, полученные из TON API
+        
+        Returns:
+            True если успешно сохранено, False если ошибка
+        """
+        if not balances:
+            return True
+        try:
+            await self.storage.latest.save_latest([_latest_row(balance) for balance in balances])
+            return True
+        except Exception as e:
+            logger.error("Error saving latest balances (%d rows): %s", len(balances), e)
+            return False
+    
     async def get_balance_history(self, wallet_address: str, limit: int = 30) -> List[WalletBalanceHistory]:
         """
         Получить историю балансов кошелька
@@ -159,26 +304,7 @@ class WalletRepository:
             Список записей истории балансов, отсортированный по дате (новые первые)
         """
         try:
-            result = self.client.table("wallet_balance_history") \
-                .select("*") \
-                .eq("wallet_address", wallet_address) \
-                .order("recorded_at", desc=True) \
-                .limit(limit) \
-                .execute()
-            
-            history = []
-            for row in result.data:
-                record = WalletBalanceHistory(
-                    id=row.get("id"),
-                    telegram_id=row.get("telegram_id"),
-                    wallet_address=row["wallet_address"],
-                    ton_balance=Decimal(row["ton_balance"]),
-                    spw_balance=Decimal(row["spw_balance"]),
-                    recorded_at=datetime.fromisoformat(row["recorded_at"])
-                )
-                history.append(record)
-            
-            return history
+            return [_to_history(row) for row in await self.storage.history.get_balance_history(wallet_address, limit)]
             
         except Exception as e:
             logger.error(f"Error getting balance history: {e}")
@@ -196,27 +322,121 @@ class WalletRepository:
             Список записей истории балансов всех кошельков пользователя
         """
         try:
-            result = self.client.table("wallet_balance_history") \
-                .select("*") \
-                .eq("telegram_id", telegram_id) \
-                .order("recorded_at", desc=True) \
-                .limit(limit) \
-                .execute()
-            
-            history = []
-            for row in result.data:
-                record = WalletBalanceHistory(
-                    id=row.get("id"),
-                    telegram_id=row.get("telegram_id"),
-                    wallet_address=row["wallet_address"],
-                    ton_balance=Decimal(row["ton_balance"]),
-                    spw_balance=Decimal(row["spw_balance"]),
-                    recorded_at=datetime.fromisoformat(row["recorded_at"])
-                )
-                history.append(record)
-            
-            return history
+            rows = await self.storage.history.get_user_balance_history(telegram_id, limit)
+            return [_to_history(row) for row in rows]
             
         except Exception as e:
             logger.error(f"Error getting user balance history: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+    async def iter_balance_history(self, wallet_address: Optional[str] = None, telegram_id: Optional[int] = None,
+                                   since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                   page_size: int = HISTORY_PAGE_SIZE) -> AsyncIterator[WalletBalanceHistory]:
+        """
+        Потоковое чтение истории балансов (новые первыми)
+        
+        Args:
+            wallet_address: Адрес кошелька (или telegram_id — все кошельки пользователя)
+            telegram_id: ID пользователя в Telegram
+            since: С какого момента (включительно)
+            until: До какого момента (не включая)
+            page_size: Сколько записей читать одним запросом
+        
+        Yields:
+            Записи истории; в памяти одновременно не больше одной страницы.
+            Страницы берутся по курсору (recorded_at, id) последней записи,
+            без OFFSET. Ошибка хранилища не глотается: обрезанная выгрузка
+            хуже, чем сообщение об ошибке
+        """
+        if (wallet_address is None) == (telegram_id is None):
+            raise ValueError("Нужен ровно один фильтр: wallet_address или telegram_id")
+        field, value = ("wallet_address", wallet_address) if wallet_address is not None else ("telegram_id", telegram_id)
+        since_iso = since.isoformat() if since else None
+        until_iso = until.isoformat() if until else None
+        
+        async for row in self._iter_history_rows(field, value, since_iso, until_iso, page_size):
+            yield _to_history(row)
+    
+    async def _iter_history_rows(self, field: str, value, since: Optional[str], until: Optional[str],
+                                 page_size: int = HISTORY_PAGE_SIZE) -> AsyncIterator[Row]:
+        cursor = None
+        while True:
+            rows = await self.storage.history.get_history_page(
+                field, value, since=since, until=until, after=cursor, limit=page_size
+            )
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1]["recorded_at"], rows[-1]["id"])
+
+    def series_resolution(self, since: datetime, until: datetime, max_points: int = SERIES_MAX_POINTS) -> str:
+        """
+        Разрешение ряда для окна [since, until): сырые записи для коротких
+        окон, пока они хранятся, иначе часы, если корзин не больше
+        max_points, иначе сутки
+        """
+        span = until - since
+        raw_kept = (
+            self.raw_retention_days <= 0
+            or since >= datetime.now() - timedelta(days=self.raw_retention_days)
+        )
+        if span <= SERIES_RAW_WINDOW and raw_kept:
+            return "raw"
+        if span <= RESOLUTIONS["hour"] * max_points:
+            return "hour"
+        return "day"
+    
+    async def get_balance_series(self, wallet_address: Optional[str] = None, telegram_id: Optional[int] = None,
+                                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                 max_points: int = SERIES_MAX_POINTS) -> List[BalancePoint]:
+        """
+        Ряд балансов за период (старые первыми)
+        
+        Args:
+            wallet_address: Адрес кошелька (или telegram_id — все кошельки пользователя)
+            telegram_id: ID пользователя в Telegram
+            since: С какого момента (включительно)
+            until: До какого момента (не включая, по умолчанию — сейчас)
+            max_points: Сколько корзин на кошелёк допустимо для часового разрешения
+        
+        Returns:
+            Точки с разрешением series_resolution: длинные окна читаются
+            из часовых/суточных агрегатов, а не из сырых записей. Агрегаты
+            отстают от сырых записей не больше чем на HISTORY_ROLLUP_INTERVAL
+        """
+        if (wallet_address is None) == (telegram_id is None):
+            raise ValueError("Нужен ровно один фильтр: wallet_address или telegram_id")
+        if since is None:
+            raise ValueError("Нужно начало периода: since")
+        until = until or datetime.now()
+        field, value = ("wallet_address", wallet_address) if wallet_address is not None else ("telegram_id", telegram_id)
+        resolution = self.series_resolution(since, until, max_points)
+        
+        try:
+            if resolution == "raw":
+                points = [
+                    _raw_point(row)
+                    async for row in self._iter_history_rows(field, value, since.isoformat(), until.isoformat())
+                ]
+                points.reverse()
+                return points
+            # Корзина, в которую попадает since, тоже нужна
+            start = bucket_start(since, resolution)
+            rows = await self.storage.history.get_rollups(
+                field, value, resolution, since=start.isoformat(), until=until.isoformat()
+            )
+            return [_rollup_point(row) for row in rows]
+        
+        except Exception as e:
+            logger.error("Error getting balance series (%s): %s", resolution, e)
+            return []
+
+
+# Глобальный экземпляр
+wallet_repository = WalletRepository(
+    cache_size=config.WALLET_CACHE_SIZE,
+    cache_ttl=config.WALLET_CACHE_TTL,
+    raw_retention_days=config.HISTORY_RAW_RETENTION_DAYS
+)
\ No newline at end of file
@@ -19,4 +19,246 @@ CREATE TABLE IF NOT EXISTS wallets (
 -- Индексы
 CREATE INDEX IF NOT EXISTS idx_wallets_telegram_id ON wallets(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_wallets_address ON wallets(wallet_address);
-CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+
+-- История балансов кошельков, по месяцам (секционирование по recorded_at).
+-- Ключ секционирования обязан входить в первичный ключ
+CREATE TABLE IF NOT EXISTS wallet_balance_history (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    telegram_id BIGINT NOT NULL,
+    wallet_address TEXT NOT NULL,
+    ton_balance NUMERIC(40, 0) NOT NULL,  -- В нанотонах
+    spw_balance NUMERIC(40, 0) NOT NULL,  -- В нанотокенах SPW
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+-- Строки вне созданных месяцев не теряются
+CREATE TABLE IF NOT EXISTS wallet_balance_history_default
+    PARTITION OF wallet_balance_history DEFAULT;
+
+-- Индексы под оба пути чтения: фильтр + сортировка (recorded_at, id) по убыванию
+-- (курсор страниц — та же пара), создаются и во всех секциях
+CREATE INDEX IF NOT EXISTS idx_history_wallet_recorded
+    ON wallet_balance_history (wallet_address, recorded_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_history_telegram_recorded
+    ON wallet_balance_history (telegram_id, recorded_at DESC, id DESC);
+
+-- Секция одного месяца (month — любая дата внутри месяца)
+CREATE OR REPLACE FUNCTION create_balance_history_partition(month DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := 'wallet_balance_history_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF wallet_balance_history FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+END;
+$$;
+
+-- Секции текущего и months_ahead следующих месяцев.
+-- Запускать раз в месяц, например через pg_cron:
+-- SELECT cron.schedule('balance-history-partitions', '0 0 1 * *', 'SELECT ensure_balance_history_partitions()');
+CREATE OR REPLACE FUNCTION ensure_balance_history_partitions(months_ahead INTEGER DEFAULT 2)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        PERFORM create_balance_history_partition((CURRENT_DATE + make_interval(months => i))::DATE);
+    END LOOP;
+END;
+$$;
+
+SELECT ensure_balance_history_partitions();
+
+-- Последний известный баланс кошелька: /balance отвечает отсюда,
+-- не дожидаясь TON API. Одна строка на адрес
+CREATE TABLE IF NOT EXISTS wallet_latest_balance (
+    wallet_address TEXT PRIMARY KEY,
+    ton_balance NUMERIC(40, 0) NOT NULL,  -- В нанотонах
+    spw_balance NUMERIC(40, 0) NOT NULL,  -- В нанотокенах SPW
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Записать пачку балансов: строка не заменяется более старой (по updated_at).
+-- p_rows — JSON массив объектов wallet_address, ton_balance, spw_balance, updated_at
+CREATE OR REPLACE FUNCTION save_latest_balances(p_rows JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO wallet_latest_balance AS l (wallet_address, ton_balance, spw_balance, updated_at)
+    -- ON CONFLICT не обновляет одну строку дважды: на адрес — самая новая из пачки
+    SELECT DISTINCT ON (r.wallet_address) r.wallet_address, r.ton_balance, r.spw_balance, r.updated_at
+    FROM jsonb_to_recordset(p_rows) AS r(
+        wallet_address TEXT,
+        ton_balance NUMERIC(40, 0),
+        spw_balance NUMERIC(40, 0),
+        updated_at TIMESTAMP WITH TIME ZONE
+    )
+    ORDER BY r.wallet_address, r.updated_at DESC
+    ON CONFLICT (wallet_address) DO UPDATE SET
+        ton_balance = EXCLUDED.ton_balance,
+        spw_balance = EXCLUDED.spw_balance,
+        updated_at = EXCLUDED.updated_at
+    WHERE EXCLUDED.updated_at >= l.updated_at;
+$$;
+
+-- Часовые и суточные агрегаты истории: открытие/закрытие/минимум/максимум.
+-- Длинные периоды читаются отсюда, а не из сырых строк
+CREATE TABLE IF NOT EXISTS wallet_balance_rollups (
+    resolution TEXT NOT NULL CHECK (resolution IN ('hour', 'day')),
+    wallet_address TEXT NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    ton_open NUMERIC(40, 0) NOT NULL,
+    ton_close NUMERIC(40, 0) NOT NULL,
+    ton_min NUMERIC(40, 0) NOT NULL,
+    ton_max NUMERIC(40, 0) NOT NULL,
+    spw_open NUMERIC(40, 0) NOT NULL,
+    spw_close NUMERIC(40, 0) NOT NULL,
+    spw_min NUMERIC(40, 0) NOT NULL,
+    spw_max NUMERIC(40, 0) NOT NULL,
+    samples INTEGER NOT NULL,
+    last_at TIMESTAMP WITH TIME ZONE NOT NULL,  -- Последняя учтённая сырая строка
+    PRIMARY KEY (resolution, wallet_address, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollups_telegram
+    ON wallet_balance_rollups (resolution, telegram_id, bucket_start);
+CREATE INDEX IF NOT EXISTS idx_rollups_last_at
+    ON wallet_balance_rollups (last_at);
+
+-- Досчитать агрегаты. Пересчитываются целиком сутки, в которые попадает
+-- последняя учтённая строка минус час (опоздавшие записи), и всё после них.
+-- Возвращает число обновлённых корзин
+CREATE OR REPLACE FUNCTION refresh_balance_rollups()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    since TIMESTAMP WITH TIME ZONE;
+    affected INTEGER;
+BEGIN
+    -- Обслуживание истории запускает каждый экземпляр бота: работает один, остальные пропускают
+    IF NOT pg_try_advisory_xact_lock(hashtext('wallet_balance_rollups')) THEN
+        RETURN 0;
+    END IF;
+
+    SELECT date_trunc('day', MAX(last_at) - INTERVAL '1 hour') INTO since FROM wallet_balance_rollups;
+
+    INSERT INTO wallet_balance_rollups AS r (
+        resolution, wallet_address, bucket_start, telegram_id,
+        ton_open, ton_close, ton_min, ton_max,
+        spw_open, spw_close, spw_min, spw_max,
+        samples, last_at
+    )
+    SELECT
+        res.resolution,
+        h.wallet_address,
+        date_trunc(res.resolution, h.recorded_at),
+        (array_agg(h.telegram_id ORDER BY h.recorded_at DESC, h.id DESC))[1],
+        (array_agg(h.ton_balance ORDER BY h.recorded_at, h.id))[1],
+        (array_agg(h.ton_balance ORDER BY h.recorded_at DESC, h.id DESC))[1],
+        MIN(h.ton_balance),
+        MAX(h.ton_balance),
+        (array_agg(h.spw_balance ORDER BY h.recorded_at, h.id))[1],
+        (array_agg(h.spw_balance ORDER BY h.recorded_at DESC, h.id DESC))[1],
+        MIN(h.spw_balance),
+        MAX(h.spw_balance),
+        COUNT(*),
+        MAX(h.recorded_at)
+    FROM wallet_balance_history h
+    CROSS JOIN (VALUES ('hour'), ('day')) AS res(resolution)
+    WHERE since IS NULL OR h.recorded_at >= since
+    GROUP BY res.resolution, h.wallet_address, date_trunc(res.resolution, h.recorded_at)
+    ON CONFLICT (resolution, wallet_address, bucket_start) DO UPDATE SET
+        telegram_id = EXCLUDED.telegram_id,
+        ton_open = EXCLUDED.ton_open,
+        ton_close = EXCLUDED.ton_close,
+        ton_min = EXCLUDED.ton_min,
+        ton_max = EXCLUDED.ton_max,
+        spw_open = EXCLUDED.spw_open,
+        spw_close = EXCLUDED.spw_close,
+        spw_min = EXCLUDED.spw_min,
+        spw_max = EXCLUDED.spw_max,
+        samples = EXCLUDED.samples,
+        last_at = EXCLUDED.last_at;
+
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END;
+$$;
+
+-- Удалить сырые строки старше p_before, но не раньше уже агрегированных.
+-- Месяцы целиком раньше границы удаляются DROP секции, остальное — DELETE.
+-- Возвращает число удалённых строк
+CREATE OR REPLACE FUNCTION purge_balance_history(p_before TIMESTAMP WITH TIME ZONE)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    rolled_up TIMESTAMP WITH TIME ZONE;
+    cutoff TIMESTAMP WITH TIME ZONE;
+    part RECORD;
+    removed BIGINT;
+    purged BIGINT := 0;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('wallet_balance_rollups')) THEN
+        RETURN 0;
+    END IF;
+
+    SELECT date_trunc('day', MAX(last_at) - INTERVAL '1 hour') INTO rolled_up FROM wallet_balance_rollups;
+    IF rolled_up IS NULL THEN
+        RETURN 0;
+    END IF;
+    cutoff := LEAST(p_before, rolled_up);
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'wallet_balance_history'::regclass
+          AND c.relname ~ '^wallet_balance_history_[0-9]{4}_[0-9]{2}$'
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= cutoff THEN
+            EXECUTE format('SELECT COUNT(*) FROM %I', part.relname) INTO removed;
+            EXECUTE format('DROP TABLE %I', part.relname);
+            purged := purged + removed;
+        END IF;
+    END LOOP;
+
+    DELETE FROM wallet_balance_history WHERE recorded_at < cutoff;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RETURN purged + removed;
+END;
+$$;
+
+-- Привязка кошелька за один запрос: пользователь создаётся при необходимости,
+-- повторная привязка ничего не меняет. TRUE — кошелёк новый
+CREATE OR REPLACE FUNCTION link_wallet(
+    p_telegram_id BIGINT,
+    p_wallet_address TEXT,
+    p_friendly_name TEXT DEFAULT NULL
+) RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    INSERT INTO users (telegram_id)
+    VALUES (p_telegram_id)
+    ON CONFLICT (telegram_id) DO NOTHING;
+
+    INSERT INTO wallets (telegram_id, wallet_address, friendly_name)
+    VALUES (p_telegram_id, p_wallet_address, p_friendly_name)
+    ON CONFLICT (telegram_id, wallet_address) DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted = 1;
+END;
+$$;
\ No newline at end of file
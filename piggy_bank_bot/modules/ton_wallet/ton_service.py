@@ -4,7 +4,7 @@ import asyncio
 import re
 from typing import Optional, Dict, Any
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +16,10 @@ TON_DECIMALS = 9
 SPW_DECIMALS = 9
 
 
+class TONAPIError(Exception):
+    """Баланс не получен: ошибка TON API, сети или тайм-аут"""
+
+
 class TONService:
     def __init__(self, api_key: str = None):
         self.api_key = api_key
@@ -24,9 +28,9 @@ class TONService:
         # Добавляем Authorization только если ключ есть и не пустой
         if api_key and api_key.strip():
             self.headers["Authorization"] = f"Bearer {api_key}"
-            logger.info("TON API инициализирован с ключом")
+            logger.debug("TON API инициализирован с ключом")
         else:
-            logger.info("TON API инициализирован БЕЗ ключа (публичный доступ)")
+            logger.debug("TON API инициализирован БЕЗ ключа (публичный доступ)")
 
     async def __aenter__(self):
         self.session = aiohttp.ClientSession(headers=self.headers)
@@ -68,38 +72,38 @@ class TONService:
                             return parse_data["non_bounceable"]["b64url"]
                         
         except asyncio.TimeoutError:
-            logger.error(f"Timeout converting address: {raw_address}")
+            logger.error("Timeout converting address: %s", raw_address)
         except Exception as e:
-            logger.error(f"Error converting address: {raw_address}: {type(e).__name__}: {str(e)}")
+            logger.error("Error converting address: %s: %s: %s", raw_address, type(e).__name__, e)
         
         # Если конвертация не удалась, возвращаем исходный адрес
         return raw_address
 
     async def get_ton_balance(self, address: str) -> Decimal:
-        """Получить баланс TON в нанотонах"""
+        """Получить баланс TON в нанотонах (TONAPIError — если не удалось)"""
         try:
             friendly_address = await self.get_user_friendly_address(address)
-            logger.info(f"Getting TON balance for: {address} -> {friendly_address}")
+            logger.debug("Getting TON balance for: %s -> %s", address, friendly_address)
             
             url = f"{TON_API_BASE}/accounts/{friendly_address}"
             async with self.session.get(url, timeout=30) as response:
                 if response.status == 200:
                     data = await response.json()
                     balance = Decimal(data.get("balance", 0))
-                    logger.info(f"TON balance: {balance}")
+                    logger.debug("TON balance: %s", balance)
                     return balance
                 else:
-                    logger.warning(f"TON API error {response.status} for {address}")
-                    return Decimal(0)
+                    raise TONAPIError(f"TON API error {response.status} for {address}")
+        except TONAPIError:
+            raise
         except Exception as e:
-            logger.error(f"Error getting TON balance for {address}: {type(e).__name__}: {str(e)}", exc_info=True)
-            return Decimal(0)
+            raise TONAPIError(f"Error getting TON balance for {address}: {type(e).__name__}: {e}") from e
 
     async def get_spw_balance(self, address: str) -> Decimal:
-        """Получить баланс SPW токена"""
+        """Получить баланс SPW токена (0 — токена нет, TONAPIError — если не удалось)"""
         try:
             friendly_address = await self.get_user_friendly_address(address)
-            logger.info(f"Getting SPW balance for: {address} -> {friendly_address}")
+            logger.debug("Getting SPW balance for: %s -> %s", address, friendly_address)
             
             # Получаем балансы всех токенов
             url = f"{TON_API_BASE}/accounts/{friendly_address}/jettons"
@@ -107,15 +111,19 @@ class TONService:
                 if response.status == 200:
                     data = await response.json()
                     
-                    # Логируем все найденные токены для отладки
-                    logger.info(f"Found {len(data.get('balances', []))} jettons in wallet")
-                    for jetton in data.get("balances", []):
-                        jetton_info = jetton.get("jetton", {})
-                        jetton_address = jetton_info.get("address", "")
-                        jetton_name = jetton_info.get("name", "Unknown")
-                        jetton_symbol = jetton_info.get("symbol", "?")
-                        balance = jetton.get("balance", 0)
-                        logger.info(f"  - {jetton_symbol} ({jetton_name}): {balance} | Address: {jetton_address}")
+                    # Список токенов — только для отладки: на каждый /balance он большой,
+                    # поэтому и в DEBUG ограничен по частоте
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Found %d jettons in wallet", len(data.get("balances", [])),
+                                     extra={"rate_limit": True})
+                        for jetton in data.get("balances", []):
+                            jetton_info = jetton.get("jetton", {})
+                            logger.debug(
+                                "  - %s (%s): %s | Address: %s",
+                                jetton_info.get("symbol", "?"), jetton_info.get("name", "Unknown"),
+                                jetton.get("balance", 0), jetton_info.get("address", ""),
+                                extra={"rate_limit": True}
+                            )
                     
                     # Ищем SPW токен по адресу токена
                     for jetton in data.get("balances", []):
@@ -124,17 +132,17 @@ class TONService:
                         
                         if jetton_address == SPW_TOKEN_ADDRESS:
                             balance = Decimal(jetton.get("balance", 0))
-                            logger.info(f"SPW balance found: {balance}")
+                            logger.debug("SPW balance found: %s", balance)
                             return balance
                     
-                    logger.info(f"SPW token not found. Looking for: {SPW_TOKEN_ADDRESS}")
+                    logger.debug("SPW token not found. Looking for: %s", SPW_TOKEN_ADDRESS)
                     return Decimal(0)  # SPW не найден
                 else:
-                    logger.warning(f"TON API jetsons error {response.status}")
-                    return Decimal(0)
+                    raise TONAPIError(f"TON API jettons error {response.status} for {address}")
+        except TONAPIError:
+            raise
         except Exception as e:
-            logger.error(f"Error getting SPW balance for {address}: {type(e).__name__}: {str(e)}", exc_info=True)
-            return Decimal(0)
+            raise TONAPIError(f"Error getting SPW balance for {address}: {type(e).__name__}: {e}") from e
 
     def format_balance(self, balance: Decimal, decimals: int) -> str:
         """Форматировать баланс для отображения"""
@@ -148,31 +156,23 @@ class TONService:
         return formatted.replace(',', ' ')
 
     async def get_wallet_balances(self, address: str) -> Dict[str, Any]:
-        """Получить все балансы кошелька"""
-        try:
-            # Получаем оба баланса (можно последовательно, чтобы проще было)
-            ton_balance = await self.get_ton_balance(address)
-            spw_balance = await self.get_spw_balance(address)
+        """
+        Получить все балансы кошелька.
+        TONAPIError — если хотя бы один баланс не получен: нули вместо
+        неизвестного баланса не должны попасть в историю и в ответ.
+        """
+        # Получаем оба баланса (можно последовательно, чтобы проще было)
+        ton_balance = await self.get_ton_balance(address)
+        spw_balance = await self.get_spw_balance(address)
             
-            return {
-                "ton_balance": ton_balance,
-                "spw_balance": spw_balance,
-                "ton_human": self.format_balance(ton_balance, TON_DECIMALS),
-                "spw_human": self.format_balance(spw_balance, SPW_DECIMALS),
-                "address": address,
-                "last_updated": datetime.now()
-            }
-        except Exception as e:
-            logger.error(f"Error getting wallet balances: {e}")
-            # Возвращаем нули при ошибке
-            return {
-                "ton_balance": Decimal(0),
-                "spw_balance": Decimal(0),
-                "ton_human": "0.00",
-                "spw_human": "0.00",
-                "address": address,
-                "last_updated": datetime.now()
-            }
+        return {
+            "ton_balance": ton_balance,
+            "spw_balance": spw_balance,
+            "ton_human": self.format_balance(ton_balance, TON_DECIMALS),
+            "spw_human": self.format_balance(spw_balance, SPW_DECIMALS),
+            "address": address,
+            "last_updated": datetime.now(timezone.utc)
+        }
 
     def is_valid_address_format(self, address: str) -> bool:
         """Проверка только формата адреса (без API)"""
@@ -0,0 +1,191 @@
+# shared/async_database.py
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional, TypeVar
+
+from shared.config import config
+from shared.local_database import LocalDatabase, local_db
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+    """Выставить результат в потоке event loop (вызывающий мог уже отменить ожидание)"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncLocalDatabase:
+    """
+    Асинхронный фасад над LocalDatabase.
+    
+    Запросы кладутся в очередь и выполняются выделенными потоками:
+    один поток пишет (запросы на запись выполняются строго по порядку),
+    несколько потоков читают через пул соединений только для чтения.
+    Event loop только ждёт future и не блокируется на диске.
+    
+    Запись — групповой фиксацией: поток-писатель собирает запросы,
+    пришедшие за batch_window секунд (не больше max_batch), и выполняет их
+    одной транзакцией — один fsync на всю пачку. Каждый запрос обёрнут в
+    SAVEPOINT: ошибка откатывает только его, остальные фиксируются.
+    Результат каждому вызывающему отдаётся после COMMIT.
+    """
+    
+    def __init__(self, db: LocalDatabase, batch_window: float = 0.002, max_batch: int = 500):
+        self.db = db
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.batched_writes = 0
+        self._write_requests: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._read_requests: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+    
+    def _start(self):
+        """Потоки запускаются при первом запросе"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._threads.append(threading.Thread(target=self._write_worker, name="db-writer", daemon=True))
+            # По потоку на соединение-читатель: пул никогда не ждёт
+            for i in range(self.db.readers):
+                self._threads.append(threading.Thread(
+                    target=self._worker, args=(self._read_requests,), name=f"db-reader-{i}", daemon=True
+                ))
+            for thread in self._threads:
+                thread.start()
+    
+    @staticmethod
+    def _reply(loop: asyncio.AbstractEventLoop, future: asyncio.Future, result: Any, error: Optional[BaseException]):
+        try:
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+        except RuntimeError:
+            # Event loop уже закрыт — ответ некому отдавать
+            logger.debug("Результат запроса к базе потерян: event loop закрыт")
+    
+    def _worker(self, requests: "queue.SimpleQueue"):
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            loop, future, func = request
+            error = None
+            result = None
+            try:
+                result = func()
+            except BaseException as e:
+                error = e
+            self._reply(loop, future, result, error)
+    
+    def _write_worker(self):
+        while True:
+            request = self._write_requests.get()
+            if request is None:
+                break
+            
+            # Добираем запросы, пришедшие за окно группировки
+            batch = [request]
+            stop = False
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self._write_requests.get(timeout=timeout) if timeout > 0 \
+                        else self._write_requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            
+            self._apply_batch(batch)
+            if stop:
+                break
+    
+    def _apply_batch(self, batch: list):
+        """Выполнить пачку записей одной транзакцией, каждую — в своём SAVEPOINT"""
+        results = []
+        try:
+            with self.db.writer() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                for _, _, func in batch:
+                    conn.execute("SAVEPOINT write_request")
+                    try:
+                        result = func(conn)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_request")
+                        conn.execute("RELEASE write_request")
+                        results.append((None, e))
+                    else:
+                        conn.execute("RELEASE write_request")
+                        results.append((result, None))
+        except Exception as e:
+            # Не удалось зафиксировать транзакцию — не записалось ничего
+            logger.error("❌ Ошибка групповой записи (%d запросов): %s", len(batch), e)
+            results = [(None, e)] * len(batch)
+        
+        self.batches += 1
+        self.batched_writes += len(batch)
+        for (loop, future, _), (result, error) in zip(batch, results):
+            self._reply(loop, future, result, error)
+    
+    async def _submit(self, requests: "queue.SimpleQueue", func: Callable[[], T]) -> T:
+        if not self._threads:
+            self._start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        requests.put((loop, future, func))
+        return await future
+    
+    async def fetch_one(self, query: str, params=()):
+        """Выполнить запрос и получить одну запись"""
+        return await self._submit(self._read_requests, lambda: self.db.fetch_one(query, params))
+    
+    async def fetch_all(self, query: str, params=()):
+        """Выполнить запрос и получить все записи"""
+        return await self._submit(self._read_requests, lambda: self.db.fetch_all(query, params))
+    
+    async def execute(self, query: str, params=()) -> sqlite3.Cursor:
+        """Выполнить запрос на запись (lastrowid и rowcount — в курсоре)"""
+        return await self._submit(self._write_requests, lambda conn: conn.execute(query, params))
+    
+    async def transaction(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        """
+        Выполнить func(conn) в потоке-писателе атомарно.
+        Исключение внутри func откатывает все её изменения (и только их).
+        """
+        return await self._submit(self._write_requests, func)
+    
+    async def complete_lesson(self, telegram_id: int, lesson_id: int, quiz_score: int, reward_spw: int) -> dict:
+        """Засчитать урок и начислить награду одной транзакцией (см. LocalDatabase.complete_lesson)"""
+        return await self.transaction(
+            lambda conn: self.db.complete_lesson(telegram_id, lesson_id, quiz_score, reward_spw, conn=conn)
+        )
+    
+    async def close(self):
+        """Дождаться выполнения очереди и остановить потоки"""
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            (self._write_requests if thread.name == "db-writer" else self._read_requests).put(None)
+        for thread in threads:
+            await asyncio.to_thread(thread.join)
+
+# Глобальный экземпляр
+async_db = AsyncLocalDatabase(
+    local_db,
+    batch_window=config.DB_BATCH_WINDOW_MS / 1000,
+    max_batch=config.DB_BATCH_MAX
+)
@@ -8,7 +8,108 @@ class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+    # Потоков для запросов к Supabase (клиент синхронный, event loop их не ждёт)
+    SUPABASE_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "8"))
     TON_API_KEY = os.getenv("TON_API_KEY")
+    ADMIN_TELEGRAM_ID = int(os.getenv("ADMIN_TELEGRAM_ID", "0") or 0)
+    
+    # Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+    BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+    # Публичный HTTPS адрес, на который Telegram будет присылать обновления
+    WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    # Адрес, на котором слушает aiohttp сервер (обычно за балансировщиком)
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    
+    # FSM хранилище (состояния диалогов переживают перезапуск)
+    FSM_DB_PATH = os.getenv("FSM_DB_PATH", "fsm_storage.db")
+    FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+    FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+    # Через сколько секунд простоя незавершённый диалог сбрасывается
+    FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+    
+    # Хранилище данных: sqlite, supabase, memory (пусто — Supabase, без него — SQLite)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "")
+    
+    # Локальная SQLite база: число соединений только для чтения
+    LOCAL_DB_READERS = int(os.getenv("LOCAL_DB_READERS", "4"))
+    # Групповая запись: окно сбора (мс) и максимум запросов в одной транзакции
+    DB_BATCH_WINDOW_MS = float(os.getenv("DB_BATCH_WINDOW_MS", "2"))
+    DB_BATCH_MAX = int(os.getenv("DB_BATCH_MAX", "500"))
+    # Кеш прогресса обучения: пользователей и время жизни записи (сек)
+    PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", "10000"))
+    PROGRESS_CACHE_TTL = float(os.getenv("PROGRESS_CACHE_TTL", "300"))
+    # Кеш списков кошельков: пользователей и время жизни записи (сек)
+    WALLET_CACHE_SIZE = int(os.getenv("WALLET_CACHE_SIZE", "10000"))
+    WALLET_CACHE_TTL = float(os.getenv("WALLET_CACHE_TTL", "300"))
+    # История балансов: как часто досчитывать часовые/суточные агрегаты (сек, 0 — не запускать)
+    # и сколько дней хранить сырые записи (0 — всегда)
+    HISTORY_ROLLUP_INTERVAL = float(os.getenv("HISTORY_ROLLUP_INTERVAL", "3600"))
+    HISTORY_RAW_RETENTION_DAYS = int(os.getenv("HISTORY_RAW_RETENTION_DAYS", "0"))
+    # /balance: сколько секунд сохранённый баланс считается свежим (старше — обновляется в фоне)
+    BALANCE_FRESH_TTL = float(os.getenv("BALANCE_FRESH_TTL", "60"))
+    
+    # Сколько обновлений обрабатывается одновременно (внутри чата — строго по очереди)
+    MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "100"))
+    
+    # Модули импортируются при первом обращении; "all" или список пакетов через запятую —
+    # импортировать сразу при старте
+    PRELOAD_MODULES = os.getenv("PRELOAD_MODULES", "")
+    
+    # Метрики Prometheus: в режиме webhook отдаются тем же сервером,
+    # в режиме polling — отдельным (0 — не запускать)
+    METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+    METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    
+    # Исходящие сообщения: общий лимит и лимиты на чат (сообщений в секунду)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+    OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+    # Сколько секунд помнить содержимое сообщений, чтобы не отправлять правки без изменений
+    # (0 — отправлять всегда; при нескольких репликах чужие правки не видны)
+    OUTBOUND_CONTENT_TTL = float(os.getenv("OUTBOUND_CONTENT_TTL", "10"))
+    
+    # Окно (сек), в котором повторное нажатие той же кнопки игнорируется
+    CALLBACK_DEDUP_WINDOW = float(os.getenv("CALLBACK_DEDUP_WINDOW", "1.0"))
+    
+    # Логирование: уровень, формат (json/text), уровни отдельных логгеров
+    # ("modules.ton_wallet=DEBUG,aiogram.event=WARNING"), лимит одинаковых сообщений в минуту
+    # и логгеры, к которым он применяется (кроме сообщений с extra={"rate_limit": True})
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+    LOG_RATE_LIMITED = os.getenv("LOG_RATE_LIMITED", "")
+    
+    @classmethod
+    def use_webhook(cls) -> bool:
+        """Включен ли режим webhook (иначе — long polling)"""
+        return cls.BOT_MODE == "webhook" and bool(cls.WEBHOOK_BASE_URL)
+    
+    @classmethod
+    def preload_modules(cls):
+        """Какие модули импортировать при старте: True — все, иначе список пакетов"""
+        if cls.PRELOAD_MODULES.strip().lower() == "all":
+            return True
+        return [name.strip() for name in cls.PRELOAD_MODULES.split(",") if name.strip()]
+    
+    @classmethod
+    def log_levels(cls) -> dict:
+        """Уровни логгеров из LOG_LEVELS: имя → уровень"""
+        levels = {}
+        for item in cls.LOG_LEVELS.split(","):
+            name, _, level = item.partition("=")
+            if name.strip() and level.strip():
+                levels[name.strip()] = level.strip()
+        return levels
+    
+    @classmethod
+    def log_rate_limited(cls) -> list:
+        """Логгеры из LOG_RATE_LIMITED, чьи сообщения ниже WARNING ограничиваются по частоте"""
+        return [name.strip() for name in cls.LOG_RATE_LIMITED.split(",") if name.strip()]
     
     @classmethod
     def validate(cls):
@@ -1,5 +1,7 @@
 # shared/database.py
-import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 from supabase import create_client
 from shared.config import config
 import logging
@@ -7,27 +9,49 @@ import logging
 logger = logging.getLogger(__name__)
 
 class Database:
-    """Класс для работы с базой данных Supabase"""
+    """
+    Класс для работы с базой данных Supabase.
+    
+    Клиент синхронный (каждый execute() — HTTP запрос), поэтому запросы
+    из async кода выполняются через execute(): в пуле из max_workers
+    потоков. Event loop не ждёт сеть, запросы разных пользователей идут
+    параллельно через общий keep-alive пул соединений клиента.
+    """
     
     _instance = None
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 8):
         if Database._instance is not None:
             raise Exception("Этот класс — синглтон!")
         
         self.client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
         logger.info("✅ Подключение к Supabase установлено")
     
     @classmethod
     def get_instance(cls):
         """Получить экземпляр базы данных (синглтон)"""
         if cls._instance is None:
-            cls._instance = Database()
+            cls._instance = Database(config.SUPABASE_MAX_WORKERS)
         return cls._instance
     
     def get_client(self):
         """Получить клиент Supabase"""
         return self.client
 
+    async def execute(self, request) -> Any:
+        """
+        Выполнить запрос PostgREST в пуле потоков.
+        
+        request — построенный запрос (client.table(...).select(...) и т.п.)
+        или любой объект с методом execute(); возвращает его ответ.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, request.execute)
+    
+    def close(self):
+        """Дождаться запросов в пуле и остановить потоки"""
+        self._executor.shutdown(wait=True)
+
 # Глобальный экземпляр
 db = Database.get_instance()
\ No newline at end of file
@@ -1,5 +1,9 @@
 # shared/db_manager.py
+import asyncio
 import logging
+import sys
+
+from shared.config import config
 
 logger = logging.getLogger(__name__)
 
@@ -7,6 +11,7 @@ class DatabaseManager:
     def __init__(self):
         self.db_type = None
         self.db = None
+        self.storage = None
         self.init_database()
     
     def init_database(self):
@@ -36,5 +41,46 @@ class DatabaseManager:
         """Получить тип базы данных"""
         return self.db_type
 
+    def get_storage(self):
+        """
+        Получить хранилища (shared.storage.Storage) выбранного бэкенда.
+        
+        STORAGE_BACKEND: sqlite, supabase, memory; пусто — Supabase,
+        а если он недоступен — локальная SQLite база.
+        Создаются при первом обращении.
+        """
+        if self.storage is None:
+            self.storage = self.create_storage(config.STORAGE_BACKEND)
+            logger.info("✅ Хранилище данных: %s", self.storage.name)
+        return self.storage
+    
+    @staticmethod
+    def create_storage(backend: str = ""):
+        """Создать хранилища указанного бэкенда"""
+        backend = backend.strip().lower()
+        if backend == "memory":
+            from shared.storage.memory import create_storage
+        elif backend == "sqlite":
+            from shared.storage.sqlite import create_storage
+        elif backend == "supabase":
+            from shared.storage.supabase import create_storage
+        elif backend:
+            raise ValueError(f"Неизвестный STORAGE_BACKEND: {backend}")
+        else:
+            try:
+                from shared.storage.supabase import create_storage
+                return create_storage()
+            except Exception as e:
+                logger.warning("⚠️ Supabase недоступен (%s), данные хранятся в локальной SQLite базе", e)
+                from shared.storage.sqlite import create_storage
+        return create_storage()
+
+    async def close(self):
+        """Остановить пул потоков Supabase (если клиент создавался), дождавшись запросов"""
+        # Импорт shared.database сам подключается к Supabase — смотрим, был ли он
+        database = sys.modules.get("shared.database")
+        if database is not None and database.Database._instance is not None:
+            await asyncio.to_thread(database.Database._instance.close)
+
 # Глобальный экземпляр
 db_manager = DatabaseManager()
\ No newline at end of file
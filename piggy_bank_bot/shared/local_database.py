@@ -1,38 +1,124 @@
 # shared/local_database.py
+import queue
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from typing import Mapping
+
+from shared.config import config
 
 logger = logging.getLogger(__name__)
 
+# Настройки соединений: страницы кеша в КБ (отрицательное значение), mmap в байтах
+CACHE_SIZE_KB = 8192
+MMAP_SIZE = 256 * 1024 * 1024
+CACHED_STATEMENTS = 256
+
+# completed_mask — 64-битное целое SQLite, старший бит знаковый
+MAX_LESSON_ID = 63
+
+# Награды уроков (id → SPW) на момент миграции 2: по ним заполняется
+# rewards_earned за уроки, пройденные до её появления
+MIGRATION_2_REWARDS = {1: 10, 2: 20, 3: 30, 4: 40, 5: 50}
+
 class LocalDatabase:
-    """Класс для работы с локальной базой данных SQLite"""
+    """
+    Класс для работы с локальной базой данных SQLite.
+    
+    Соединения открываются один раз и переиспользуются:
+    - одно соединение-писатель (запись по очереди, под замком);
+    - до readers соединений только для чтения, которые в режиме WAL
+      читают параллельно с записью.
+    """
     
     _instance = None
     
-    def __init__(self, db_path="database.db"):
+    def __init__(self, db_path="database.db", readers=4):
         if LocalDatabase._instance is not None:
             raise Exception("Этот класс — синглтон!")
         
         self.db_path = db_path
+        self.readers = max(1, readers)
+        
+        self._write_lock = threading.RLock()
+        self._writer = self._connect(db_path)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        
+        # Читатели создаются по мере надобности и возвращаются в пул
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        
         self.init_database()
         logger.info(f"✅ Локальная база данных SQLite инициализирована: {db_path}")
     
     @classmethod
-    def get_instance(cls, db_path="database.db"):
+    def get_instance(cls, db_path="database.db", readers=None):
         """Получить экземпляр базы данных (синглтон)"""
         if cls._instance is None:
-            cls._instance = LocalDatabase(db_path)
+            cls._instance = LocalDatabase(db_path, readers or config.LOCAL_DB_READERS)
         return cls._instance
     
+    @staticmethod
+    def _connect(database: str, uri: bool = False) -> sqlite3.Connection:
+        """Открыть соединение с настройками для долгой жизни"""
+        conn = sqlite3.connect(
+            database,
+            uri=uri,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+            timeout=30
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return conn
+    
     def get_connection(self):
-        """Получить соединение с базой данных"""
+        """Получить отдельное соединение с базой данных (для разовых задач)"""
         return sqlite3.connect(self.db_path)
     
+    @contextmanager
+    def writer(self):
+        """Соединение-писатель; транзакция фиксируется при выходе из блока"""
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    @contextmanager
+    def reader(self):
+        """Соединение только для чтения из пула"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put(conn)
+    
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if self._readers_created < self.readers:
+                self._readers_created += 1
+                uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+                conn = self._connect(uri, uri=True)
+                conn.execute("PRAGMA query_only=ON")
+                return conn
+        # Все читатели заняты — ждём освободившегося
+        return self._idle_readers.get()
+    
     def init_database(self):
         """Инициализировать базу данных и создать таблицы если их нет"""
-        with self.get_connection() as conn:
+        with self.writer() as conn:
             cursor = conn.cursor()
             
             # Таблица пользователей
@@ -62,34 +148,195 @@ class LocalDatabase:
                 )
             ''')
             
+            # Кошельки и история балансов (хранилище sqlite, см. shared/storage)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wallets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER NOT NULL,
+                    wallet_address TEXT NOT NULL,
+                    friendly_name TEXT,
+                    created_at TEXT NOT NULL,
+                    UNIQUE(telegram_id, wallet_address)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wallet_balance_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER NOT NULL,
+                    wallet_address TEXT NOT NULL,
+                    ton_balance TEXT NOT NULL,
+                    spw_balance TEXT NOT NULL,
+                    recorded_at TEXT NOT NULL
+                )
+            ''')
+            # Последний известный баланс кошелька (одна строка на адрес)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wallet_latest_balance (
+                    wallet_address TEXT PRIMARY KEY,
+                    ton_balance TEXT NOT NULL,
+                    spw_balance TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            # Часовые и суточные агрегаты истории (см. shared/storage/rollups.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wallet_balance_rollups (
+                    resolution TEXT NOT NULL,
+                    wallet_address TEXT NOT NULL,
+                    bucket_start TEXT NOT NULL,
+                    telegram_id INTEGER NOT NULL,
+                    ton_open TEXT NOT NULL,
+                    ton_close TEXT NOT NULL,
+                    ton_min TEXT NOT NULL,
+                    ton_max TEXT NOT NULL,
+                    spw_open TEXT NOT NULL,
+                    spw_close TEXT NOT NULL,
+                    spw_min TEXT NOT NULL,
+                    spw_max TEXT NOT NULL,
+                    samples INTEGER NOT NULL,
+                    last_at TEXT NOT NULL,
+                    PRIMARY KEY (resolution, wallet_address, bucket_start)
+                )
+            ''')
+            
             # Индексы для быстрого поиска
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_lessons_user_id ON user_lessons(user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_lessons_lesson_id ON user_lessons(lesson_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_wallet ON wallet_balance_history(wallet_address, recorded_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_telegram_id ON wallet_balance_history(telegram_id, recorded_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_recorded_at ON wallet_balance_history(recorded_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollups_telegram_id ON wallet_balance_rollups(resolution, telegram_id, bucket_start)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollups_last_at ON wallet_balance_rollups(last_at)')
             
-            conn.commit()
+            self._migrate(conn, MIGRATION_2_REWARDS)
+    
+    def _migrate(self, conn: sqlite3.Connection, rewards: Mapping[int, int]):
+        """
+        Применить миграции схемы (номер версии — в PRAGMA user_version).
+        rewards — награды уроков (id урока → награда) для заполнения rewards_earned.
+        """
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            # Прогресс обучения прямо в строке пользователя:
+            # бит N в completed_mask — урок N пройден
+            conn.execute("ALTER TABLE users ADD COLUMN completed_mask INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE users ADD COLUMN rewards_earned INTEGER NOT NULL DEFAULT 0")
+            # (user_id, lesson_id) уникальны, поэтому сумма битов равна их OR
+            conn.execute("""
+                UPDATE users SET completed_mask = (
+                    SELECT COALESCE(SUM(1 << lesson_id), 0) FROM user_lessons WHERE user_id = users.id
+                )
+            """)
+            conn.execute("PRAGMA user_version = 1")
+            logger.info("✅ Миграция базы 1: completed_mask и rewards_earned в users")
+    
+        if version < 2:
+            # Награда за урок из таблицы на момент миграции, а не из текущего курса
+            cases = " ".join("WHEN ? THEN ?" for _ in rewards)
+            params = [value for item in rewards.items() for value in item]
+            reward_expr = f"CASE lesson_id {cases} ELSE 0 END" if rewards else "0"
+            conn.execute(f"""
+                UPDATE users SET rewards_earned = (
+                    SELECT COALESCE(SUM({reward_expr}), 0) FROM user_lessons WHERE user_id = users.id
+                )
+                WHERE completed_mask != 0
+            """, params)
+            conn.execute("PRAGMA user_version = 2")
+            logger.info("✅ Миграция базы 2: rewards_earned заполнен по пройденным урокам")
+    
+        if version < 3:
+            # Последние балансы писались местным временем без пояса — переводим в UTC с поясом
+            conn.execute("""
+                UPDATE wallet_latest_balance
+                SET updated_at = strftime('%Y-%m-%dT%H:%M:%f+00:00', updated_at, 'utc')
+                WHERE updated_at NOT GLOB '*[+-][0-9][0-9]:[0-9][0-9]' AND updated_at NOT LIKE '%Z'
+            """)
+            conn.execute("PRAGMA user_version = 3")
+            logger.info("✅ Миграция базы 3: wallet_latest_balance.updated_at в UTC")
+    
     
     def execute_query(self, query, params=()):
         """Выполнить SQL запрос"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor
+        with self.writer() as conn:
+            return conn.execute(query, params)
     
     def fetch_one(self, query, params=()):
         """Выполнить запрос и получить одну запись"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchone()
+        with self.reader() as conn:
+            return conn.execute(query, params).fetchone()
     
     def fetch_all(self, query, params=()):
         """Выполнить запрос и получить все записи"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchall()
+        with self.reader() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def complete_lesson(self, telegram_id, lesson_id, quiz_score, reward_spw, conn=None):
+        """
+        Засчитать урок одной транзакцией.
+        
+        Пользователь создаётся при необходимости, урок записывается через
+        UPSERT, награда начисляется на месте (spw_balance = spw_balance + ?)
+        только при первом прохождении — повторное или одновременное
+        прохождение не начислит её дважды; completed_mask и rewards_earned
+        обновляются тем же UPDATE. Возвращает новый прогресс: db_user_id,
+        spw_balance, completed_mask, rewards_earned, newly_completed.
+        conn — соединение уже открытой транзакции (см. AsyncLocalDatabase).
+        """
+        if not 0 <= lesson_id < MAX_LESSON_ID:
+            raise ValueError(f"id урока вне диапазона completed_mask: {lesson_id}")
+        if conn is None:
+            with self.writer() as conn:
+                return self.complete_lesson(telegram_id, lesson_id, quiz_score, reward_spw, conn=conn)
+        
+        db_user_id = conn.execute(
+            """INSERT INTO users (telegram_id, spw_balance) VALUES (?, 0)
+               ON CONFLICT(telegram_id) DO UPDATE SET telegram_id = excluded.telegram_id
+               RETURNING id""",
+            (str(telegram_id),)
+        ).fetchone()[0]
+        
+        newly_completed = conn.execute(
+            """INSERT INTO user_lessons (user_id, lesson_id, quiz_score, reward_granted)
+               VALUES (?, ?, ?, TRUE)
+               ON CONFLICT(user_id, lesson_id) DO NOTHING""",
+            (db_user_id, lesson_id, quiz_score)
+        ).rowcount == 1
+        
+        if newly_completed:
+            row = conn.execute(
+                """UPDATE users SET spw_balance = spw_balance + ?,
+                                    rewards_earned = rewards_earned + ?,
+                                    completed_mask = completed_mask | ?
+                   WHERE id = ?
+                   RETURNING spw_balance, completed_mask, rewards_earned""",
+                (reward_spw, reward_spw, 1 << lesson_id, db_user_id)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT spw_balance, completed_mask, rewards_earned FROM users WHERE id = ?", (db_user_id,)
+            ).fetchone()
+        
+        return {
+            "db_user_id": db_user_id,
+            "spw_balance": row[0],
+            "completed_mask": row[1],
+            "rewards_earned": row[2],
+            "newly_completed": newly_completed
+        }
+    
+    def close(self):
+        """Закрыть все соединения"""
+        with self._readers_lock:
+            while True:
+                try:
+                    self._idle_readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._readers_created = 0
+        with self._write_lock:
+            self._writer.close()
 
 # Глобальный экземпляр
 local_db = LocalDatabase.get_instance()
\ No newline at end of file
@@ -0,0 +1,12 @@
+# shared/storage/__init__.py
+"""
+Асинхронные хранилища данных бота.
+
+Интерфейсы — в base.py, реализации — sqlite.py, supabase.py и memory.py.
+Бэкенд выбирается в shared/db_manager.py (STORAGE_BACKEND).
+"""
+from .base import BalanceHistoryStore, LatestBalanceStore, LessonProgressStore, Row, Storage, UserStore, WalletStore
+
+__all__ = [
+    'Storage', 'UserStore', 'LessonProgressStore', 'WalletStore', 'BalanceHistoryStore', 'LatestBalanceStore', 'Row'
+]
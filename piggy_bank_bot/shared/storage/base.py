@@ -0,0 +1,147 @@
+# shared/storage/base.py
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Строки хранилищ — словари с полями таблиц:
+# кошелёк: id, telegram_id, wallet_address, friendly_name, created_at (ISO строка)
+# история: id, telegram_id, wallet_address, ton_balance, spw_balance (строки), recorded_at (ISO строка)
+# последний баланс: wallet_address, ton_balance, spw_balance (строки), updated_at (ISO строка)
+# прогресс: db_user_id, spw_balance, completed_mask, rewards_earned
+Row = Dict[str, Any]
+
+# Столбцы истории, которые читают вызывающие (без select *)
+HISTORY_COLUMNS = ("id", "telegram_id", "wallet_address", "ton_balance", "spw_balance", "recorded_at")
+
+# Столбцы агрегатов истории (resolution — "hour" или "day", см. rollups.py)
+ROLLUP_COLUMNS = (
+    "resolution", "wallet_address", "bucket_start", "telegram_id",
+    "ton_open", "ton_close", "ton_min", "ton_max",
+    "spw_open", "spw_close", "spw_min", "spw_max",
+    "samples", "last_at"
+)
+
+# Столбцы последних балансов (одна строка на адрес)
+LATEST_COLUMNS = ("wallet_address", "ton_balance", "spw_balance", "updated_at")
+
+# Позиция в истории: (recorded_at, id) последней прочитанной строки
+HistoryCursor = Tuple[str, Any]
+
+
+class UserStore(ABC):
+    """Пользователи бота"""
+    
+    @abstractmethod
+    async def ensure_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
+        """Создать пользователя, если его нет; True — пользователь есть"""
+
+
+class LessonProgressStore(ABC):
+    """Прогресс обучения"""
+    
+    @abstractmethod
+    async def get_progress(self, telegram_id: int) -> Row:
+        """Прогресс пользователя; новый пользователь создаётся"""
+    
+    @abstractmethod
+    async def complete_lesson(self, telegram_id: int, lesson_id: int, quiz_score: int, reward_spw: int) -> Row:
+        """
+        Засчитать урок атомарно: награда начисляется только за первое прохождение.
+        Возвращает прогресс и newly_completed.
+        """
+
+
+class WalletStore(ABC):
+    """Кошельки пользователей"""
+    
+    @abstractmethod
+    async def add_wallet(self, telegram_id: int, wallet_address: str, friendly_name: Optional[str] = None) -> bool:
+        """Привязать кошелёк; False — уже привязан"""
+    
+    @abstractmethod
+    async def get_user_wallets(self, telegram_id: int) -> List[Row]:
+        """Кошельки пользователя, новые первыми"""
+    
+    @abstractmethod
+    async def remove_wallet(self, telegram_id: int, wallet_address: str) -> bool:
+        """Отвязать кошелёк; False — такого не было"""
+    
+    @abstractmethod
+    async def wallet_exists(self, telegram_id: int, wallet_address: str) -> bool:
+        """Привязан ли кошелёк к пользователю"""
+
+
+class BalanceHistoryStore(ABC):
+    """История балансов кошельков"""
+    
+    @abstractmethod
+    async def save_balance(self, telegram_id: int, wallet_address: str, ton_balance, spw_balance) -> bool:
+        """Записать балансы кошелька (в нанотонах/нанотокенах)"""
+    
+    @abstractmethod
+    async def save_balances(self, rows: List[Row]) -> List[bool]:
+        """
+        Записать пачку строк истории одним запросом.
+        Возвращает успех по каждой строке в том же порядке.
+        """
+    
+    @abstractmethod
+    async def get_history_page(self, field: str, value, since: Optional[str] = None, until: Optional[str] = None,
+                               after: Optional[HistoryCursor] = None, limit: int = 500) -> List[Row]:
+        """
+        Страница истории, где field ("wallet_address" или "telegram_id") = value.
+        
+        Порядок — (recorded_at, id) по убыванию; since/until — границы
+        recorded_at (ISO строки, since включительно, until нет); after —
+        курсор последней строки предыдущей страницы (строго после неё).
+        Только столбцы HISTORY_COLUMNS.
+        """
+    
+    @abstractmethod
+    async def get_rollups(self, field: str, value, resolution: str,
+                          since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+        """Агрегаты (ROLLUP_COLUMNS) с bucket_start в [since, until), по возрастанию bucket_start"""
+    
+    @abstractmethod
+    async def refresh_rollups(self) -> int:
+        """Досчитать агрегаты по новым строкам истории; возвращает число обновлённых корзин"""
+    
+    @abstractmethod
+    async def purge_history(self, before: datetime) -> int:
+        """
+        Удалить сырые строки старше before (момент с часовым поясом), но только
+        уже агрегированные (см. rollups.purge_limit). Возвращает число удалённых строк.
+        """
+    
+    async def get_balance_history(self, wallet_address: str, limit: int = 30) -> List[Row]:
+        """Последние записи кошелька, новые первыми"""
+        return await self.get_history_page("wallet_address", wallet_address, limit=limit)
+    
+    async def get_user_balance_history(self, telegram_id: int, limit: int = 30) -> List[Row]:
+        """Последние записи всех кошельков пользователя, новые первыми"""
+        return await self.get_history_page("telegram_id", telegram_id, limit=limit)
+
+
+class LatestBalanceStore(ABC):
+    """Последние известные балансы кошельков: одна строка на адрес"""
+    
+    @abstractmethod
+    async def get_latest(self, wallet_addresses: Sequence[str]) -> List[Row]:
+        """Строки (LATEST_COLUMNS) адресов, для которых баланс уже известен"""
+    
+    @abstractmethod
+    async def save_latest(self, rows: List[Row]):
+        """Записать балансы одним запросом; более старая строка (по updated_at) не заменяет новую"""
+
+
+class Storage:
+    """Набор хранилищ одного бэкенда"""
+    
+    def __init__(self, name: str, users: UserStore, lessons: LessonProgressStore,
+                 wallets: WalletStore, history: BalanceHistoryStore, latest: LatestBalanceStore):
+        self.name = name
+        self.users = users
+        self.lessons = lessons
+        self.wallets = wallets
+        self.history = history
+        self.latest = latest
@@ -0,0 +1,200 @@
+# shared/storage/memory.py
+from datetime import datetime
+from itertools import count
+from typing import Dict, List, Optional, Sequence
+
+from .base import (
+    HISTORY_COLUMNS, LATEST_COLUMNS, BalanceHistoryStore, HistoryCursor, LatestBalanceStore, LessonProgressStore, Row,
+    Storage, UserStore, WalletStore
+)
+from .rollups import aggregate, purge_limit, refresh_start
+
+
+class MemoryUserStore(UserStore):
+    """Пользователи в памяти процесса"""
+    
+    def __init__(self):
+        self.users: Dict[int, Row] = {}
+        self._ids = count(1)
+    
+    def get_or_create(self, telegram_id: int, username: Optional[str] = None) -> Row:
+        user = self.users.get(telegram_id)
+        if user is None:
+            user = self.users[telegram_id] = {
+                "id": next(self._ids),
+                "telegram_id": telegram_id,
+                "username": username,
+                "spw_balance": 0,
+                "completed_mask": 0,
+                "rewards_earned": 0,
+                "lessons": {}  # id урока → оценка за тест
+            }
+        return user
+    
+    async def ensure_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
+        self.get_or_create(telegram_id, username)
+        return True
+
+
+class MemoryLessonProgressStore(LessonProgressStore):
+    """Прогресс обучения в памяти (пользователи общие с MemoryUserStore)"""
+    
+    def __init__(self, users: MemoryUserStore):
+        self.users = users
+    
+    @staticmethod
+    def _progress(user: Row) -> Row:
+        return {
+            "db_user_id": user["id"],
+            "spw_balance": user["spw_balance"],
+            "completed_mask": user["completed_mask"],
+            "rewards_earned": user["rewards_earned"]
+        }
+    
+    async def get_progress(self, telegram_id: int) -> Row:
+        return self._progress(self.users.get_or_create(telegram_id))
+    
+    async def complete_lesson(self, telegram_id: int, lesson_id: int, quiz_score: int, reward_spw: int) -> Row:
+        # Между проверкой и записью нет await — операция атомарна для event loop
+        user = self.users.get_or_create(telegram_id)
+        newly_completed = lesson_id not in user["lessons"]
+        if newly_completed:
+            user["lessons"][lesson_id] = quiz_score
+            user["completed_mask"] |= 1 << lesson_id
+            user["rewards_earned"] += reward_spw
+            user["spw_balance"] += reward_spw
+        progress = self._progress(user)
+        progress["newly_completed"] = newly_completed
+        return progress
+
+
+class MemoryWalletStore(WalletStore):
+    """Кошельки в памяти"""
+    
+    def __init__(self, users: MemoryUserStore):
+        self.users = users
+        # telegram_id → адрес → строка (в порядке добавления)
+        self.wallets: Dict[int, Dict[str, Row]] = {}
+        self._ids = count(1)
+    
+    async def add_wallet(self, telegram_id: int, wallet_address: str, friendly_name: Optional[str] = None) -> bool:
+        self.users.get_or_create(telegram_id)
+        wallets = self.wallets.setdefault(telegram_id, {})
+        if wallet_address in wallets:
+            return False
+        wallets[wallet_address] = {
+            "id": str(next(self._ids)),
+            "telegram_id": telegram_id,
+            "wallet_address": wallet_address,
+            "friendly_name": friendly_name,
+            "created_at": datetime.now().isoformat()
+        }
+        return True
+    
+    async def get_user_wallets(self, telegram_id: int) -> List[Row]:
+        return [dict(row) for row in reversed(self.wallets.get(telegram_id, {}).values())]
+    
+    async def remove_wallet(self, telegram_id: int, wallet_address: str) -> bool:
+        return self.wallets.get(telegram_id, {}).pop(wallet_address, None) is not None
+    
+    async def wallet_exists(self, telegram_id: int, wallet_address: str) -> bool:
+        return wallet_address in self.wallets.get(telegram_id, {})
+
+
+class MemoryBalanceHistoryStore(BalanceHistoryStore):
+    """История балансов в памяти (записи в порядке добавления)"""
+    
+    def __init__(self):
+        self.records: List[Row] = []
+        # (resolution, wallet_address, bucket_start) → агрегат
+        self.rollups: Dict[tuple, Row] = {}
+        self._ids = count(1)
+    
+    async def save_balance(self, telegram_id: int, wallet_address: str, ton_balance, spw_balance) -> bool:
+        self.records.append({
+            "id": str(next(self._ids)),
+            "telegram_id": telegram_id,
+            "wallet_address": wallet_address,
+            "ton_balance": str(ton_balance),
+            "spw_balance": str(spw_balance),
+            "recorded_at": datetime.now().isoformat()
+        })
+        return True
+    
+    async def save_balances(self, rows: List[Row]) -> List[bool]:
+        for row in rows:
+            self.records.append(dict(row, id=str(next(self._ids))))
+        return [True] * len(rows)
+    
+    async def get_history_page(self, field: str, value, since: Optional[str] = None, until: Optional[str] = None,
+                               after: Optional[HistoryCursor] = None, limit: int = 500) -> List[Row]:
+        rows = [
+            row for row in self.records
+            if row[field] == value
+            and (since is None or row["recorded_at"] >= since)
+            and (until is None or row["recorded_at"] < until)
+            and (after is None or (row["recorded_at"], int(row["id"])) < (after[0], int(after[1])))
+        ]
+        rows.sort(key=lambda row: (row["recorded_at"], int(row["id"])), reverse=True)
+        return [{column: row[column] for column in HISTORY_COLUMNS} for row in rows[:limit]]
+
+    async def get_rollups(self, field: str, value, resolution: str,
+                          since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+        rows = [
+            dict(row) for row in self.rollups.values()
+            if row["resolution"] == resolution and row[field] == value
+            and (since is None or row["bucket_start"] >= since)
+            and (until is None or row["bucket_start"] < until)
+        ]
+        rows.sort(key=lambda row: (row["bucket_start"], row["wallet_address"]))
+        return rows
+    
+    def _last_rollup_at(self) -> Optional[str]:
+        return max((row["last_at"] for row in self.rollups.values()), default=None)
+    
+    async def refresh_rollups(self) -> int:
+        start = refresh_start(self._last_rollup_at())
+        rows = [row for row in self.records if start is None or row["recorded_at"] >= start]
+        rows.sort(key=lambda row: (row["recorded_at"], int(row["id"])))
+        rollups = aggregate(rows)
+        for rollup in rollups:
+            self.rollups[(rollup["resolution"], rollup["wallet_address"], rollup["bucket_start"])] = rollup
+        return len(rollups)
+    
+    async def purge_history(self, before: datetime) -> int:
+        limit = purge_limit(before, self._last_rollup_at())
+        if limit is None:
+            return 0
+        kept = [row for row in self.records if row["recorded_at"] >= limit]
+        purged = len(self.records) - len(kept)
+        self.records = kept
+        return purged
+
+
+class MemoryLatestBalanceStore(LatestBalanceStore):
+    """Последние балансы в памяти"""
+    
+    def __init__(self):
+        self.rows: Dict[str, Row] = {}
+    
+    async def get_latest(self, wallet_addresses: Sequence[str]) -> List[Row]:
+        return [dict(self.rows[address]) for address in wallet_addresses if address in self.rows]
+    
+    async def save_latest(self, rows: List[Row]):
+        for row in rows:
+            current = self.rows.get(row["wallet_address"])
+            if current is None or row["updated_at"] >= current["updated_at"]:
+                self.rows[row["wallet_address"]] = {column: row[column] for column in LATEST_COLUMNS}
+
+
+def create_storage() -> Storage:
+    """Хранилище в памяти: без диска и сети (тесты, бенчмарки)"""
+    users = MemoryUserStore()
+    return Storage(
+        "memory",
+        users=users,
+        lessons=MemoryLessonProgressStore(users),
+        wallets=MemoryWalletStore(users),
+        history=MemoryBalanceHistoryStore(),
+        latest=MemoryLatestBalanceStore()
+    )
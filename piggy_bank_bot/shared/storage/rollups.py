@@ -0,0 +1,180 @@
+# shared/storage/rollups.py
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .base import Row
+
+logger = logging.getLogger(__name__)
+
+# Агрегаты истории: длина корзины
+RESOLUTIONS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Перед последней агрегированной записью пересчитываются ещё столько —
+# на случай строк, записанных с опозданием
+ROLLUP_OVERLAP = timedelta(hours=1)
+
+# Сколько сырых строк читается за раз при пересчёте агрегатов
+REFRESH_PAGE_SIZE = 5000
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    """Начало корзины, в которую попадает момент"""
+    if resolution == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def refresh_start(last_at: Optional[str]) -> Optional[str]:
+    """
+    С какого момента пересчитывать агрегаты (None — всю историю).
+    
+    Начало суток: и часовые, и суточные корзины с этого момента
+    пересчитываются из сырых строк целиком, поэтому сырые строки
+    раньше этого момента можно удалять.
+    """
+    if last_at is None:
+        return None
+    return bucket_start(datetime.fromisoformat(last_at) - ROLLUP_OVERLAP, "day").isoformat()
+
+
+def purge_limit(before: datetime, last_at: Optional[str]) -> Optional[str]:
+    """
+    Граница удаления сырых строк, не раньше агрегированного (None — удалять нечего).
+    
+    before — момент с часовым поясом; граница возвращается ISO строкой
+    в том же виде, что и даты хранилища: сырая история SQLite и памяти
+    записана местным временем без пояса.
+    """
+    start = refresh_start(last_at)
+    if start is None:
+        return None
+    start_at = datetime.fromisoformat(start)
+    if start_at.tzinfo is None:
+        before = before.astimezone().replace(tzinfo=None)
+    return min(before, start_at).isoformat()
+
+
+class RollupBuilder:
+    """
+    Часовые и суточные агрегаты по строкам истории, собираемые по частям.
+    
+    Строки добавляются по возрастанию (recorded_at, id); на каждую корзину —
+    открытие, закрытие, минимум и максимум TON и SPW. Корзины, которые
+    закончились раньше последней добавленной строки, можно забрать
+    (pop_complete) и записать, не дожидаясь конца диапазона.
+    """
+    
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str, datetime], Row] = {}
+        self._position: Optional[datetime] = None
+    
+    def add(self, rows: Iterable[Row]):
+        buckets = self._buckets
+        for row in rows:
+            recorded_at = datetime.fromisoformat(row["recorded_at"])
+            self._position = recorded_at
+            ton = Decimal(row["ton_balance"])
+            spw = Decimal(row["spw_balance"])
+            for resolution in RESOLUTIONS:
+                key = (resolution, row["wallet_address"], bucket_start(recorded_at, resolution))
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = {
+                        "resolution": resolution,
+                        "wallet_address": row["wallet_address"],
+                        "bucket_start": key[2],
+                        "telegram_id": row["telegram_id"],
+                        "ton_open": ton, "ton_close": ton, "ton_min": ton, "ton_max": ton,
+                        "spw_open": spw, "spw_close": spw, "spw_min": spw, "spw_max": spw,
+                        "samples": 1,
+                        "last_at": row["recorded_at"]
+                    }
+                    continue
+                bucket["telegram_id"] = row["telegram_id"]
+                bucket["ton_close"] = ton
+                bucket["ton_min"] = min(bucket["ton_min"], ton)
+                bucket["ton_max"] = max(bucket["ton_max"], ton)
+                bucket["spw_close"] = spw
+                bucket["spw_min"] = min(bucket["spw_min"], spw)
+                bucket["spw_max"] = max(bucket["spw_max"], spw)
+                bucket["samples"] += 1
+                bucket["last_at"] = row["recorded_at"]
+    
+    def pop_complete(self) -> List[Row]:
+        """Забрать корзины, закончившиеся не позже последней добавленной строки"""
+        if self._position is None:
+            return []
+        complete = [
+            key for key in self._buckets
+            if key[2] + RESOLUTIONS[key[0]] <= self._position
+        ]
+        return self._export(self._buckets.pop(key) for key in complete)
+    
+    def pop_all(self) -> List[Row]:
+        """Забрать все корзины, в том числе незаконченные"""
+        buckets, self._buckets = self._buckets, {}
+        return self._export(buckets.values())
+    
+    @staticmethod
+    def _export(buckets: Iterable[Row]) -> List[Row]:
+        # Хранилища держат балансы и даты строками, как и в сырой истории
+        rollups = []
+        for bucket in buckets:
+            rollup = {key: (str(value) if isinstance(value, Decimal) else value) for key, value in bucket.items()}
+            rollup["bucket_start"] = bucket["bucket_start"].isoformat()
+            rollups.append(rollup)
+        return rollups
+
+
+def aggregate(rows: Iterable[Row]) -> List[Row]:
+    """Часовые и суточные агрегаты по строкам истории (по возрастанию (recorded_at, id))"""
+    builder = RollupBuilder()
+    builder.add(rows)
+    return builder.pop_all()
+
+
+class HistoryMaintenance:
+    """
+    Фоновое обслуживание истории балансов: раз в interval секунд
+    досчитывает агрегаты и удаляет сырые строки старше retention_days
+    (0 — хранить всегда). Удаляются только уже агрегированные строки.
+    
+    Запускается на каждом экземпляре бота: на Supabase функции обслуживания
+    берут advisory-блокировку, и одновременно работу делает только один.
+    """
+    
+    def __init__(self, get_storage, interval: float = 3600, retention_days: int = 0):
+        self.get_storage = get_storage
+        self.interval = interval
+        self.retention_days = retention_days
+        self._task: Optional[asyncio.Task] = None
+    
+    async def run_once(self):
+        history = self.get_storage().history
+        buckets = await history.refresh_rollups()
+        purged = 0
+        if self.retention_days > 0:
+            # С часовым поясом: Supabase сравнивает её с TIMESTAMPTZ
+            before = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+            purged = await history.purge_history(before)
+        logger.info("История балансов: обновлено агрегатов %d, удалено сырых строк %d", buckets, purged)
+    
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error("❌ Ошибка обслуживания истории балансов: %s", e)
+            await asyncio.sleep(self.interval)
+    
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,240 @@
+# shared/storage/sqlite.py
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from shared.async_database import AsyncLocalDatabase, async_db
+
+from .base import (
+    HISTORY_COLUMNS, LATEST_COLUMNS, ROLLUP_COLUMNS, BalanceHistoryStore, HistoryCursor, LatestBalanceStore,
+    LessonProgressStore, Row, Storage, UserStore, WalletStore
+)
+from .rollups import REFRESH_PAGE_SIZE, RollupBuilder, purge_limit, refresh_start
+
+WALLET_COLUMNS = ("id", "telegram_id", "wallet_address", "friendly_name", "created_at")
+
+
+def _as_rows(columns: Sequence[str], records) -> List[Row]:
+    return [dict(zip(columns, record)) for record in records]
+
+
+class SQLiteUserStore(UserStore):
+    """Пользователи в локальной SQLite базе"""
+    
+    def __init__(self, db: AsyncLocalDatabase):
+        self.db = db
+    
+    async def ensure_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
+        await self.db.execute(
+            "INSERT INTO users (telegram_id, username) VALUES (?, ?) ON CONFLICT(telegram_id) DO NOTHING",
+            (str(telegram_id), username)
+        )
+        return True
+
+
+class SQLiteLessonProgressStore(LessonProgressStore):
+    """Прогресс обучения: одна строка users (completed_mask, rewards_earned)"""
+    
+    def __init__(self, db: AsyncLocalDatabase):
+        self.db = db
+    
+    async def get_progress(self, telegram_id: int) -> Row:
+        query = "SELECT id, spw_balance, completed_mask, rewards_earned FROM users WHERE telegram_id = ?"
+        user_row = await self.db.fetch_one(query, (str(telegram_id),))
+        
+        if user_row is None:
+            await self.db.execute(
+                "INSERT INTO users (telegram_id, spw_balance) VALUES (?, 0) ON CONFLICT(telegram_id) DO NOTHING",
+                (str(telegram_id),)
+            )
+            user_row = await self.db.fetch_one(query, (str(telegram_id),))
+        
+        return dict(zip(("db_user_id", "spw_balance", "completed_mask", "rewards_earned"), user_row))
+    
+    async def complete_lesson(self, telegram_id: int, lesson_id: int, quiz_score: int, reward_spw: int) -> Row:
+        return await self.db.complete_lesson(telegram_id, lesson_id, quiz_score, reward_spw)
+
+
+class SQLiteWalletStore(WalletStore):
+    """Кошельки в локальной SQLite базе"""
+    
+    def __init__(self, db: AsyncLocalDatabase):
+        self.db = db
+    
+    async def add_wallet(self, telegram_id: int, wallet_address: str, friendly_name: Optional[str] = None) -> bool:
+        def add(conn) -> bool:
+            conn.execute(
+                "INSERT INTO users (telegram_id) VALUES (?) ON CONFLICT(telegram_id) DO NOTHING",
+                (str(telegram_id),)
+            )
+            return conn.execute(
+                """INSERT INTO wallets (telegram_id, wallet_address, friendly_name, created_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(telegram_id, wallet_address) DO NOTHING""",
+                (telegram_id, wallet_address, friendly_name, datetime.now().isoformat())
+            ).rowcount == 1
+        
+        return await self.db.transaction(add)
+    
+    async def get_user_wallets(self, telegram_id: int) -> List[Row]:
+        records = await self.db.fetch_all(
+            f"SELECT {', '.join(WALLET_COLUMNS)} FROM wallets WHERE telegram_id = ? ORDER BY created_at DESC, id DESC",
+            (telegram_id,)
+        )
+        return _as_rows(WALLET_COLUMNS, records)
+    
+    async def remove_wallet(self, telegram_id: int, wallet_address: str) -> bool:
+        cursor = await self.db.execute(
+            "DELETE FROM wallets WHERE telegram_id = ? AND wallet_address = ?",
+            (telegram_id, wallet_address)
+        )
+        return cursor.rowcount > 0
+    
+    async def wallet_exists(self, telegram_id: int, wallet_address: str) -> bool:
+        row = await self.db.fetch_one(
+            "SELECT 1 FROM wallets WHERE telegram_id = ? AND wallet_address = ?",
+            (telegram_id, wallet_address)
+        )
+        return row is not None
+
+
+class SQLiteBalanceHistoryStore(BalanceHistoryStore):
+    """История балансов в локальной SQLite базе (балансы — строки, без потери точности)"""
+    
+    def __init__(self, db: AsyncLocalDatabase):
+        self.db = db
+    
+    async def save_balance(self, telegram_id: int, wallet_address: str, ton_balance, spw_balance) -> bool:
+        await self.db.execute(
+            """INSERT INTO wallet_balance_history (telegram_id, wallet_address, ton_balance, spw_balance, recorded_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (telegram_id, wallet_address, str(ton_balance), str(spw_balance), datetime.now().isoformat())
+        )
+        return True
+    
+    async def save_balances(self, rows: List[Row]) -> List[bool]:
+        # Одна транзакция: пачка записывается целиком или не записывается
+        await self.db.transaction(lambda conn: conn.executemany(
+            """INSERT INTO wallet_balance_history (telegram_id, wallet_address, ton_balance, spw_balance, recorded_at)
+               VALUES (:telegram_id, :wallet_address, :ton_balance, :spw_balance, :recorded_at)""",
+            rows
+        ))
+        return [True] * len(rows)
+    
+    async def get_history_page(self, field: str, value, since: Optional[str] = None, until: Optional[str] = None,
+                               after: Optional[HistoryCursor] = None, limit: int = 500) -> List[Row]:
+        if field not in ("wallet_address", "telegram_id"):
+            raise ValueError(f"Нельзя фильтровать историю по {field}")
+        conditions = [f"{field} = ?"]
+        params = [value]
+        if since is not None:
+            conditions.append("recorded_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("recorded_at < ?")
+            params.append(until)
+        if after is not None:
+            # Сравнение пар идёт по индексу (field, recorded_at) без OFFSET
+            conditions.append("(recorded_at, id) < (?, ?)")
+            params.extend(after)
+        params.append(limit)
+        records = await self.db.fetch_all(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM wallet_balance_history "
+            f"WHERE {' AND '.join(conditions)} ORDER BY recorded_at DESC, id DESC LIMIT ?",
+            params
+        )
+        return _as_rows(HISTORY_COLUMNS, records)
+
+    async def get_rollups(self, field: str, value, resolution: str,
+                          since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+        if field not in ("wallet_address", "telegram_id"):
+            raise ValueError(f"Нельзя фильтровать агрегаты по {field}")
+        records = await self.db.fetch_all(
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM wallet_balance_rollups "
+            f"WHERE resolution = ? AND {field} = ? AND bucket_start >= ? AND bucket_start < ? "
+            f"ORDER BY bucket_start, wallet_address",
+            (resolution, value, since or "", until or "9999")
+        )
+        return _as_rows(ROLLUP_COLUMNS, records)
+    
+    async def _last_rollup_at(self) -> Optional[str]:
+        return (await self.db.fetch_one("SELECT MAX(last_at) FROM wallet_balance_rollups"))[0]
+    
+    async def refresh_rollups(self, page_size: int = REFRESH_PAGE_SIZE) -> int:
+        # История читается страницами по курсору (recorded_at, id); закончившиеся
+        # корзины записываются после каждой страницы, в памяти — только открытые
+        builder = RollupBuilder()
+        cursor = (refresh_start(await self._last_rollup_at()) or "", 0)
+        updated = 0
+        while True:
+            rows = _as_rows(HISTORY_COLUMNS, await self.db.fetch_all(
+                f"SELECT {', '.join(HISTORY_COLUMNS)} FROM wallet_balance_history "
+                f"WHERE (recorded_at, id) > (?, ?) ORDER BY recorded_at, id LIMIT ?",
+                (*cursor, page_size)
+            ))
+            builder.add(rows)
+            last_page = len(rows) < page_size
+            rollups = builder.pop_all() if last_page else builder.pop_complete()
+            if rollups:
+                await self._save_rollups(rollups)
+                updated += len(rollups)
+            if last_page:
+                return updated
+            cursor = (rows[-1]["recorded_at"], rows[-1]["id"])
+    
+    async def _save_rollups(self, rollups: List[Row]):
+        await self.db.transaction(lambda conn: conn.executemany(
+            f"INSERT OR REPLACE INTO wallet_balance_rollups ({', '.join(ROLLUP_COLUMNS)}) "
+            f"VALUES ({', '.join(':' + column for column in ROLLUP_COLUMNS)})",
+            rollups
+        ))
+    
+    async def purge_history(self, before: datetime) -> int:
+        limit = purge_limit(before, await self._last_rollup_at())
+        if limit is None:
+            return 0
+        cursor = await self.db.execute("DELETE FROM wallet_balance_history WHERE recorded_at < ?", (limit,))
+        return cursor.rowcount
+
+
+class SQLiteLatestBalanceStore(LatestBalanceStore):
+    """Последние балансы в локальной SQLite базе (таблица wallet_latest_balance)"""
+    
+    def __init__(self, db: AsyncLocalDatabase):
+        self.db = db
+    
+    async def get_latest(self, wallet_addresses: Sequence[str]) -> List[Row]:
+        if not wallet_addresses:
+            return []
+        records = await self.db.fetch_all(
+            f"SELECT {', '.join(LATEST_COLUMNS)} FROM wallet_latest_balance "
+            f"WHERE wallet_address IN ({', '.join('?' * len(wallet_addresses))})",
+            list(wallet_addresses)
+        )
+        return _as_rows(LATEST_COLUMNS, records)
+    
+    async def save_latest(self, rows: List[Row]):
+        if not rows:
+            return
+        await self.db.transaction(lambda conn: conn.executemany(
+            """INSERT INTO wallet_latest_balance (wallet_address, ton_balance, spw_balance, updated_at)
+               VALUES (:wallet_address, :ton_balance, :spw_balance, :updated_at)
+               ON CONFLICT(wallet_address) DO UPDATE SET
+                   ton_balance = excluded.ton_balance,
+                   spw_balance = excluded.spw_balance,
+                   updated_at = excluded.updated_at
+               WHERE julianday(excluded.updated_at) >= julianday(wallet_latest_balance.updated_at)""",
+            rows
+        ))
+
+
+def create_storage(db: Optional[AsyncLocalDatabase] = None) -> Storage:
+    """Всё в локальной SQLite базе"""
+    db = db or async_db
+    return Storage(
+        "sqlite",
+        users=SQLiteUserStore(db),
+        lessons=SQLiteLessonProgressStore(db),
+        wallets=SQLiteWalletStore(db),
+        history=SQLiteBalanceHistoryStore(db),
+        latest=SQLiteLatestBalanceStore(db)
+    )
@@ -0,0 +1,195 @@
+# shared/storage/supabase.py
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from shared.database import Database, db
+
+from .base import (
+    HISTORY_COLUMNS, LATEST_COLUMNS, ROLLUP_COLUMNS, BalanceHistoryStore, HistoryCursor, LatestBalanceStore, Row,
+    Storage, UserStore, WalletStore
+)
+
+
+class SupabaseUserStore(UserStore):
+    """Пользователи в Supabase (таблица users, см. modules/ton_wallet/schema.sql)"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+        self.client = db.get_client()
+    
+    async def ensure_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
+        # Один запрос: существующий пользователь не меняется (ON CONFLICT DO NOTHING)
+        user_data = {
+            "telegram_id": telegram_id,
+            "username": username,
+            "created_at": datetime.now().isoformat()
+        }
+        await self.db.execute(
+            self.client.table("users")
+            .upsert(user_data, on_conflict="telegram_id", ignore_duplicates=True, returning="minimal")
+        )
+        return True
+
+
+class SupabaseWalletStore(WalletStore):
+    """Кошельки в Supabase"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+        self.client = db.get_client()
+    
+    async def add_wallet(self, telegram_id: int, wallet_address: str, friendly_name: Optional[str] = None) -> bool:
+        # Функция link_wallet (schema.sql): пользователь и кошелёк — одним запросом
+        result = await self.db.execute(
+            self.client.rpc("link_wallet", {
+                "p_telegram_id": telegram_id,
+                "p_wallet_address": wallet_address,
+                "p_friendly_name": friendly_name
+            })
+        )
+        return bool(result.data)
+    
+    async def get_user_wallets(self, telegram_id: int) -> List[Row]:
+        result = await self.db.execute(
+            self.client.table("wallets")
+            .select("*")
+            .eq("telegram_id", telegram_id)
+            .order("created_at", desc=True)
+        )
+        return result.data
+    
+    async def remove_wallet(self, telegram_id: int, wallet_address: str) -> bool:
+        result = await self.db.execute(
+            self.client.table("wallets")
+            .delete()
+            .eq("telegram_id", telegram_id)
+            .eq("wallet_address", wallet_address)
+        )
+        return len(result.data) > 0
+    
+    async def wallet_exists(self, telegram_id: int, wallet_address: str) -> bool:
+        result = await self.db.execute(
+            self.client.table("wallets")
+            .select("id")
+            .eq("telegram_id", telegram_id)
+            .eq("wallet_address", wallet_address)
+        )
+        return len(result.data) > 0
+
+
+class SupabaseBalanceHistoryStore(BalanceHistoryStore):
+    """История балансов в Supabase (таблица wallet_balance_history)"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+        self.client = db.get_client()
+    
+    async def save_balance(self, telegram_id: int, wallet_address: str, ton_balance, spw_balance) -> bool:
+        history_data = {
+            "telegram_id": telegram_id,
+            "wallet_address": wallet_address,
+            "ton_balance": str(ton_balance),  # Decimal → строка для JSON
+            "spw_balance": str(spw_balance),
+            "recorded_at": datetime.now().isoformat()
+        }
+        result = await self.db.execute(
+            self.client.table("wallet_balance_history").insert(history_data)
+        )
+        return len(result.data) > 0
+    
+    async def save_balances(self, rows: List[Row]) -> List[bool]:
+        # Один INSERT на всю пачку; PostgREST вставляет её в одной транзакции
+        await self.db.execute(
+            self.client.table("wallet_balance_history")
+            .insert(rows, returning="minimal")
+        )
+        return [True] * len(rows)
+    
+    async def get_history_page(self, field: str, value, since: Optional[str] = None, until: Optional[str] = None,
+                               after: Optional[HistoryCursor] = None, limit: int = 500) -> List[Row]:
+        request = self.client.table("wallet_balance_history") \
+            .select(",".join(HISTORY_COLUMNS)) \
+            .eq(field, value)
+        if since is not None:
+            request = request.gte("recorded_at", since)
+        if until is not None:
+            request = request.lt("recorded_at", until)
+        if after is not None:
+            # (recorded_at, id) < курсора; значения в кавычках — в ISO дате есть «:» и «.»
+            recorded_at, row_id = after
+            request = request.or_(
+                f'recorded_at.lt."{recorded_at}",and(recorded_at.eq."{recorded_at}",id.lt."{row_id}")'
+            )
+        result = await self.db.execute(
+            request
+            .order("recorded_at", desc=True)
+            .order("id", desc=True)
+            .limit(limit)
+        )
+        return result.data
+
+    async def get_rollups(self, field: str, value, resolution: str,
+                          since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+        request = self.client.table("wallet_balance_rollups") \
+            .select(",".join(ROLLUP_COLUMNS)) \
+            .eq("resolution", resolution) \
+            .eq(field, value)
+        if since is not None:
+            request = request.gte("bucket_start", since)
+        if until is not None:
+            request = request.lt("bucket_start", until)
+        result = await self.db.execute(request.order("bucket_start").order("wallet_address"))
+        return result.data
+    
+    async def refresh_rollups(self) -> int:
+        # Агрегация на стороне базы (schema.sql: refresh_balance_rollups)
+        result = await self.db.execute(self.client.rpc("refresh_balance_rollups", {}))
+        return result.data or 0
+    
+    async def purge_history(self, before: datetime) -> int:
+        result = await self.db.execute(
+            self.client.rpc("purge_balance_history", {"p_before": before.astimezone(timezone.utc).isoformat()})
+        )
+        return result.data or 0
+
+
+class SupabaseLatestBalanceStore(LatestBalanceStore):
+    """Последние балансы в Supabase (таблица wallet_latest_balance)"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+        self.client = db.get_client()
+    
+    async def get_latest(self, wallet_addresses: Sequence[str]) -> List[Row]:
+        if not wallet_addresses:
+            return []
+        result = await self.db.execute(
+            self.client.table("wallet_latest_balance")
+            .select(",".join(LATEST_COLUMNS))
+            .in_("wallet_address", list(wallet_addresses))
+        )
+        return result.data
+    
+    async def save_latest(self, rows: List[Row]):
+        if not rows:
+            return
+        # Функция save_latest_balances (schema.sql): upsert, не заменяющий более новые строки
+        await self.db.execute(self.client.rpc("save_latest_balances", {"p_rows": rows}))
+
+
+def create_storage() -> Storage:
+    """
+    Пользователи, кошельки и история — в Supabase.
+    Прогресс обучения в Supabase не хранится (нет таблиц), он остаётся в SQLite.
+    """
+    from .sqlite import SQLiteLessonProgressStore
+    from shared.async_database import async_db
+    
+    return Storage(
+        "supabase",
+        users=SupabaseUserStore(db),
+        lessons=SQLiteLessonProgressStore(async_db),
+        wallets=SupabaseWalletStore(db),
+        history=SupabaseBalanceHistoryStore(db),
+        latest=SupabaseLatestBalanceStore(db)
+    )
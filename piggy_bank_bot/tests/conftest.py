@@ -0,0 +1,47 @@
+# tests/conftest.py
+"""
+Тесты бота.
+    
+    python -m pytest -q tests        # из каталога piggy_bank_bot
+
+Асинхронный код запускается через asyncio.run — плагины pytest не нужны.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+
+# Конфигурация читается при импорте shared.config — задаём до импорта бота
+for name, value in {
+    "BOT_TOKEN": "123456:test",
+    "SUPABASE_URL": "https://test.supabase.co",
+    "SUPABASE_KEY": "test-key",
+    "TON_API_KEY": "test",
+    "STORAGE_BACKEND": "memory",
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, str(BOT_DIR))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Базы данных создаются в рабочей директории — у каждого теста своя"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def local_database(workdir, monkeypatch):
+    """
+    Отдельная база SQLite в рабочей директории теста.
+    Импорт — внутри фикстуры: модуль при импорте открывает глобальную базу в текущей директории.
+    """
+    from shared.local_database import LocalDatabase
+    
+    monkeypatch.setattr(LocalDatabase, "_instance", None)
+    db = LocalDatabase(str(workdir / "test.db"), readers=2)
+    yield db
+    db.close()
@@ -0,0 +1,22 @@
+# tests/test_admin_module.py
+import datetime
+
+from aiogram.types import Chat, Message, User
+
+from modules.admin import admin_module
+
+
+def message(from_user) -> Message:
+    return Message(
+        message_id=1, date=datetime.datetime.now(), chat=Chat(id=-100, type="channel"),
+        from_user=from_user, text="/stats"
+    )
+
+
+def test_is_admin_handles_message_without_sender(monkeypatch):
+    monkeypatch.setattr(admin_module.config, "ADMIN_TELEGRAM_ID", 42)
+    
+    assert admin_module.is_admin(message(User(id=42, is_bot=False, first_name="Admin")))
+    assert not admin_module.is_admin(message(User(id=7, is_bot=False, first_name="User")))
+    # Сообщения каналов приходят без from_user
+    assert not admin_module.is_admin(message(None))
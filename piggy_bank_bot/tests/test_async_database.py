@@ -0,0 +1,73 @@
+# tests/test_async_database.py
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def async_database(local_database):
+    from shared.async_database import AsyncLocalDatabase
+    
+    # Окно побольше, чтобы одновременные запросы гарантированно попали в одну пачку
+    return AsyncLocalDatabase(local_database, batch_window=0.05)
+
+
+def add_user(telegram_id: int):
+    return "INSERT INTO users (telegram_id) VALUES (?)", (str(telegram_id),)
+
+
+def user_ids(db) -> list:
+    return [int(row[0]) for row in db.fetch_all("SELECT telegram_id FROM users ORDER BY id")]
+
+
+def test_concurrent_writes_share_one_batch(async_database):
+    async def scenario():
+        try:
+            await asyncio.gather(*(async_database.execute(*add_user(i)) for i in range(50)))
+        finally:
+            await async_database.close()
+    
+    asyncio.run(scenario())
+    
+    assert async_database.batches == 1
+    assert async_database.batched_writes == 50
+    assert user_ids(async_database.db) == list(range(50))
+
+
+def test_failed_request_does_not_poison_batch(async_database):
+    def failing(conn):
+        conn.execute(*add_user(2))
+        raise RuntimeError("boom")
+    
+    async def scenario():
+        try:
+            return await asyncio.gather(
+                async_database.execute(*add_user(1)),
+                async_database.transaction(failing),
+                async_database.execute(*add_user(3)),
+                return_exceptions=True
+            )
+        finally:
+            await async_database.close()
+    
+    results = asyncio.run(scenario())
+    
+    assert isinstance(results[1], RuntimeError)
+    assert not isinstance(results[0], BaseException) and not isinstance(results[2], BaseException)
+    assert async_database.batches == 1
+    # Откатилась только запись упавшего запроса
+    assert user_ids(async_database.db) == [1, 3]
+
+
+def test_close_flushes_pending_writes(async_database):
+    async def scenario():
+        writes = [asyncio.ensure_future(async_database.execute(*add_user(i))) for i in range(10)]
+        # Запросы уже в очереди, но пачка ещё не собрана: close() должен их дописать
+        await asyncio.sleep(0)
+        await async_database.close()
+        return await asyncio.wait_for(asyncio.gather(*writes), timeout=1)
+    
+    results = asyncio.run(scenario())
+    
+    assert len(results) == 10
+    assert user_ids(async_database.db) == list(range(10))
@@ -0,0 +1,110 @@
+# tests/test_balance_service.py
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+MSK = timezone(timedelta(hours=3))
+
+
+@pytest.fixture
+def ton_wallet(monkeypatch):
+    """
+    Сервис балансов поверх хранилища в памяти и TON API, который
+    не отвечает для адресов из failing.
+    Импорт — внутри: пакет modules.ton_wallet при импорте подключает глобальную базу.
+    """
+    from modules.ton_wallet.balance_service import BalanceService
+    from modules.ton_wallet.repository import WalletRepository
+    from modules.ton_wallet.ton_service import TONAPIError, TONService
+    from shared.storage.memory import create_storage
+    
+    failing = set()
+    
+    async def enter(self):
+        return self
+    
+    async def leave(self, exc_type, exc_val, exc_tb):
+        return None
+    
+    async def ton_balance(self, address: str) -> Decimal:
+        if address in failing:
+            raise TONAPIError(f"TON API error 500 for {address}")
+        return Decimal(1_500_000_000)
+    
+    async def spw_balance(self, address: str) -> Decimal:
+        return Decimal(7)
+    
+    monkeypatch.setattr(TONService, "__aenter__", enter)
+    monkeypatch.setattr(TONService, "__aexit__", leave)
+    monkeypatch.setattr(TONService, "get_ton_balance", ton_balance)
+    monkeypatch.setattr(TONService, "get_spw_balance", spw_balance)
+    
+    repository = WalletRepository(storage=create_storage())
+    return BalanceService(repository, fresh_ttl=60), failing
+
+
+def latest_row(address: str, updated_at: datetime) -> dict:
+    return {"wallet_address": address, "ton_balance": "1", "spw_balance": "2", "updated_at": updated_at.isoformat()}
+
+
+def test_stored_timestamps_with_offset_are_compared_in_utc(ton_wallet):
+    service, _ = ton_wallet
+    now = datetime.now(timezone.utc)
+    
+    async def scenario():
+        await service.repository.storage.latest.save_latest([
+            latest_row("EQfresh", (now - timedelta(seconds=10)).astimezone(MSK)),
+            latest_row("EQstale", (now - timedelta(minutes=5)).astimezone(MSK)),
+            # Строка старого формата: местное время без пояса
+            latest_row("EQlocal", datetime.now() - timedelta(seconds=10)),
+        ])
+        return await service.get_cached(["EQfresh", "EQstale", "EQlocal"])
+    
+    balances = asyncio.run(scenario())
+    
+    assert all(balance.updated_at.utcoffset() == timedelta(0) for balance in balances.values())
+    assert service.is_fresh(balances["EQfresh"])
+    assert not service.is_fresh(balances["EQstale"])
+    assert service.is_fresh(balances["EQlocal"])
+
+
+def test_failed_fetch_is_neither_returned_nor_saved(ton_wallet):
+    service, failing = ton_wallet
+    failing.add("EQbad")
+    old = datetime.now(timezone.utc) - timedelta(hours=1)
+    
+    async def scenario():
+        await service.repository.storage.latest.save_latest([latest_row("EQbad", old)])
+        fresh = await service.refresh(["EQok", "EQbad"])
+        return fresh, await service.get_cached(["EQok", "EQbad"])
+    
+    fresh, stored = asyncio.run(scenario())
+    
+    assert list(fresh) == ["EQok"]
+    assert service.is_fresh(fresh["EQok"])
+    assert stored["EQok"].ton_balance == Decimal(1_500_000_000)
+    # Нули вместо неизвестного баланса не записаны: остался прежний
+    assert stored["EQbad"].ton_balance == Decimal(1)
+    assert stored["EQbad"].updated_at == old
+
+
+def test_balance_time_is_shown_in_local_time(monkeypatch):
+    from modules.ton_wallet.models import LatestBalance, Wallet
+    from modules.ton_wallet.module import format_balances
+    
+    monkeypatch.setenv("TZ", "Europe/Moscow")
+    time.tzset()
+    try:
+        updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        wallet = Wallet(telegram_id=1, wallet_address="EQ" + "a" * 46)
+        balance = LatestBalance(wallet.wallet_address, Decimal(1), Decimal(2), updated_at)
+        
+        text = format_balances([wallet], {wallet.wallet_address: balance})
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    
+    assert text.endswith(f"_Обновлено: {updated_at.astimezone(MSK).strftime('%H:%M')}_")
@@ -0,0 +1,72 @@
+# tests/test_callback_dedup.py
+import asyncio
+import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from core.callback_dedup import CallbackDedupMiddleware, setup_callback_dedup
+from core.scheduler import UpdateScheduler
+
+USER = User(id=1, is_bot=False, first_name="Test")
+CHAT = Chat(id=1, type="private")
+MENU = Message(message_id=1, date=datetime.datetime.now(), chat=CHAT, from_user=USER, text="menu")
+
+
+def tap(update_id: int) -> Update:
+    query = CallbackQuery(id=str(update_id), from_user=USER, chat_instance="1", data="buy", message=MENU)
+    return Update(update_id=update_id, callback_query=query)
+
+
+def test_middleware_runs_before_fsm():
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=UpdateScheduler())
+    dedup = CallbackDedupMiddleware()
+    
+    setup_callback_dedup(dp, dedup)
+    
+    middlewares = list(dp.update.outer_middleware)
+    assert middlewares.index(dedup) < middlewares.index(dp.fsm)
+
+
+def test_concurrent_duplicate_is_dropped_without_waiting_for_chat_lock():
+    dedup = CallbackDedupMiddleware(window=1.0)
+    handled = []
+    answered = []
+    
+    async def scenario():
+        release = asyncio.Event()
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=UpdateScheduler())
+        setup_callback_dedup(dp, dedup)
+        router = Router()
+        
+        @router.callback_query()
+        async def slow_handler(query: CallbackQuery):
+            handled.append(query.id)
+            await release.wait()
+        
+        dp.include_router(router)
+        bot = Bot(token="123456:test")
+        
+        async def fake_telegram(make_request, bot, method):
+            if isinstance(method, AnswerCallbackQuery):
+                answered.append(method.callback_query_id)
+            return True
+        
+        bot.session.middleware(fake_telegram)
+        try:
+            first = asyncio.ensure_future(dp.feed_update(bot, tap(1)))
+            await asyncio.sleep(0)
+            # Первое нажатие держит блокировку чата; повтор не должен её ждать
+            await asyncio.wait_for(dp.feed_update(bot, tap(2)), timeout=1)
+            assert answered == ["2"]
+            release.set()
+            await first
+        finally:
+            await bot.session.close()
+    
+    asyncio.run(scenario())
+    
+    assert handled == ["1"]
+    assert dedup.dropped == 1
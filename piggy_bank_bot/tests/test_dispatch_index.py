@@ -0,0 +1,108 @@
+# tests/test_dispatch_index.py
+import asyncio
+import datetime
+
+import pytest
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from core.dispatch_index import DispatchIndex, _Pattern, _PrefixTrie, setup_dispatch_index
+
+USER = User(id=1, is_bot=False, first_name="Test")
+CHAT = Chat(id=1, type="private")
+
+
+def message(text: str) -> Message:
+    return Message(message_id=1, date=datetime.datetime.now(), chat=CHAT, from_user=USER, text=text)
+
+
+def callback(data: str) -> CallbackQuery:
+    return CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data, message=message("menu"))
+
+
+def test_pattern_converts_typed_params():
+    pattern = _Pattern(1, "quiz_answer_{lesson_id:int}_{option:int}")
+    
+    assert pattern.parse("quiz_answer_12_-3") == {"lesson_id": 12, "option": -3}
+
+
+def test_pattern_rejects_unconvertible_value():
+    pattern = _Pattern(1, "lesson_{lesson_id:int}")
+    
+    assert pattern.parse("lesson_abc") is None
+    assert pattern.parse("lesson_1_extra") is None
+
+
+def test_pattern_str_param_and_unknown_type():
+    assert _Pattern(1, "🗑️ {name}").parse("🗑️ Main wallet") == {"name": "Main wallet"}
+    with pytest.raises(ValueError):
+        _Pattern(1, "lesson_{lesson_id:float}")
+
+
+def test_trie_yields_longest_prefix_first():
+    trie = _PrefixTrie()
+    trie.add("", "root")
+    trie.add("quiz", "short")
+    trie.add("quiz_answer", "long")
+    
+    assert list(trie.iter_matches("quiz_answer_1")) == ["long", "short", "root"]
+    assert list(trie.iter_matches("lesson")) == ["root"]
+
+
+def test_prefix_collisions_resolve_by_full_pattern():
+    index = DispatchIndex()
+    lesson = index.callback("quiz_{lesson_id:int}")
+    answer = index.callback("quiz_answer_{lesson_id:int}_{option:int}")
+    exact = index.callback("quiz_answer_menu")
+    
+    assert index.resolve(callback("quiz_7")) == {lesson.key: {"lesson_id": 7}}
+    assert index.resolve(callback("quiz_answer_7_2")) == {answer.key: {"lesson_id": 7, "option": 2}}
+    assert index.resolve(callback("quiz_answer_menu")) == {exact.key: {}}
+    assert index.resolve(callback("quiz_answer_x_2")) == {}
+
+
+def test_exact_and_pattern_routes_both_match():
+    index = DispatchIndex()
+    exact = index.text("📊 Баланс")
+    pattern = index.text("📊 {what}")
+    
+    assert index.resolve(message("📊 Баланс")) == {exact.key: {}, pattern.key: {"what": "Баланс"}}
+
+
+def test_unindexed_events_are_not_narrowed():
+    index = DispatchIndex()
+    index.add_module("lessons", {"callback_prefixes": ["lesson_"], "commands": ["learn"]})
+    
+    assert index.modules_for(callback("lesson_1")) == frozenset({"lessons"})
+    assert index.modules_for(callback("other")) == frozenset()
+    assert index.modules_for(message("/learn@bot now")) == frozenset({"lessons"})
+    assert index.modules_for(object()) is None
+
+
+def test_handlers_fall_through_to_unindexed_routes():
+    index = DispatchIndex()
+    dp = Dispatcher()
+    setup_dispatch_index(dp, index)
+    router = Router()
+    dp.include_router(router)
+    handled = []
+    
+    @router.callback_query(index.callback("lesson_{lesson_id:int}"))
+    async def indexed(query: CallbackQuery, lesson_id: int):
+        handled.append(("indexed", lesson_id))
+    
+    @router.callback_query(F.data.startswith("lesson_"))
+    async def unindexed(query: CallbackQuery):
+        handled.append(("unindexed", query.data))
+    
+    async def scenario():
+        bot = Bot(token="123456:test")
+        try:
+            for update_id, data in enumerate(("lesson_5", "lesson_next"), 1):
+                await dp.feed_update(bot, Update(update_id=update_id, callback_query=callback(data)))
+        finally:
+            await bot.session.close()
+    
+    asyncio.run(scenario())
+    
+    assert handled == [("indexed", 5), ("unindexed", "lesson_next")]
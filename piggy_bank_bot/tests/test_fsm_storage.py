@@ -0,0 +1,109 @@
+# tests/test_fsm_storage.py
+import asyncio
+import json
+import threading
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from core.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def test_state_survives_restart(workdir):
+    async def scenario():
+        storage = SQLiteStorage(db_path=str(workdir / "fsm.db"))
+        await storage.set_state(KEY, "Form:name")
+        await storage.set_data(KEY, {"step": 1})
+        await storage.close()
+        
+        storage = SQLiteStorage(db_path=str(workdir / "fsm.db"))
+        try:
+            return await storage.get_state(KEY), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+    
+    assert asyncio.run(scenario()) == ("Form:name", {"step": 1})
+
+
+def test_evicted_key_reads_batch_in_flight(workdir):
+    async def scenario():
+        storage = SQLiteStorage(db_path=str(workdir / "fsm.db"), flush_interval=60)
+        await storage.set_data(KEY, {"step": 1})
+        await storage.flush()
+        
+        # Вторая пачка «застревает» в потоке записи
+        release = threading.Event()
+        write_batch = storage._write_batch
+        
+        def slow_write(batch):
+            release.wait(5)
+            write_batch(batch)
+        
+        storage._write_batch = slow_write
+        await storage.set_data(KEY, {"step": 2})
+        flush = asyncio.ensure_future(storage.flush())
+        await asyncio.sleep(0.05)
+        storage._cache.clear()
+        
+        # В базе ещё step=1, но читать надо пачку в записи
+        data = await storage.get_data(KEY)
+        release.set()
+        await flush
+        await storage.close()
+        return data
+    
+    assert asyncio.run(scenario()) == {"step": 2}
+
+
+def test_read_extends_ttl(workdir):
+    async def scenario():
+        storage = SQLiteStorage(db_path=str(workdir / "fsm.db"), flush_interval=60, ttl=100)
+        await storage.set_state(KEY, "Form:name")
+        await storage.flush()
+        # Последняя запись была 60 с назад — больше половины ttl
+        key = storage._make_key(KEY)
+        state, data, _ = storage._cache[key]
+        storage._cache[key] = (state, data, time.time() - 60)
+        
+        assert await storage.get_state(KEY) == "Form:name"
+        touched = storage._dirty[key][2]
+        await storage.close()
+        return touched
+    
+    assert time.time() - asyncio.run(scenario()) < 5
+
+
+def test_write_during_flush_is_flushed_later(workdir):
+    async def scenario():
+        storage = SQLiteStorage(db_path=str(workdir / "fsm.db"), flush_interval=0.01)
+        release = threading.Event()
+        write_batch = storage._write_batch
+        
+        def slow_write(batch):
+            release.wait(5)
+            write_batch(batch)
+        
+        storage._write_batch = slow_write
+        await storage.set_state(KEY, "Form:name")
+        await asyncio.sleep(0.05)
+        # Сброс первой записи идёт; вторая приходит во время него
+        await storage.set_data(KEY, {"step": 2})
+        storage._write_batch = write_batch
+        release.set()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not storage._dirty and not storage._flushing:
+                break
+        dirty = dict(storage._dirty)
+        
+        storage._cache.clear()
+        data = await asyncio.to_thread(storage._read, storage._make_key(KEY))
+        await storage.close()
+        return dirty, data
+    
+    dirty, data = asyncio.run(scenario())
+    
+    assert dirty == {}
+    assert data is not None and json.loads(data[1]) == {"step": 2}
@@ -0,0 +1,34 @@
+# tests/test_lessons_module.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeCallback:
+    """CallbackQuery, который запоминает ответы"""
+    
+    def __init__(self, user_id: int):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+    
+    async def answer(self, text=None, show_alert=None):
+        self.answers.append((text, show_alert))
+
+
+@pytest.mark.parametrize("question_index, selected_option", [(0, -1), (0, 4), (-1, 0), (5, 0)])
+def test_quiz_answer_rejects_out_of_range_indexes(monkeypatch, question_index, selected_option):
+    # Пакет modules.lessons при импорте подключает глобальную базу
+    from modules.lessons import lessons_module
+    
+    question = {"question": "?", "options": ["a", "b", "c", "d"], "correct": 1, "explanation": ""}
+    quiz_state = {"lesson_id": 1, "questions": [question], "answers": [], "correct_answers": 0}
+    monkeypatch.setitem(lessons_module.user_quiz_attempts, "7", quiz_state)
+    callback = FakeCallback(7)
+    
+    asyncio.run(lessons_module.handle_quiz_answer(
+        callback, lesson_id=1, question_index=question_index, selected_option=selected_option
+    ))
+    
+    assert len(callback.answers) == 1 and callback.answers[0][1] is True
+    assert quiz_state["answers"] == []
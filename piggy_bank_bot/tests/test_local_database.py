@@ -0,0 +1,45 @@
+# tests/test_local_database.py
+
+
+def test_new_database_is_fully_migrated(local_database):
+    assert local_database.fetch_one("PRAGMA user_version")[0] == 3
+
+
+def test_migration_2_backfills_rewards_earned(local_database):
+    with local_database.writer() as conn:
+        user_id = conn.execute("INSERT INTO users (telegram_id) VALUES ('1')").lastrowid
+        conn.execute("INSERT INTO users (telegram_id) VALUES ('2')")
+        conn.executemany(
+            "INSERT INTO user_lessons (user_id, lesson_id, quiz_score) VALUES (?, ?, 100)",
+            [(user_id, 1), (user_id, 3), (user_id, 7)]
+        )
+        # База до миграции 2: маска уже есть, суммы наград ещё нет
+        conn.execute("UPDATE users SET completed_mask = ? WHERE id = ?", ((1 << 1) | (1 << 3) | (1 << 7), user_id))
+        conn.execute("PRAGMA user_version = 1")
+    
+    with local_database.writer() as conn:
+        local_database._migrate(conn, {1: 10, 3: 30})
+    
+    rows = local_database.fetch_all("SELECT telegram_id, rewards_earned FROM users ORDER BY id")
+    assert rows == [("1", 40), ("2", 0)]
+    assert local_database.fetch_one("PRAGMA user_version")[0] == 3
+
+
+def test_migration_3_moves_latest_balances_to_utc(local_database):
+    from datetime import datetime, timezone
+    
+    local = datetime(2026, 10, 17, 12, 30, 15, 250000)
+    aware = "2026-10-17T09:00:00+03:00"
+    with local_database.writer() as conn:
+        conn.executemany(
+            "INSERT INTO wallet_latest_balance (wallet_address, ton_balance, spw_balance, updated_at) VALUES (?, '1', '2', ?)",
+            [("EQlocal", local.isoformat()), ("EQaware", aware)]
+        )
+        conn.execute("PRAGMA user_version = 2")
+    
+    with local_database.writer() as conn:
+        local_database._migrate(conn, {})
+    
+    rows = dict(local_database.fetch_all("SELECT wallet_address, updated_at FROM wallet_latest_balance"))
+    assert datetime.fromisoformat(rows["EQlocal"]) == local.astimezone(timezone.utc)
+    assert rows["EQaware"] == aware
@@ -0,0 +1,78 @@
+# tests/test_logging_setup.py
+import json
+import logging
+import queue
+import sys
+
+from core.logging_setup import JsonFormatter, RateLimitFilter, _DeferredQueueHandler
+
+
+def make_record(msg, args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_prepare_merges_args_at_call_time():
+    log_queue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    wallets = ["EQ1"]
+    
+    handler.emit(make_record("Кошельки: %s", (wallets,), user_id=42))
+    # Объект из args меняется раньше, чем поток QueueListener запишет запись
+    wallets.append("EQ2")
+    record = log_queue.get_nowait()
+    
+    assert record.msg == "Кошельки: ['EQ1']"
+    assert record.args is None
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Кошельки: ['EQ1']"
+    assert entry["user_id"] == 42
+
+
+def test_prepare_keeps_exception_for_listener():
+    handler = _DeferredQueueHandler(queue.SimpleQueue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("Ошибка %d", (1,))
+        record.exc_info = sys.exc_info()
+    
+    prepared = handler.prepare(record)
+    
+    assert prepared is not record
+    assert prepared.exc_info is record.exc_info
+    assert "ValueError: boom" in JsonFormatter().format(prepared)
+
+
+def limited_filter(**kwargs) -> RateLimitFilter:
+    return RateLimitFilter(burst=2, period=60, **kwargs)
+
+
+def passed(log_filter: RateLimitFilter, record_factory, count: int = 5) -> int:
+    return sum(log_filter.filter(record_factory()) for _ in range(count))
+
+
+def test_rate_limit_is_opt_in():
+    log_filter = limited_filter()
+    
+    assert passed(log_filter, lambda: make_record("Урок %d сохранён", (1,))) == 5
+    assert passed(log_filter, lambda: make_record("Found %d jettons", (3,), rate_limit=True)) == 2
+
+
+def test_rate_limit_by_logger_never_drops_warnings():
+    log_filter = limited_filter(loggers=["test"])
+    
+    def warning():
+        record = make_record("Flood control", ())
+        record.levelno = logging.WARNING
+        return record
+    
+    assert passed(log_filter, lambda: make_record("Found %d jettons", (3,))) == 2
+    assert passed(log_filter, warning) == 5
+
+
+def test_rate_limit_marker_is_not_logged():
+    entry = json.loads(JsonFormatter().format(make_record("Found %d jettons", (3,), rate_limit=True)))
+    
+    assert "rate_limit" not in entry
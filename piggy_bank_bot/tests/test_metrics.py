@@ -0,0 +1,30 @@
+# tests/test_metrics.py
+from core.metrics import MetricsRegistry
+
+
+def test_counters_and_gauges_are_typed():
+    registry = MetricsRegistry()
+    registry.register_counter("bot_things_total", "Things done", lambda: 3)
+    registry.register_gauge("bot_things_waiting", "Things waiting", lambda: 1)
+    
+    lines = registry.render_prometheus().splitlines()
+    
+    assert "# TYPE bot_things_total counter" in lines
+    assert "bot_things_total 3" in lines
+    assert "# TYPE bot_things_waiting gauge" in lines
+    assert "bot_things_waiting 1" in lines
+
+
+def test_broken_getter_is_skipped():
+    registry = MetricsRegistry()
+    registry.register_counter("bot_broken_total", "Broken", lambda: 1 / 0)
+    
+    assert "bot_broken_total" not in registry.render_prometheus()
+
+
+def test_snapshot_skips_broken_getter():
+    registry = MetricsRegistry()
+    registry.register_counter("bot_broken_total", "Broken", lambda: 1 / 0)
+    registry.register_gauge("bot_things_waiting", "Things waiting", lambda: 1)
+    
+    assert registry.snapshot() == {"bot_things_waiting": ("gauge", "Things waiting", 1)}
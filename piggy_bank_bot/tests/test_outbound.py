@@ -0,0 +1,116 @@
+# tests/test_outbound.py
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from core.outbound import OutboundLimiter
+
+KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="OK", callback_data="ok")]])
+
+
+def make_limiter(**kwargs) -> OutboundLimiter:
+    # Лимиты не мешают: проверяется логика правок, а не скорость
+    return OutboundLimiter(global_rate=1000, chat_rate=1000, chat_burst=1000, **kwargs)
+
+
+class FakeTelegram:
+    """make_request, который запоминает отправленные запросы"""
+    
+    def __init__(self):
+        self.sent = []
+        self.release = None
+    
+    async def __call__(self, bot, method):
+        if self.release is not None:
+            await self.release.wait()
+        self.sent.append(method)
+        return True
+
+
+def edit_text(text: str, **kwargs) -> EditMessageText:
+    return EditMessageText(chat_id=1, message_id=5, text=text, **kwargs)
+
+
+def test_unchanged_edit_is_skipped():
+    limiter, telegram = make_limiter(), FakeTelegram()
+    
+    async def scenario():
+        await limiter(telegram, None, edit_text("a"))
+        await limiter(telegram, None, edit_text("a"))
+    
+    asyncio.run(scenario())
+    
+    assert len(telegram.sent) == 1
+    assert limiter.skipped == 1
+
+
+def test_edit_of_other_type_invalidates_content():
+    limiter, telegram = make_limiter(), FakeTelegram()
+    
+    async def scenario():
+        await limiter(telegram, None, edit_text("a", reply_markup=KEYBOARD))
+        await limiter(telegram, None, EditMessageReplyMarkup(chat_id=1, message_id=5))
+        # Клавиатуру убрали — вернуть её той же правкой текста нужно
+        await limiter(telegram, None, edit_text("a", reply_markup=KEYBOARD))
+    
+    asyncio.run(scenario())
+    
+    assert len(telegram.sent) == 3
+    assert limiter.skipped == 0
+
+
+def test_content_ttl_zero_never_skips():
+    limiter, telegram = make_limiter(content_ttl=0), FakeTelegram()
+    
+    async def scenario():
+        await limiter(telegram, None, edit_text("a"))
+        await limiter(telegram, None, edit_text("a"))
+    
+    asyncio.run(scenario())
+    
+    assert len(telegram.sent) == 2
+
+
+def test_coalesced_edit_survives_first_caller_cancel():
+    limiter, telegram = make_limiter(), FakeTelegram()
+    
+    async def scenario():
+        telegram.release = asyncio.Event()
+        # Первая правка занимает чат, вторая и третья ждут и схлопываются
+        busy = asyncio.ensure_future(limiter(telegram, None, edit_text("busy")))
+        await asyncio.sleep(0)
+        first = asyncio.ensure_future(limiter(telegram, None, EditMessageText(chat_id=1, message_id=6, text="b")))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(limiter(telegram, None, EditMessageText(chat_id=1, message_id=6, text="c")))
+        await asyncio.sleep(0)
+        first.cancel()
+        telegram.release.set()
+        await busy
+        return await second, first.cancelled()
+    
+    result, first_cancelled = asyncio.run(scenario())
+    
+    assert result is True and first_cancelled
+    assert [method.text for method in telegram.sent] == ["busy", "c"]
+    assert limiter.coalesced == 1
+
+
+def test_retry_after_pauses_chat_and_global_gate():
+    limiter = make_limiter()
+    calls = []
+    
+    async def flooded(bot, method):
+        calls.append(method)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        return True
+    
+    tokens_before = limiter.gate.bucket.tokens
+    asyncio.run(limiter(flooded, None, edit_text("a")))
+    
+    assert len(calls) == 2
+    assert limiter.retries == 1
+    # pause() срезает запас общего ведра, а не только ведра чата
+    assert limiter.gate.bucket.tokens < tokens_before - 1
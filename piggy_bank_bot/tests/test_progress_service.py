@@ -0,0 +1,72 @@
+# tests/test_progress_service.py
+import asyncio
+
+import pytest
+
+LESSON_ID = 3
+REWARD = 50
+USER_ID = 1001
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def lesson_store(request):
+    if request.param == "memory":
+        from shared.storage.memory import MemoryLessonProgressStore, MemoryUserStore
+        
+        yield MemoryLessonProgressStore(MemoryUserStore())
+        return
+    
+    from shared.async_database import AsyncLocalDatabase
+    from shared.storage.sqlite import SQLiteLessonProgressStore
+    
+    db = AsyncLocalDatabase(request.getfixturevalue("local_database"))
+    yield SQLiteLessonProgressStore(db)
+    asyncio.run(db.close())
+
+
+def make_service(store):
+    # Пакет modules.lessons при импорте подключает модуль уроков и глобальную базу
+    from modules.lessons.progress_service import ProgressService
+    
+    return ProgressService(store, {LESSON_ID: REWARD})
+
+
+def test_concurrent_completions_credit_reward_once(lesson_store):
+    service = make_service(lesson_store)
+    
+    async def scenario():
+        # Прогресс до прохождения уже в кеше
+        before = await service.get(USER_ID)
+        results = await asyncio.gather(*(service.complete_lesson(USER_ID, LESSON_ID, 100) for _ in range(20)))
+        return before, results, await service.get(USER_ID), await lesson_store.get_progress(USER_ID)
+    
+    before, results, cached, stored = asyncio.run(scenario())
+    
+    assert not before.has(LESSON_ID)
+    assert [newly for _, newly in results].count(True) == 1
+    assert stored["spw_balance"] == REWARD
+    assert stored["rewards_earned"] == REWARD
+    # Кеш обновлён результатом транзакции, а не прочитан заново
+    assert service.misses == 1
+    assert cached.has(LESSON_ID)
+    assert (cached.spw_balance, cached.rewards) == (REWARD, REWARD)
+
+
+def test_failed_completion_invalidates_cache(lesson_store, monkeypatch):
+    service = make_service(lesson_store)
+    
+    async def broken(*args):
+        raise RuntimeError("database is locked")
+    
+    async def scenario():
+        await service.get(USER_ID)
+        monkeypatch.setattr(lesson_store, "complete_lesson", broken)
+        with pytest.raises(RuntimeError):
+            await service.complete_lesson(USER_ID, LESSON_ID, 100)
+        return await service.get(USER_ID)
+    
+    progress = asyncio.run(scenario())
+    
+    # После ошибки прогресс перечитан из базы
+    assert service.misses == 2
+    assert not progress.has(LESSON_ID)
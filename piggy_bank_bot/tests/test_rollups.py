@@ -0,0 +1,86 @@
+# tests/test_rollups.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from shared.storage.rollups import HistoryMaintenance, aggregate, purge_limit
+
+START = datetime(2026, 10, 1, 22, 30)
+
+
+def history_rows(count: int) -> list:
+    # Два кошелька, запись каждые 10 минут: корзины пересекают границы страниц и суток
+    return [
+        {
+            "telegram_id": 1,
+            "wallet_address": f"EQ{i % 2}",
+            "ton_balance": str(1000 + i),
+            "spw_balance": str(i % 7),
+            "recorded_at": (START + timedelta(minutes=10 * i)).isoformat()
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def sqlite_history(local_database):
+    from shared.async_database import AsyncLocalDatabase
+    from shared.storage.sqlite import SQLiteBalanceHistoryStore
+    
+    db = AsyncLocalDatabase(local_database)
+    yield SQLiteBalanceHistoryStore(db)
+    asyncio.run(db.close())
+
+
+def test_paged_refresh_matches_full_aggregate(sqlite_history):
+    rows = history_rows(400)
+    
+    async def scenario():
+        await sqlite_history.save_balances(rows)
+        updated = await sqlite_history.refresh_rollups(page_size=37)
+        stored = []
+        for resolution in ("hour", "day"):
+            for wallet in ("EQ0", "EQ1"):
+                stored += await sqlite_history.get_rollups("wallet_address", wallet, resolution)
+        return updated, stored
+    
+    updated, stored = asyncio.run(scenario())
+    
+    expected = aggregate(rows)
+    key = lambda row: (row["resolution"], row["wallet_address"], row["bucket_start"])
+    assert updated == len(expected)
+    assert sorted(stored, key=key) == sorted(
+        ({column: row[column] for column in stored[0]} for row in expected), key=key
+    )
+
+
+def test_purge_limit_converts_aware_before_to_store_time():
+    last_at = "2026-10-10T12:00:00"
+    before = datetime(2026, 10, 5, 12, 0, tzinfo=timezone.utc)
+    
+    assert purge_limit(before, last_at) == before.astimezone().replace(tzinfo=None).isoformat()
+    # Строки с поясом (Supabase) сравниваются как есть
+    assert purge_limit(before, "2026-10-10T12:00:00+00:00") == before.isoformat()
+    assert purge_limit(before, None) is None
+
+
+def test_maintenance_passes_aware_utc_before():
+    calls = []
+    
+    class History:
+        async def refresh_rollups(self):
+            return 0
+        
+        async def purge_history(self, before):
+            calls.append(before)
+            return 0
+    
+    class Storage:
+        history = History()
+    
+    maintenance = HistoryMaintenance(lambda: Storage, retention_days=30)
+    asyncio.run(maintenance.run_once())
+    
+    assert calls[0].utcoffset() == timedelta(0)
+    assert abs(datetime.now(timezone.utc) - timedelta(days=30) - calls[0]) < timedelta(minutes=1)
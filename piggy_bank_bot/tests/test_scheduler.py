@@ -0,0 +1,70 @@
+# tests/test_scheduler.py
+import asyncio
+import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update, User
+
+from core.scheduler import UpdateScheduler
+
+
+def update(update_id: int, chat_id: int) -> Update:
+    user = User(id=chat_id, is_bot=False, first_name="Test")
+    message = Message(
+        message_id=update_id, date=datetime.datetime.now(), chat=Chat(id=chat_id, type="private"),
+        from_user=user, text=str(update_id)
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def run_updates(scheduler: UpdateScheduler, updates) -> list:
+    """Обработать обновления одновременно; журнал — (событие, update_id) по порядку"""
+    events = []
+    
+    async def scenario():
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=scheduler)
+        router = Router()
+        
+        @router.message()
+        async def handler(message: Message):
+            events.append(("start", message.message_id))
+            await asyncio.sleep(0.05)
+            events.append(("end", message.message_id))
+        
+        dp.include_router(router)
+        bot = Bot(token="123456:test")
+        try:
+            await asyncio.gather(*(dp.feed_update(bot, item) for item in updates))
+        finally:
+            await bot.session.close()
+    
+    asyncio.run(scenario())
+    return events
+
+
+def test_same_chat_in_order_other_chat_in_parallel():
+    scheduler = UpdateScheduler(max_concurrency=10)
+    
+    events = run_updates(scheduler, [update(1, chat_id=1), update(2, chat_id=1), update(3, chat_id=2)])
+    
+    position = {event: index for index, event in enumerate(events)}
+    # Обновления одного чата — по порядку и без наложения
+    assert position[("end", 1)] < position[("start", 2)]
+    # Другой чат не ждёт первый
+    assert position[("start", 3)] < position[("end", 1)]
+    # Очереди опустевших чатов удалены
+    assert scheduler._chats == {} and scheduler.active == 0
+
+
+def test_semaphore_caps_concurrency():
+    scheduler = UpdateScheduler(max_concurrency=2)
+    
+    events = run_updates(scheduler, [update(i, chat_id=i) for i in range(1, 6)])
+    
+    running = peak = 0
+    for event, _ in events:
+        running += 1 if event == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+    assert len(events) == 10